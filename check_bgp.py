@@ -6,11 +6,13 @@
 #
 
 import argparse
-import ipaddress
 import sys
-from lib.cnh_nm import STATE_OK, STATE_CRIT, STATE_WARN
-from lib.cnh_nm import my_snmp_walk, snmp_oid_decode_ip, snmpresult_to_dict
-from lib.cnh_nm import trigger_not_ok, check_if_ok
+from ipaddress import ip_address
+from lib.cnh_nm import STATE_OK, STATE_CRIT, STATE_WARN, STATE_UNKNOWN
+from lib.cnh_nm import my_snmp_get_many, my_snmp_walk, snmpresult_to_dict
+from lib.cnh_nm import snmp_oid_encode_ip, snmp_oid_decode_ip, snmp_oid_ipver
+from lib.cnh_nm import trigger_not_ok, check_if_ok, format_check_result
+from lib.cnh_nm import nagios_write_command_file, nagios_write_checkresults, snmp_perfdata
 
 
 # Argument parsing
@@ -19,15 +21,26 @@ parser.add_argument('-C', metavar='<community>', required=True,
                     help='SNMP Community')
 parser.add_argument('-H', metavar='<host>', required=True,
                     help='Host to check')
-parser.add_argument('-p', metavar='<peer>', required=True,
-                    help='Peer to check')
+peer_group = parser.add_mutually_exclusive_group(required=True)
+peer_group.add_argument('-p', metavar='<peer>', action='append',
+                        help='Peer to check, can be given multiple times')
+peer_group.add_argument('--all', action='store_true',
+                        help='Check all configured peers')
+parser.add_argument('-c', metavar='<command file>',
+                    help='Submit per-peer results as passive checks through the Nagios command file')
+parser.add_argument('-s', metavar='<directory>',
+                    help='Submit per-peer results as passive checks through the Nagios check result spool directory')
+parser.add_argument('-n', metavar='<host name>',
+                    help='Nagios host name for passive results (default: same as -H)')
+parser.add_argument('-S', metavar='<service>', default='BGP {peer}',
+                    help='Nagios service description for passive results, {peer} is replaced with the peer (default: "BGP {peer}")')
 args = parser.parse_args()
-
-# Expand IPv6
-orig_args_p = args.p
-if ':' in args.p:
-    addr = ipaddress.ip_address(unicode(args.p))
-    args.p = addr.exploded.lower()
+for peer_ip in args.p or []:
+    try:
+        ip_address(unicode(peer_ip))
+    except ValueError:
+        print "UNKNOWN: Invalid peer {}, -p takes the IP address of a peer".format(peer_ip)
+        sys.exit(STATE_UNKNOWN)
 
 
 oids = [
@@ -38,21 +51,10 @@ oids = [
 ]
 
 
-# Get all BGP peers
-rawdata = my_snmp_walk(args, oids)
-data = snmpresult_to_dict(rawdata)
-
-
-# Now loop over data, and check the states
-status = STATE_OK
-statusstr = ''
-peer_found = False
-remote_as = ""
-for index, peer in data.iteritems():
-    peer_ip = snmp_oid_decode_ip(index)
-    if peer_ip != args.p:
-        continue
-    peer_found = True
+# Check the state of a single peer, returns the status and status text for it
+def check_peer(peer_ip, peer):
+    status = STATE_OK
+    statusstr = ''
     admin_state = peer['cbgpPeer2AdminStatus'].value
     bgp_state = peer['cbgpPeer2State'].value
     last_error = peer['cbgpPeer2LastErrorTxt'].value
@@ -62,32 +64,72 @@ for index, peer in data.iteritems():
         last_error = 'None'
 
     admin_state = int(str(admin_state))
+    bgp_state = int(str(bgp_state))
     if admin_state == 1:  # Down
         status, statusstr = trigger_not_ok(
             status,
             statusstr,
             STATE_WARN,
-            "{}(AS{}) admin down".format(orig_args_p, remote_as))
-        continue
-    bgp_state = int(str(bgp_state))
-    if bgp_state in [0, 1, 2, 3, 4, 5]:  # none/idle/connect/active/opensent/openconfirm
+            "{}(AS{}) admin down".format(peer_ip, remote_as))
+    elif bgp_state in [0, 1, 2, 3, 4, 5]:  # none/idle/connect/active/opensent/openconfirm
         status, statusstr = trigger_not_ok(
             status,
             statusstr,
             STATE_CRIT,
-            "{}(AS{}) BGP session down".format(orig_args_p, remote_as))
+            "{}(AS{}) BGP session down".format(peer_ip, remote_as))
+    else:
+        statusstr = "BGP session with {}(AS{}) established, last error: {}".format(peer_ip, remote_as, last_error)
+    return status, statusstr.rstrip(',')
+
+
+# Single peer, get the row of the peer directly. The table is indexed on
+# cbgpPeer2Type.cbgpPeer2RemoteAddr so we don't have to walk it
+if not args.all and len(args.p) == 1 and not args.c and not args.s:
+    peer_ip = args.p[0]
+    peer_index = snmp_oid_encode_ip(peer_ip)
+    rawdata = my_snmp_get_many(args, ["{}.{}".format(oid, peer_index) for oid in oids])
+    peer = dict((oid.split('::', 1)[1], rawdata["{}.{}".format(oid, peer_index)]) for oid in oids)
+    if any('NOSUCH' in var.snmp_type for var in peer.itervalues()):
+        print "CRITICAL: BGP session for peer {} not found!".format(peer_ip) + snmp_perfdata()
+        sys.exit(STATE_CRIT)
+    status, statusstr = check_peer(peer_ip, peer)
+    print format_check_result(status, statusstr) + snmp_perfdata()
+    sys.exit(status)
+
+
+# Several or all peers, evaluated from a single walk of the peer table
+rawdata = my_snmp_walk(args, oids)
+data = snmpresult_to_dict(rawdata)
+peers = {}
+for index, peer in data.iteritems():
+    if not snmp_oid_ipver(index):
         continue
-    statusstr = last_error
-if not peer_found:
-    status, statusstr = trigger_not_ok(
-        status,
-        statusstr,
-        STATE_CRIT,
-        "BGP session for peer {} not found!".format(orig_args_p))
+    peers[ip_address(unicode(snmp_oid_decode_ip(index))).compressed] = peer
+if args.all:
+    wanted_peers = sorted(peers)
+else:
+    wanted_peers = [ip_address(unicode(p)).compressed for p in args.p]
+
+status = STATE_OK
+statusstr = ''
+results = []
+for peer_ip in wanted_peers:
+    if peer_ip not in peers:
+        peer_status, peer_statusstr = STATE_CRIT, "BGP session for peer {} not found!".format(peer_ip)
+    else:
+        peer_status, peer_statusstr = check_peer(peer_ip, peers[peer_ip])
+    results.append((args.n or args.H, args.S.format(peer=peer_ip), peer_status, format_check_result(peer_status, peer_statusstr)))
+    if peer_status != STATE_OK:
+        status, statusstr = trigger_not_ok(status, statusstr, peer_status, peer_statusstr)
+
+if args.c:
+    nagios_write_command_file(results, args.c)
+if args.s:
+    nagios_write_checkresults(results, args.s)
 
 
-# All checks completed, exiting with the relevant message
+# All checks completed, exiting with the relevant summary
 check_if_ok(status, statusstr)
 
-print "OK: BGP session with {}(AS{}) established, last error: {}".format(orig_args_p, remote_as, statusstr)
+print "OK: {} BGP sessions established".format(len(results)) + snmp_perfdata()
 sys.exit(STATE_OK)
@@ -9,7 +9,7 @@ import sys
 import argparse
 from lib.cnh_nm import STATE_OK, STATE_CRIT, STATE_WARN
 from lib.cnh_nm import my_snmp_walk, snmpresult_to_dict
-from lib.cnh_nm import check_if_ok, my_snmp_get
+from lib.cnh_nm import check_if_ok, my_snmp_get, snmp_perfdata
 
 
 # Argument parsing
@@ -50,5 +50,5 @@ if float(data['ccmHistoryStartupLastChanged'].value) < float(data['ccmHistoryRun
 # All checks completed, exiting with the relevant message
 check_if_ok(status, statusstr)
 
-print "OK: Configuration was properly saved after editing, last touched by {}".format(culprit)
+print "OK: Configuration was properly saved after editing, last touched by {}".format(culprit) + snmp_perfdata()
 sys.exit(STATE_OK)
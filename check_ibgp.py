@@ -9,7 +9,7 @@ import sys
 import argparse
 from lib.cnh_nm import STATE_OK, STATE_WARN, STATE_CRIT
 from lib.cnh_nm import my_snmp_get, snmpresult_to_dict, my_snmp_walk, snmp_oid_decode_ip
-from lib.cnh_nm import trigger_not_ok, check_if_ok
+from lib.cnh_nm import trigger_not_ok, check_if_ok, snmp_perfdata
 
 
 # Argument parsing
@@ -69,5 +69,5 @@ for index, peer in data.iteritems():
 # All checks completed, exiting with the relevant message
 check_if_ok(status, statusstr)
 
-print "OK: All ({}) iBGP sessions established".format(num_ibgp)
+print "OK: All ({}) iBGP sessions established".format(num_ibgp) + snmp_perfdata()
 sys.exit(STATE_OK)
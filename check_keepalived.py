@@ -8,7 +8,9 @@
 import sys
 import argparse
 from lib.cnh_nm import STATE_OK, STATE_CRIT, STATE_WARN, trigger_not_ok, check_if_ok
-from lib.cnh_nm import my_snmp_walk, my_snmp_get, snmpresult_to_dict
+from lib.cnh_nm import snmp_err, snmpresult_to_dict, snmp_perfdata, EasySNMPConnectionError, SnmpDeadlineExceeded
+from lib.cnh_nm import get_snmp_engine, snmp_engine_get, snmp_engine_bulkwalk, snmp_engine_run
+from lib.snmp_engine import SnmpEngineError
 
 
 # Argument parsing
@@ -21,7 +23,7 @@ args = parser.parse_args()
 hosts = args.H[0]
 
 
-# OIDs
+# OIDs, all hosts are polled concurrently through lib.snmp_engine
 oid_routerid = 'KEEPALIVED-MIB::routerId.0'
 oids_syncgroups = [
     'KEEPALIVED-MIB::vrrpSyncGroupName',
@@ -46,21 +48,40 @@ vrrp_state_mapper = {
 }
 
 
+# Poll all hosts concurrently
+engine = get_snmp_engine()
+requests = {}
+for host in hosts:
+    requests[host] = (
+        snmp_engine_get(engine, args, host, oid_routerid),
+        snmp_engine_bulkwalk(engine, args, host, oids_syncgroups),
+        snmp_engine_bulkwalk(engine, args, host, oids_instances)
+    )
+try:
+    completed = snmp_engine_run(engine)
+except EasySNMPConnectionError as err:
+    snmp_err(err)
+if not completed:
+    snmp_err(SnmpDeadlineExceeded("not all of {} hosts answered".format(len(hosts))))
+
+
 # Get data and shuffle into these dict's in a way that we can iterate them nicely
 syncgroups_states = {}
 states = {}
 preempt = {}
 for host in hosts:
-    snmp_args = type('lambdaobject', (object,), {'H': host, 'C': args.C})()
-    router_id = my_snmp_get(snmp_args, oid_routerid).value
+    for request in requests[host]:
+        if request.error:
+            snmp_err(SnmpEngineError(request.error))
+    router_id = requests[host][0].result[0].value
     if router_id not in states:
         states[router_id] = {}
     if router_id not in preempt:
         preempt[router_id] = {}
     if router_id not in syncgroups_states:
         syncgroups_states[router_id] = {}
-    raw_syncgroups = my_snmp_walk(snmp_args, oids_syncgroups)
-    raw_instances = my_snmp_walk(snmp_args, oids_instances)
+    raw_syncgroups = requests[host][1].result
+    raw_instances = requests[host][2].result
     syncgroups = snmpresult_to_dict(raw_syncgroups)
     instances = snmpresult_to_dict(raw_instances)
     for syncgroup_id, syncgroup in syncgroups.iteritems():
@@ -151,5 +172,5 @@ if num_backups < 1:
 
 # All done, exiting
 check_if_ok(status, statusstr)
-print "OK: {} masters ({}) and {} backups with no inconsistencies.".format(num_masters, ",".join(masters), num_backups)
+print "OK: {} masters ({}) and {} backups with no inconsistencies.".format(num_masters, ",".join(masters), num_backups) + snmp_perfdata()
 sys.exit(STATE_OK)
@@ -9,7 +9,7 @@ import sys
 import argparse
 from lib.cnh_nm import STATE_OK, STATE_CRIT, STATE_WARN
 from lib.cnh_nm import my_snmp_walk, snmpresult_to_dict
-from lib.cnh_nm import trigger_not_ok, check_if_ok
+from lib.cnh_nm import trigger_not_ok, check_if_ok, snmp_perfdata
 
 
 # Defaults
@@ -123,5 +123,5 @@ for index, vc in data.iteritems():
 # All checks completed, exiting with the relevant message
 check_if_ok(status, statusstr)
 
-print "OK: All ({}) VPLS/EoMPLS VC's are up and running".format(num_vc)
+print "OK: All ({}) VPLS/EoMPLS VC's are up and running".format(num_vc) + snmp_perfdata()
 sys.exit(STATE_OK)
@@ -8,7 +8,7 @@
 import sys
 import argparse
 from lib.cnh_nm import STATE_OK, STATE_CRIT
-from lib.cnh_nm import my_snmp_get
+from lib.cnh_nm import my_snmp_get, snmp_perfdata
 
 # OSPF states:
 # 1=down, 2=attempt, 3=init, 4=twoway
@@ -31,15 +31,15 @@ args = parser.parse_args()
 # Get all interfaces, and then get OSPF data for that interface
 rawdata = my_snmp_get(args, 'OSPF-MIB::ospfNbrState.{}.0'.format(args.p))
 if not rawdata or 'NOSUCH' in rawdata.value:
-    print "CRITICAL: No OSPF session detected for peer {}".format(args.p)
+    print "CRITICAL: No OSPF session detected for peer {}".format(args.p) + snmp_perfdata()
     sys.exit(STATE_CRIT)
 
 
 nei_state = int(str(rawdata.value))
 if nei_state not in ospf_ok_states:
-    print "CRITICAL: OSPF session for peer {} down".format(args.p)
+    print "CRITICAL: OSPF session for peer {} down".format(args.p) + snmp_perfdata()
     sys.exit(STATE_CRIT)
 
 
-print "OK: OSPF session for {} is up".format(args.p)
+print "OK: OSPF session for {} is up".format(args.p) + snmp_perfdata()
 sys.exit(STATE_OK)
@@ -9,7 +9,7 @@ import sys
 import argparse
 from lib.cnh_nm import STATE_OK, STATE_CRIT
 from lib.cnh_nm import my_snmp_walk
-from lib.cnh_nm import trigger_not_ok, check_if_ok
+from lib.cnh_nm import trigger_not_ok, check_if_ok, snmp_perfdata
 
 
 # Vars
@@ -44,7 +44,7 @@ for obj in rawdata:
     if str(obj.value) == args.i:
         interface = obj
 if not interface:
-    print "CRITICAL: Interface {} not found!".format(args.i)
+    print "CRITICAL: Interface {} not found!".format(args.i) + snmp_perfdata()
     sys.exit(STATE_CRIT)
 rawdata = my_snmp_walk(args, 'OSPFV3-MIB::ospfv3NbrState.{}'.format(interface.oid_index))
 
@@ -75,5 +75,5 @@ if num_neis < 1:
 # Check status
 check_if_ok(status, statusstr)
 
-print "OK: All {} neighbours on interface {} is up".format(num_neis, args.i)
+print "OK: All {} neighbours on interface {} is up".format(num_neis, args.i) + snmp_perfdata()
 sys.exit(STATE_OK)
@@ -11,7 +11,7 @@ from time import time
 from lib.cnh_nm import STATE_OK, STATE_CRIT, STATE_WARN, STATE_UNKNOWN
 from lib.cnh_nm import my_snmp_get, my_snmp_walk, snmpresult_to_dict
 from lib.cnh_nm import parse_snmp_datetime, strtime_to_timestamp
-from lib.cnh_nm import trigger_not_ok, check_if_ok
+from lib.cnh_nm import trigger_not_ok, check_if_ok, check_if_complete, set_snmp_deadline, snmp_walk_partial, snmp_perfdata
 
 
 # Defaults
@@ -27,7 +27,11 @@ parser.add_argument('-C', metavar='<community>', required=True,
                     help='SNMP Community')
 parser.add_argument('-H', metavar='<host>', required=True,
                     help='Host to check')
+parser.add_argument('-t', metavar='<seconds>', type=float,
+                    help='Deadline, report what has been checked so far when it is reached')
 args = parser.parse_args()
+if args.t:
+    set_snmp_deadline(args.t)
 
 
 # Get all VSS info and check whether the device is actually capable of VSS and have it enabled
@@ -48,13 +52,14 @@ oids_switch = [
 cvsSwitchCapability = my_snmp_get(args, oids_switch[0])
 cvsSwitchMode = my_snmp_get(args, oids_switch[1])
 if cvsSwitchCapability.value != u'\xc0' and cvsSwitchCapability.value != u'\x80':
-    print "UNKNOWN: Switch is not VSS capable!"
+    print "UNKNOWN: Switch is not VSS capable!" + snmp_perfdata()
     sys.exit(STATE_UNKNOWN)
 if cvsSwitchMode.value != u'2':
-    print "OK: Switch is VSS capable, but isn't running in VSS mode"
+    print "OK: Switch is VSS capable, but isn't running in VSS mode" + snmp_perfdata()
     sys.exit(STATE_OK)
-rawdata_chassis = my_snmp_walk(args, oids_chassis)
-rawdata_VSL = my_snmp_walk(args, oids_VSL)
+# When the deadline cuts the walks short the rows walked so far are checked
+rawdata_chassis = my_snmp_walk(args, oids_chassis, partial=True)
+rawdata_VSL = my_snmp_walk(args, oids_VSL, partial=True)
 
 
 # Sort the walked data into a nicer format
@@ -62,41 +67,59 @@ chassis = snmpresult_to_dict(rawdata_chassis)
 VSL = snmpresult_to_dict(rawdata_VSL)
 
 
+# Value of a column in a row, None when the walk was cut short before it got there
+def column_value(row, column, convert=None):
+    if column not in row:
+        return None
+    if convert is None:
+        return row[column].value
+    return convert(row[column].value)
+
+
+def uptime_seconds(value):
+    return float(int(str(value))) * 0.01
+
+
+def statechange_timestamp(value):
+    return strtime_to_timestamp(parse_snmp_datetime(value))
+
+
 # A valid and healthy VSS cluster is always 2 members
-if len(chassis) < 2:
-    print "CRITICAL: Only one chassis found, possible cluster member outage!"
+if len(chassis) < 2 and not snmp_walk_partial():
+    print "CRITICAL: Only one chassis found, possible cluster member outage!" + snmp_perfdata()
     sys.exit(STATE_CRIT)
 
-chassis1 = chassis[list(chassis.keys())[0]]
-chassis2 = chassis[list(chassis.keys())[1]]
+chassis1, chassis2 = ([chassis[index] for index in chassis.keys()] + [{}, {}])[:2]
 
 
 # We want to catch: standby/standby active/active and whether either are in standalone
 # Critting immediately here as all of this are much more critical than all other checks
-if chassis1['cvsChassisRole'].value == chassis2['cvsChassisRole'].value:
-    if chassis1['cvsChassisRole'].value == u'1':
-        print "CRITICAL: Both VSS members are in standalone role? Shouldn't be possible.."
+chassis1_role = column_value(chassis1, 'cvsChassisRole')
+chassis2_role = column_value(chassis2, 'cvsChassisRole')
+if chassis1_role is not None and chassis1_role == chassis2_role:
+    if chassis1_role == u'1':
+        print "CRITICAL: Both VSS members are in standalone role? Shouldn't be possible.." + snmp_perfdata()
         sys.exit(STATE_CRIT)
-    if chassis1['cvsChassisRole'].value == u'2':
-        print "CRITICAL: Both VSS members are in active role!"
+    if chassis1_role == u'2':
+        print "CRITICAL: Both VSS members are in active role!" + snmp_perfdata()
         sys.exit(STATE_CRIT)
-    if chassis1['cvsChassisRole'].value == u'3':
-        print "CRITICAL: Both VSS members are in standby role!"
+    if chassis1_role == u'3':
+        print "CRITICAL: Both VSS members are in standby role!" + snmp_perfdata()
         sys.exit(STATE_CRIT)
-if chassis1['cvsChassisRole'].value == u'1':
-    print "CRITICAL: VSS Chassis 1 is in standalone mode!"
+if chassis1_role == u'1':
+    print "CRITICAL: VSS Chassis 1 is in standalone mode!" + snmp_perfdata()
     sys.exit(STATE_CRIT)
-if chassis2['cvsChassisRole'].value == u'1':
-    print "CRITICAL: VSS Chassis 2 is in standalone mode!"
+if chassis2_role == u'1':
+    print "CRITICAL: VSS Chassis 2 is in standalone mode!" + snmp_perfdata()
     sys.exit(STATE_CRIT)
 
 
 # Chassis uptime is an indicator of recent VSS member failure
 status = STATE_OK
 statusstr = ""
-chassis1_tt = float(int(str(chassis1['cvsChassisUpTime'].value))) * 0.01
-chassis2_tt = float(int(str(chassis1['cvsChassisUpTime'].value))) * 0.01
-if chassis1_tt < vss_uptime_warn:
+chassis1_tt = column_value(chassis1, 'cvsChassisUpTime', uptime_seconds)
+chassis2_tt = column_value(chassis1, 'cvsChassisUpTime', uptime_seconds)
+if chassis1_tt is not None and chassis1_tt < vss_uptime_warn:
     chassis1_str = "Chassis 1 uptime {} seconds".format(int(chassis1_tt))
     if chassis1_tt < vss_uptime_crit:
         status, statusstr = trigger_not_ok(
@@ -110,7 +133,7 @@ if chassis1_tt < vss_uptime_warn:
             statusstr,
             STATE_WARN,
             chassis1_str)
-if chassis2_tt < vss_uptime_warn:
+if chassis2_tt is not None and chassis2_tt < vss_uptime_warn:
     chassis2_str = "Chassis 2 uptime {} seconds".format(int(chassis2_tt))
     if chassis2_tt < vss_uptime_crit:
         status, statusstr = trigger_not_ok(
@@ -128,20 +151,19 @@ check_if_ok(status, statusstr)
 
 
 # Getting VSL info per chassis
-chassis1_vsl = VSL[list(VSL.keys())[0]]
-chassis2_vsl = VSL[list(VSL.keys())[1]]
+chassis1_vsl, chassis2_vsl = ([VSL[index] for index in VSL.keys()] + [{}, {}])[:2]
 
 
 # Operational status on VSL connection
 status = STATE_OK
 statusstr = ""
-if chassis1_vsl['cvsVSLConnectOperStatus'].value != u'1':
+if column_value(chassis1_vsl, 'cvsVSLConnectOperStatus') not in (None, u'1'):
     status, statusstr = trigger_not_ok(
         status,
         statusstr,
         STATE_CRIT,
         "Chassis 1 VSL ports down")
-if chassis2_vsl['cvsVSLConnectOperStatus'].value != u'1':
+if column_value(chassis2_vsl, 'cvsVSLConnectOperStatus') not in (None, u'1'):
     status, statusstr = trigger_not_ok(
         status,
         statusstr,
@@ -153,15 +175,17 @@ check_if_ok(status, statusstr)
 # Checking that all VSL ports is operational
 status = STATE_OK
 statusstr = ""
-if chassis1_vsl['cvsVSLConfiguredPortCount'].value != chassis1_vsl['cvsVSLOperationalPortCount'].value:
-    ports_down = int(chassis1_vsl['cvsVSLConfiguredPortCount'].value) - int(chassis1_vsl['cvsVSLOperationalPortCount'].value)
+chassis1_ports = column_value(chassis1_vsl, 'cvsVSLConfiguredPortCount'), column_value(chassis1_vsl, 'cvsVSLOperationalPortCount')
+if None not in chassis1_ports and chassis1_ports[0] != chassis1_ports[1]:
+    ports_down = int(chassis1_ports[0]) - int(chassis1_ports[1])
     status, statusstr = trigger_not_ok(
         status,
         statusstr,
         STATE_CRIT,
         "{} VSL ports down on Chassis 1".format(ports_down))
-if chassis2_vsl['cvsVSLConfiguredPortCount'].value != chassis2_vsl['cvsVSLOperationalPortCount'].value:
-    ports_down = int(chassis2_vsl['cvsVSLConfiguredPortCount'].value) - int(chassis2_vsl['cvsVSLOperationalPortCount'].value)
+chassis2_ports = column_value(chassis2_vsl, 'cvsVSLConfiguredPortCount'), column_value(chassis2_vsl, 'cvsVSLOperationalPortCount')
+if None not in chassis2_ports and chassis2_ports[0] != chassis2_ports[1]:
+    ports_down = int(chassis2_ports[0]) - int(chassis2_ports[1])
     status, statusstr = trigger_not_ok(
         status,
         statusstr,
@@ -173,13 +197,11 @@ check_if_ok(status, statusstr)
 # Check last VSL state change
 status = STATE_OK
 statusstr = ""
-chassis1_dt = parse_snmp_datetime(chassis1_vsl['cvsVSLLastConnectionStateChange'].value)
-chassis2_dt = parse_snmp_datetime(chassis1_vsl['cvsVSLLastConnectionStateChange'].value)
-chassis1_ts = strtime_to_timestamp(chassis1_dt)
-chassis2_ts = strtime_to_timestamp(chassis2_dt)
+chassis1_ts = column_value(chassis1_vsl, 'cvsVSLLastConnectionStateChange', statechange_timestamp)
+chassis2_ts = column_value(chassis1_vsl, 'cvsVSLLastConnectionStateChange', statechange_timestamp)
 cur_time = int(time())
 
-if (cur_time - chassis1_ts) < vsl_statechange_warn:
+if chassis1_ts is not None and (cur_time - chassis1_ts) < vsl_statechange_warn:
     chassis1_str = "Chassis 1 VSL statechange {} seconds ago".format(cur_time - chassis1_ts)
     if (cur_time - chassis1_ts) < vsl_statechange_crit:
         status, statusstr = trigger_not_ok(
@@ -193,7 +215,7 @@ if (cur_time - chassis1_ts) < vsl_statechange_warn:
             statusstr,
             STATE_WARN,
             chassis1_str)
-if (cur_time - chassis2_ts) < vsl_statechange_warn:
+if chassis2_ts is not None and (cur_time - chassis2_ts) < vsl_statechange_warn:
     chassis2_str = "Chassis 2 VSL statechange {} seconds ago".format(cur_time - chassis2_ts)
     if (cur_time - chassis2_ts) < vsl_statechange_crit:
         status, statusstr = trigger_not_ok(
@@ -211,6 +233,7 @@ if (cur_time - chassis2_ts) < vsl_statechange_warn:
 
 # Check status and exit accordingly
 check_if_ok(status, statusstr)
+check_if_complete()
 
-print "OK: VSS and VSL status is healthy"
+print "OK: VSS and VSL status is healthy" + snmp_perfdata()
 sys.exit(STATE_OK)
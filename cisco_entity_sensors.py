@@ -8,8 +8,8 @@
 import sys
 import argparse
 from lib.cnh_nm import STATE_OK, STATE_CRIT, STATE_WARN
-from lib.cnh_nm import my_snmp_get, my_snmp_walk, snmpresult_to_dict
-from lib.cnh_nm import trigger_not_ok, check_if_ok
+from lib.cnh_nm import my_snmp_walk, snmpresult_to_table
+from lib.cnh_nm import trigger_not_ok, check_if_ok, check_if_complete, set_snmp_deadline, snmp_walk_partial, snmp_perfdata
 
 
 # Argument parsing
@@ -18,29 +18,47 @@ parser.add_argument('-C', metavar='<community>', required=True,
                     help='SNMP Community')
 parser.add_argument('-H', metavar='<host>', required=True,
                     help='Host to check')
+parser.add_argument('-t', metavar='<seconds>', type=float,
+                    help='Deadline, report what has been checked so far when it is reached')
 args = parser.parse_args()
+if args.t:
+    set_snmp_deadline(args.t)
 
 
+# The power and sensor status columns only have rows for the entities they apply
+# to, they are walked once and looked up by entity index. They are walked first,
+# so when the deadline cuts the walks short the rows walked so far are checked.
+status_oids = [
+    'CISCO-ENTITY-FRU-CONTROL-MIB::cefcFRUPowerAdminStatus',
+    'CISCO-ENTITY-FRU-CONTROL-MIB::cefcFRUPowerOperStatus',
+    'CISCO-ENTITY-SENSOR-MIB::entSensorStatus'
+]
+status_data = snmpresult_to_table(my_snmp_walk(args, status_oids, partial=True))
+
 # Get all environmental modules and put in a nicely ordered dict
-rawdata = my_snmp_walk(args, 'ENTITY-MIB::entPhysicalTable')
-data = snmpresult_to_dict(rawdata)
+data = snmpresult_to_table(my_snmp_walk(args, 'ENTITY-MIB::entPhysicalTable', partial=True))
+indexes = list(data)
+if snmp_walk_partial():
+    # Status rows of entities the walk of the entity table didn't get to
+    indexes += [index for index in status_data if index not in data]
 
 
 # Now we loop over the data and perform poweradmin/poweroper/sensorstatus checks
 status = STATE_OK
 statusstr = ''
-for index in data:
-    descr = data[index]['entPhysicalDescr'].value
+for index in indexes:
+    descr = data.get(index, 'entPhysicalDescr')
+    if descr is None:
+        descr = "entity {0}".format(index)
 
     # First off we'll try getting some Power status for those that support it
     # 1/on - Admin power on
     # 2/off - Admin power off
     # 3/inlineAuto,4/inlineOn,5/powerCycle - PoE stuff, irrelevant for us so not much caring here
     # cefcFRUPowerAdminStatus - 1=on, 2=off, 3=inlineAuto, 4=inlineOn, 5=powerCycle
-    pwr_adminstatus = my_snmp_get(args, "CISCO-ENTITY-FRU-CONTROL-MIB::cefcFRUPowerAdminStatus.{0}".format(index))
-    if 'NOSUCHINSTANCE' not in pwr_adminstatus.value:
-        pwr_adminstatus.value = int(str(pwr_adminstatus.value))
-        if pwr_adminstatus.value == 1:
+    pwr_adminstatus = status_data.get(index, 'cefcFRUPowerAdminStatus', int)
+    if pwr_adminstatus is not None:
+        if pwr_adminstatus == 1:
             pass  # ok
         elif pwr_adminstatus == 2:
             status, statusstr = trigger_not_ok(status, statusstr, STATE_WARN, "PowerAdminStatus Off for {0}".format(descr))
@@ -63,48 +81,49 @@ for index in data:
     # 9/onButFanFail - FRU is on but has fan failures
     # 10/offCooling - FRU is off and cooling
     # 11/offConnectorRating - FRU is off because of connector rating problems
-    pwr_operstatus = my_snmp_get(args, "CISCO-ENTITY-FRU-CONTROL-MIB::cefcFRUPowerOperStatus.{0}".format(index))
-    if 'NOSUCHINSTANCE' not in pwr_operstatus.value:
-        pwr_operstatus.value = int(str(pwr_operstatus.value))
-        if pwr_operstatus.value == 1:
+    pwr_operstatus = status_data.get(index, 'cefcFRUPowerOperStatus', int)
+    if pwr_operstatus is not None:
+        if pwr_operstatus == 1:
             status, statusstr = trigger_not_ok(status, statusstr, STATE_CRIT, "PowerOperStatus off due to unknown problems for {0}".format(descr))
-        if pwr_operstatus.value == 2:
+        if pwr_operstatus == 2:
             pass  # ok
-        if pwr_operstatus.value == 3:
+        if pwr_operstatus == 3:
             status, statusstr = trigger_not_ok(status, statusstr, STATE_WARN, "PowerOperStatus Admin off for {0}".format(descr))
-        if pwr_operstatus.value == 4:
+        if pwr_operstatus == 4:
             status, statusstr = trigger_not_ok(status, statusstr, STATE_CRIT, "PowerOperStatus off due to insufficient system power for {0}".format(descr))
-        if pwr_operstatus.value == 5:
+        if pwr_operstatus == 5:
             status, statusstr = trigger_not_ok(status, statusstr, STATE_CRIT, "PowerOperStatus off due to power issues for {0}".format(descr))
-        if pwr_operstatus.value == 6:
+        if pwr_operstatus == 6:
             status, statusstr = trigger_not_ok(status, statusstr, STATE_CRIT, "PowerOperStatus off due to temperature issues for {0}".format(descr))
-        if pwr_operstatus.value == 7:
+        if pwr_operstatus == 7:
             status, statusstr = trigger_not_ok(status, statusstr, STATE_CRIT, "PowerOperStatus off due to fan issues for {0}".format(descr))
-        if pwr_operstatus.value == 8:
+        if pwr_operstatus == 8:
             status, statusstr = trigger_not_ok(status, statusstr, STATE_CRIT, "PowerOperStatus off because of failure for {0}".format(descr))
-        if pwr_operstatus.value == 9:
+        if pwr_operstatus == 9:
             status, statusstr = trigger_not_ok(status, statusstr, STATE_WARN, "PowerOperStatus on but fan has failed for {0}".format(descr))
-        if pwr_operstatus.value == 10:
+        if pwr_operstatus == 10:
             status, statusstr = trigger_not_ok(status, statusstr, STATE_CRIT, "PowerOperStatus off/cooling for {0}".format(descr))
-        if pwr_operstatus.value == 11:
+        if pwr_operstatus == 11:
             status, statusstr = trigger_not_ok(status, statusstr, STATE_CRIT, "PowerOperStatus off due to connector ratings for {0}".format(descr))
 
     # entSensorStatus
     # 1=ok, 2=unavailable, 3=nonoperational
-    sensorstatus = my_snmp_get(args, "CISCO-ENTITY-SENSOR-MIB::entSensorStatus.{0}".format(index))
-    if 'NOSUCHINSTANCE' not in sensorstatus.value:
-        sensorstatus.value = int(str(sensorstatus.value))
-        if sensorstatus.value == 1:
+    sensorstatus = status_data.get(index, 'entSensorStatus', int)
+    if sensorstatus is not None:
+        if sensorstatus == 1:
             pass  # ok
-        elif sensorstatus.value == 2 and 'transceiver' in descr.lower():
+        elif sensorstatus == 2 and 'transceiver' in descr.lower():
             pass  # Also ok, because all transceivers are not equipped with that
-        elif sensorstatus.value == 2:
+        elif sensorstatus == 2 and index not in data:
+            pass  # Can't tell whether it is a transceiver
+        elif sensorstatus == 2:
             status, statusstr = trigger_not_ok(status, statusstr, STATE_WARN, " Unavailable sensor status for {0}".format(descr))
-        elif sensorstatus.value == 3:
+        elif sensorstatus == 3:
             status, statusstr = trigger_not_ok(status, statusstr, STATE_CRIT, " Nonoperational sensor status for {0}".format(descr))
 
 # All checks completed, exiting with the relevant message
 check_if_ok(status, statusstr)
+check_if_complete()
 
-print "OK: All environmental checks ok"
+print "OK: All environmental checks ok" + snmp_perfdata()
 sys.exit(STATE_OK)
@@ -9,8 +9,8 @@ import argparse
 import re
 import sys
 from lib.cnh_nm import STATE_OK, STATE_CRIT, STATE_WARN
-from lib.cnh_nm import trigger_not_ok, check_if_ok, my_snmp_walk, my_snmp_get
-from lib.cnh_nm import snmpresult_to_dict
+from lib.cnh_nm import trigger_not_ok, check_if_ok, my_snmp_walk, my_snmp_get_many
+from lib.cnh_nm import snmpresult_to_dict, snmp_perfdata
 
 # Argument parsing
 parser = argparse.ArgumentParser(description='Check VPC status for NXOS switches')
@@ -46,7 +46,7 @@ statusstr = ""
 # Check VPC general status and the status of peer-links
 rawdata = my_snmp_walk(args, oids)
 if not rawdata:
-    print "OK: Switch does not implement Cisco VPC, or does not have it enabled."
+    print "OK: Switch does not implement Cisco VPC, or does not have it enabled." + snmp_perfdata()
     sys.exit(STATE_OK)
 data = snmpresult_to_dict(rawdata)
 vpc_domain_ids = []
@@ -118,9 +118,10 @@ for rd in rawdata:  # Filter out the VPC Domain, doesn't matter here
     rd.oid_index = regex.sub('', rd.oid_index)
     temp.append(rd)
 data = snmpresult_to_dict(rawdata)
+ifnames = my_snmp_get_many(args, [oid_t_ifmib_ifname.format(hl['cVpcStatusHostLinkIfIndex'].value) for hl in data.itervalues()])
 for host_link in data:
     hl_data = data[host_link]
-    snmp_ifname = my_snmp_get(args, oid_t_ifmib_ifname.format(hl_data['cVpcStatusHostLinkIfIndex'].value))
+    snmp_ifname = ifnames[oid_t_ifmib_ifname.format(hl_data['cVpcStatusHostLinkIfIndex'].value)]
 
     # 1 = down, 2 = downStar (forwarding via VPC host-link), 3 = up
     hl_status = int(hl_data['cVpcStatusHostLinkStatus'].value)
@@ -151,5 +152,5 @@ for host_link in data:
 
 check_if_ok(status, statusstr)
 
-print "OK: VPC Status, Peer-Link status is OK"
+print "OK: VPC Status, Peer-Link status is OK" + snmp_perfdata()
 sys.exit(STATE_OK)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+#
+# @descr    Thin client for cnh_nm_daemon.py, takes the same arguments and gives the
+#           same output and exit codes as running the check directly
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# Usage: cnh_nm_client.py <check> [<args>] ...
+#    or: symlink the check name to this script, e.g. check_bgp.py -> cnh_nm_client.py
+#
+# Falls back to running the check in a new process if the daemon isn't running.
+#
+
+import json
+import os
+import socket
+import sys
+
+STATE_UNKNOWN = 3
+basedir = os.path.dirname(os.path.realpath(__file__))
+socket_path = os.environ.get('CNH_NM_DAEMON_SOCKET', '/var/run/cnh_nm/daemon.sock')
+
+
+script = os.path.basename(sys.argv[0])
+argv = sys.argv[1:]
+if script == 'cnh_nm_client.py':
+    if not argv:
+        print "Usage: {} <check> [<args>] ...".format(sys.argv[0])
+        sys.exit(STATE_UNKNOWN)
+    script = argv.pop(0)
+
+
+try:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path)
+except socket.error:
+    path = os.path.join(basedir, script)
+    os.execv(sys.executable, [sys.executable, path] + argv)
+
+# The daemon runs the check with our CNH_NM_* settings and working directory
+environ = dict((name, value) for name, value in os.environ.iteritems() if name.startswith('CNH_NM_'))
+sock.sendall(json.dumps({'script': script, 'argv': argv, 'env': environ, 'cwd': os.getcwd()}) + "\n")
+response = sock.makefile('r').readline()
+if not response:
+    print "UNKNOWN: Check daemon closed the connection (timeout?)"
+    sys.exit(STATE_UNKNOWN)
+response = json.loads(response)
+sys.stdout.write(response['stdout'].encode('utf-8'))
+sys.stderr.write(response['stderr'].encode('utf-8'))
+sys.exit(response['code'])
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+#
+# @descr    Resident check daemon, runs the check scripts without paying interpreter,
+#           net-snmp and MIB loading startup costs for every check
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# The daemon preloads lib.cnh_nm, initializes net-snmp (which loads all MIBs) and
+# compiles every check script once. Each request is then served by a forked child
+# running the precompiled script, so checks can't affect each other or the daemon.
+# Use cnh_nm_client.py to run checks through it.
+#
+
+import argparse
+import atexit
+import errno
+import json
+import os
+import signal
+import socket
+import sys
+from glob import glob
+from StringIO import StringIO
+
+basedir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, basedir)
+
+# Profile the checks, not the daemon
+profile_mode = os.environ.pop('CNH_NM_PROFILE', '').lower()
+
+from easysnmp import Session  # noqa
+from lib import cnh_nm  # noqa
+
+
+# Argument parsing
+parser = argparse.ArgumentParser(description='Resident daemon serving network monitoring checks')
+parser.add_argument('-s', metavar='<socket>', default=os.environ.get('CNH_NM_DAEMON_SOCKET', '/var/run/cnh_nm/daemon.sock'),
+                    help='Unix socket to listen on')
+parser.add_argument('-t', metavar='<seconds>', type=int, default=60,
+                    help='Kill checks running longer than this')
+args = parser.parse_args()
+
+
+# Compile all check scripts once, keyed by their file name
+def compile_checks():
+    checks = {}
+    for path in glob(os.path.join(basedir, '*.py')) + glob(os.path.join(basedir, 'graphite', '*.py')):
+        name = os.path.relpath(path, basedir)
+        if name in ('setup.py', 'cnh_nm_daemon.py', 'cnh_nm_client.py'):
+            continue
+        with open(path) as f:
+            checks[name] = (path, compile(f.read(), path, 'exec'))
+    return checks
+
+
+# Output of a check as bytes, as if it was written to a pipe
+class OutputBuffer(StringIO):
+
+    def write(self, s):
+        if isinstance(s, unicode):
+            s = s.encode('utf-8')
+        StringIO.write(self, s)
+
+
+# Run a check in the current (forked) process, returns (exit code, stdout, stderr)
+def run_check(path, code, argv):
+    stdout = OutputBuffer()
+    stderr = OutputBuffer()
+    sys.stdout, sys.stderr = stdout, stderr
+    sys.argv = [path] + argv
+    exit_code = cnh_nm.STATE_OK
+    try:
+        exec code in {'__name__': '__main__', '__file__': path}
+    except SystemExit as err:
+        if err.code is None:
+            exit_code = cnh_nm.STATE_OK
+        elif isinstance(err.code, int):
+            exit_code = err.code
+        else:
+            stdout.write("{}\n".format(err.code))
+            exit_code = cnh_nm.STATE_UNKNOWN
+    except Exception as err:
+        stdout.write("UNKNOWN: Check failed: {}\n".format(err))
+        exit_code = cnh_nm.STATE_UNKNOWN
+    finally:
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+    return exit_code, stdout.getvalue(), stderr.getvalue()
+
+
+# Apply the CNH_NM_* environment and working directory the client runs the check
+# with, so per-check settings from Nagios apply like they do when running it directly
+def apply_client_environment(request):
+    environ = dict((str(name), str(value)) for name, value in request.get('env', {}).iteritems()
+                   if name.startswith('CNH_NM_'))
+    cnh_nm.snmp_apply_environment(environ)
+    if request.get('cwd'):
+        os.chdir(request['cwd'])
+
+
+# Send the result of a check to the client. Checks may print anything, the client
+# gets their output as UTF-8.
+def respond(conn, code, stdout, stderr=''):
+    response = {'code': code, 'stdout': stdout.decode('utf-8', 'replace'), 'stderr': stderr.decode('utf-8', 'replace')}
+    conn.sendall(json.dumps(response) + "\n")
+    conn.close()
+
+
+# Serve a single client connection, this runs in a forked child. The exit handlers
+# of lib.cnh_nm (stats, limiter log, profiles, recorded fixtures) are run by hand as
+# the child leaves through os._exit.
+def serve(conn, checks):
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.alarm(args.t)
+    request = json.loads(conn.makefile('r').readline())
+    cnh_nm.snmp_restart_clock()
+    try:
+        apply_client_environment(request)
+    except (ValueError, OSError) as err:
+        respond(conn, cnh_nm.STATE_UNKNOWN, "UNKNOWN: Invalid check environment: {}\n".format(err))
+        return
+    mode = request.get('env', {}).get('CNH_NM_PROFILE', profile_mode).lower()
+    if mode:
+        cnh_nm.profile_start(mode)
+    if request.get('script') not in checks:
+        respond(conn, cnh_nm.STATE_UNKNOWN, "UNKNOWN: No such check: {}\n".format(request.get('script')))
+    else:
+        path, code = checks[request['script']]
+        respond(conn, *run_check(path, code, [str(arg) for arg in request.get('argv', [])]))
+    atexit._run_exitfuncs()
+
+
+# Reap finished children, so their CPU time is accounted to us
+def reap_children(signum, frame):
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except OSError:
+            return
+        if pid == 0:
+            return
+
+
+# Initialize net-snmp, and with it the MIBs, before forking any children
+Session(hostname='localhost', community='public', version=2)
+checks = compile_checks()
+
+if os.path.exists(args.s):
+    os.unlink(args.s)
+sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+sock.bind(args.s)
+os.chmod(args.s, 0660)
+sock.listen(128)
+signal.signal(signal.SIGCHLD, reap_children)
+os.chdir(basedir)
+
+while True:
+    try:
+        conn, _ = sock.accept()
+    except socket.error as err:
+        if err.errno == errno.EINTR:
+            continue
+        raise
+    pid = os.fork()
+    if pid == 0:
+        sock.close()
+        try:
+            serve(conn, checks)
+        finally:
+            os._exit(0)
+    conn.close()
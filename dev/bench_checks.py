@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+#
+# @descr    Benchmark the checks against replayed device fixtures of several sizes
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# Runs every check in dev/bench_fixtures.py against a small ToR, a big chassis and
+# a route reflector, replayed through lib.snmp_replay, and reports wall time, SNMP
+# round trips, CPU time and peak RSS per check (medians over the runs). That is
+# all SNMP checks.
+#
+# Every run starts out with nothing learned or cached, unless -w is given. Then each
+# check is run that many times first, and every measured run starts from what those
+# learned (bulk profiles, cached topologies), as checks polling a device regularly
+# would. Bulk profiles take about five runs to settle.
+#
+# Store the results of a known good tree, and compare later runs against them:
+#   dev/bench_checks.py -o baseline.json
+#   dev/bench_checks.py -c baseline.json
+# Exits 1 when a check got slower, bigger or needs more round trips than the
+# given threshold allows.
+#
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+from tempfile import mkdtemp
+from time import time
+
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bench_fixtures  # noqa
+
+
+# Argument parsing
+parser = argparse.ArgumentParser(description='Benchmark checks against replayed device fixtures')
+parser.add_argument('-n', metavar='<runs>', type=int, default=5,
+                    help='Runs of each check and size (default: 5)')
+parser.add_argument('-s', metavar='<size>', action='append', choices=sorted(bench_fixtures.sizes),
+                    help='Device size to run, can be given multiple times (default: all)')
+parser.add_argument('-k', metavar='<check>', action='append',
+                    help='Check to run, can be given multiple times (default: all)')
+parser.add_argument('-L', metavar='<seconds>', type=float, default=0.0,
+                    help='Latency per replayed PDU (default: 0)')
+parser.add_argument('-w', metavar='<runs>', type=int, default=0,
+                    help='Warm up runs of each check and size before measuring (default: 0)')
+parser.add_argument('-o', metavar='<file>',
+                    help='Store the results in this file')
+parser.add_argument('-c', metavar='<file>',
+                    help='Compare the results against those stored in this file')
+parser.add_argument('-t', metavar='<percent>', type=float, default=20.0,
+                    help='Regression threshold for time and memory (default: 20)')
+args = parser.parse_args()
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+# Round trips of a run, from the stats file written by lib.cnh_nm
+def read_round_trips(path):
+    round_trips = 0
+    try:
+        with open(path) as f:
+            for line in f:
+                name, value, timestamp = line.split()
+                if name.endswith('.get_pdus') or name.endswith('.bulk_pdus'):
+                    round_trips += int(value)
+    except IOError:
+        pass
+    return round_trips
+
+
+# Runs a command and prints its exit code, wall time, CPU time and peak RSS. The
+# check is forked from this small process instead of from us, as a child starts out
+# with the peak RSS of the process it was forked from.
+launcher = """
+import os, sys, time
+start = time.time()
+pid = os.fork()
+if pid == 0:
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    os.execv(sys.argv[1], sys.argv[1:])
+pid, status, rusage = os.wait4(pid, 0)
+print os.WEXITSTATUS(status), time.time() - start, rusage.ru_utime + rusage.ru_stime, rusage.ru_maxrss
+"""
+
+
+# Run a check once, returns (exit code, wall, cpu, peak rss kB, round trips)
+def run(script, script_args, fixture, cache_dir):
+    env = dict(os.environ)
+    env['CNH_NM_REPLAY'] = fixture
+    env['CNH_NM_REPLAY_LATENCY'] = str(args.L)
+    env['CNH_NM_CACHE_DIR'] = cache_dir
+    env['CNH_NM_STATS_FILE'] = os.path.join(cache_dir, 'stats')
+    for name in ('CNH_NM_RECORD', 'CNH_NM_WALK_CACHE_TTL', 'CNH_NM_DEADLINE', 'CNH_NM_PERFDATA'):
+        env.pop(name, None)
+    output = subprocess.check_output([sys.executable, '-c', launcher, sys.executable, os.path.join(basedir, script),
+                                      '-H', 'bench'] + script_args, cwd=basedir, env=env)
+    rc, wall, cpu, rss = output.split()
+    round_trips = read_round_trips(env['CNH_NM_STATS_FILE'])
+    if os.path.exists(env['CNH_NM_STATS_FILE']):
+        os.unlink(env['CNH_NM_STATS_FILE'])
+    return int(rc), float(wall), float(cpu), int(rss), round_trips
+
+
+# Run a check args.n times, each starting from a copy of the cache directory of
+# the warm up runs, or with nothing learned or cached
+def measure(script, script_args, fixture, tmpdir):
+    warm = None
+    if args.w:
+        warm = mkdtemp(dir=tmpdir)
+        for i in xrange(args.w):
+            run(script, script_args, fixture, warm)
+    runs = []
+    for i in xrange(args.n):
+        cache_dir = os.path.join(tmpdir, 'run')
+        if warm:
+            shutil.copytree(warm, cache_dir)
+        else:
+            os.mkdir(cache_dir)
+        runs.append(run(script, script_args, fixture, cache_dir))
+        shutil.rmtree(cache_dir)
+    if warm:
+        shutil.rmtree(warm)
+    return runs
+
+
+have_graphite_sink = bench_fixtures.graphite_sink()
+tmpdir = mkdtemp()
+results = {}
+print "{:24} {:8} {:>4} {:>10} {:>10} {:>10} {:>12}".format('check', 'size', 'rc', 'wall ms', 'cpu ms', 'rss kB', 'round trips')
+try:
+    for name, generator, script, script_args in bench_fixtures.cases:
+        if args.k and name not in args.k:
+            continue
+        if script.startswith('graphite/') and not have_graphite_sink:
+            print "{:24} skipped, can't listen on port 2003 for its metrics".format(name)
+            continue
+        for size in sorted(args.s or bench_fixtures.sizes):
+            fixture = os.path.join(tmpdir, "{}-{}.json".format(size, generator))
+            if not os.path.exists(fixture):
+                with open(fixture, 'w') as f:
+                    json.dump(bench_fixtures.build(generator, size).fixture(), f)
+            runs = measure(script, script_args, fixture, tmpdir)
+            result = {
+                'rc': max(r[0] for r in runs),
+                'wall': median([r[1] for r in runs]),
+                'cpu': median([r[2] for r in runs]),
+                'rss': median([r[3] for r in runs]),
+                'round_trips': median([r[4] for r in runs])
+            }
+            results["{}/{}".format(name, size)] = result
+            print "{:24} {:8} {:4d} {:10.1f} {:10.1f} {:10d} {:12d}".format(
+                name, size, result['rc'], 1000 * result['wall'], 1000 * result['cpu'], result['rss'], result['round_trips'])
+finally:
+    shutil.rmtree(tmpdir)
+
+if args.o:
+    with open(args.o, 'w') as f:
+        json.dump({'time': int(time()), 'latency': args.L, 'warm': args.w, 'results': results}, f, indent=1, sort_keys=True)
+
+
+# Compare against stored results, round trips are deterministic so any increase counts
+if args.c:
+    with open(args.c) as f:
+        baseline = json.load(f)['results']
+    regressions = 0
+    print
+    print "{:33} {:>10} {:>10} {:>10} {:>12}".format('compared to ' + os.path.basename(args.c), 'wall', 'cpu', 'rss', 'round trips')
+    for case in sorted(results):
+        if case not in baseline:
+            continue
+        before, after = baseline[case], results[case]
+        changes = []
+        regressed = after['round_trips'] > before['round_trips'] or after['rc'] != before['rc']
+        for key in ('wall', 'cpu', 'rss'):
+            change = 100.0 * (after[key] - before[key]) / before[key] if before[key] else 0.0
+            regressed = regressed or change > args.t
+            changes.append(change)
+        print "{:33} {:+9.1f}% {:+9.1f}% {:+9.1f}% {:+12d}{}".format(
+            case, changes[0], changes[1], changes[2], after['round_trips'] - before['round_trips'],
+            '  REGRESSION' if regressed else '')
+        regressions += regressed
+    if regressions:
+        sys.exit(1)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#
+# @descr    Benchmark per-check latency and CPU of cold processes against cnh_nm_daemon.py
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# Usage: dev/bench_daemon.py [-n <runs>] -- check_bgp.py -C <community> -H <host> -p <peer>
+#
+# Starts a private daemon on a temporary socket. CPU time of the daemon path is
+# the client's own plus what the daemon and its forked children used.
+#
+
+import argparse
+import os
+import subprocess
+import sys
+from tempfile import mkdtemp
+from time import sleep, time
+
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Argument parsing
+parser = argparse.ArgumentParser(description='Benchmark cold process against daemon check execution')
+parser.add_argument('-n', metavar='<runs>', type=int, default=20,
+                    help='Number of runs of each kind')
+parser.add_argument('check', nargs=argparse.REMAINDER,
+                    help='Check and its arguments')
+args = parser.parse_args()
+if args.check and args.check[0] == '--':
+    args.check.pop(0)
+if not args.check:
+    parser.error('No check given')
+
+
+# CPU time (user+sys, seconds) used by a process and its reaped children, from /proc
+def proc_cpu_time(pid):
+    with open('/proc/{}/stat'.format(pid)) as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return sum(int(field) for field in fields[11:15]) / float(os.sysconf('SC_CLK_TCK'))
+
+
+# Run a command, returns (wall time, exit code)
+def run(cmd, env):
+    start = time()
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    proc.communicate()
+    return time() - start, proc.returncode
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def report(name, walls, cpu):
+    print "{:8} runs: {:4d}  avg: {:7.1f}ms  p50: {:7.1f}ms  p90: {:7.1f}ms  cpu/check: {:7.1f}ms".format(
+        name, len(walls), 1000 * sum(walls) / len(walls), 1000 * percentile(walls, 50),
+        1000 * percentile(walls, 90), 1000 * cpu / len(walls))
+
+
+env = dict(os.environ)
+script = os.path.join(basedir, args.check[0])
+client = os.path.join(basedir, 'cnh_nm_client.py')
+
+
+# Cold processes, CPU time from our reaped children
+walls = []
+cpu_before = sum(os.times()[2:4])
+for i in xrange(args.n):
+    walls.append(run([sys.executable, script] + args.check[1:], env)[0])
+report('cold', walls, sum(os.times()[2:4]) - cpu_before)
+
+
+# Through the daemon
+tmpdir = mkdtemp()
+env['CNH_NM_DAEMON_SOCKET'] = os.path.join(tmpdir, 'daemon.sock')
+daemon = subprocess.Popen([sys.executable, os.path.join(basedir, 'cnh_nm_daemon.py'), '-s', env['CNH_NM_DAEMON_SOCKET']], env=env)
+while not os.path.exists(env['CNH_NM_DAEMON_SOCKET']):
+    sleep(0.1)
+walls = []
+cpu_before = sum(os.times()[2:4])
+daemon_cpu_before = proc_cpu_time(daemon.pid)
+for i in xrange(args.n):
+    walls.append(run([sys.executable, client, args.check[0]] + args.check[1:], env)[0])
+sleep(0.2)  # Let the daemon reap its last child
+report('daemon', walls, sum(os.times()[2:4]) - cpu_before + proc_cpu_time(daemon.pid) - daemon_cpu_before)
+daemon.terminate()
+daemon.wait()
+os.unlink(env['CNH_NM_DAEMON_SOCKET'])
+os.rmdir(tmpdir)
@@ -0,0 +1,637 @@
+#!/usr/bin/env python
+#
+# @descr    Synthetic device fixtures for the benchmark and load test tools
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# Builds what the checks would record from a small ToR switch, a big chassis and
+# a route reflector, both as lib.snmp_replay fixtures and as OID trees that
+# lib.snmp_agent can serve. Run directly to write the fixtures to a directory:
+#   dev/bench_fixtures.py /tmp/fixtures
+#
+
+import os
+import socket
+import sys
+import threading
+from struct import pack
+
+
+# Numeric OIDs of the columns used in the fixtures, so the agent can serve them
+# without the MIBs. Columns of vendor MIBs we don't have the numeric OIDs of are
+# left out of the trees, see FixtureBuilder.unserved.
+columns = {
+    'sysUpTime': '.1.3.6.1.2.1.1.3',
+    'ifDescr': '.1.3.6.1.2.1.2.2.1.2',
+    'ifName': '.1.3.6.1.2.1.31.1.1.1.1',
+    'ipNetToPhysicalPhysAddress': '.1.3.6.1.2.1.4.35.1.4',
+    'ipNetToPhysicalType': '.1.3.6.1.2.1.4.35.1.6',
+    'inetCidrRouteIfIndex': '.1.3.6.1.2.1.4.24.7.1.7',
+    'ospfNbrIpAddr': '.1.3.6.1.2.1.14.10.1.1',
+    'ospfNbrRtrId': '.1.3.6.1.2.1.14.10.1.3',
+    'ospfNbrState': '.1.3.6.1.2.1.14.10.1.6',
+    'ospfv3NbrAddress': '.1.3.6.1.2.1.191.1.9.1.5',
+    'ospfv3NbrState': '.1.3.6.1.2.1.191.1.9.1.8',
+    'bgpLocalAs': '.1.3.6.1.2.1.15.2',
+    'entPhysicalDescr': '.1.3.6.1.2.1.47.1.1.1.1.2',
+    'entPhysicalClass': '.1.3.6.1.2.1.47.1.1.1.1.5',
+    'entPhysicalName': '.1.3.6.1.2.1.47.1.1.1.1.7',
+    'entPhysicalSerialNum': '.1.3.6.1.2.1.47.1.1.1.1.11',
+    'entPhysicalModelName': '.1.3.6.1.2.1.47.1.1.1.1.13',
+    'entPhySensorOperStatus': '.1.3.6.1.2.1.99.1.1.1.5',
+    'entStateOper': '.1.3.6.1.2.1.131.1.1.1.3',
+    'entStateUsage': '.1.3.6.1.2.1.131.1.1.1.4',
+    'entStateAlarm': '.1.3.6.1.2.1.131.1.1.1.5',
+    'entStateStandby': '.1.3.6.1.2.1.131.1.1.1.6',
+    'cefcFRUPowerAdminStatus': '.1.3.6.1.4.1.9.9.117.1.1.2.1.1',
+    'cefcFRUPowerOperStatus': '.1.3.6.1.4.1.9.9.117.1.1.2.1.2',
+    'entSensorStatus': '.1.3.6.1.4.1.9.9.91.1.1.1.1.5',
+    'cbgpPeer2State': '.1.3.6.1.4.1.9.9.187.1.2.5.1.3',
+    'cbgpPeer2AdminStatus': '.1.3.6.1.4.1.9.9.187.1.2.5.1.4',
+    'cbgpPeer2RemoteAs': '.1.3.6.1.4.1.9.9.187.1.2.5.1.11',
+    'cbgpPeer2LastErrorTxt': '.1.3.6.1.4.1.9.9.187.1.2.5.1.28',
+    'cContextMappingVrfName': '.1.3.6.1.4.1.9.9.468.1.1.1.2',
+    'cbQosIfType': '.1.3.6.1.4.1.9.9.166.1.1.1.1.2',
+    'cbQosIfIndex': '.1.3.6.1.4.1.9.9.166.1.1.1.1.4',
+    'cbQosConfigIndex': '.1.3.6.1.4.1.9.9.166.1.5.1.1.2',
+    'cbQosPolicyMapName': '.1.3.6.1.4.1.9.9.166.1.6.1.1.1',
+    'cbQosCMName': '.1.3.6.1.4.1.9.9.166.1.7.1.1.1',
+    'cbQosCMPrePolicyByte': '.1.3.6.1.4.1.9.9.166.1.15.1.1.5',
+    'cbQosCMPostPolicyByte': '.1.3.6.1.4.1.9.9.166.1.15.1.1.9',
+    'cbQosCMDropByte': '.1.3.6.1.4.1.9.9.166.1.15.1.1.16',
+    'cbQosCMPrePolicyByte64': '.1.3.6.1.4.1.9.9.166.1.15.1.1.6',
+    'cbQosCMPostPolicyByte64': '.1.3.6.1.4.1.9.9.166.1.15.1.1.10',
+    'cbQosCMDropByte64': '.1.3.6.1.4.1.9.9.166.1.15.1.1.17',
+    'dellNetCpuUtil1Min': '.1.3.6.1.4.1.6027.3.26.1.4.4.1.4',
+    'dellNetCpuUtilMemUsage': '.1.3.6.1.4.1.6027.3.26.1.4.4.1.6',
+    'dellNetPowerSupplyOperStatus': '.1.3.6.1.4.1.6027.3.26.1.4.6.1.4',
+    'dellNetFanTrayOperStatus': '.1.3.6.1.4.1.6027.3.26.1.4.7.1.4',
+    'routerId': '.1.3.6.1.4.1.9586.100.5.1.2',
+    'vrrpSyncGroupName': '.1.3.6.1.4.1.9586.100.5.2.1.1.2',
+    'vrrpSyncGroupState': '.1.3.6.1.4.1.9586.100.5.2.1.1.3',
+    'vrrpInstanceName': '.1.3.6.1.4.1.9586.100.5.2.3.1.2',
+    'vrrpInstanceState': '.1.3.6.1.4.1.9586.100.5.2.3.1.4',
+    'vrrpInstancePreempt': '.1.3.6.1.4.1.9586.100.5.2.3.1.13',
+    'vrrpInstanceSyncGroup': '.1.3.6.1.4.1.9586.100.5.2.3.1.18'
+}
+
+
+# Values the checks get with use_sprint_value, as served by an agent
+sprint_values = {
+    'ipNetToPhysicalType': {u'other': u'1', u'invalid': u'2', u'dynamic': u'3', u'static': u'4', u'local': u'5'},
+    'ospfv3NbrState': {u'down': u'1', u'attempt': u'2', u'init': u'3', u'twoWay': u'4', u'exchangeStart': u'5',
+                       u'exchange': u'6', u'loading': u'7', u'full': u'8'}
+}
+
+
+# The other device of the fixtures of checks polling two, only in the replay fixture
+peer_host = 'bench-peer'
+
+
+# Collects the walks and gets of a device, in lib.snmp_replay fixture format
+# and as an OID tree. Walks and gets of peer_host only go into the fixture.
+class FixtureBuilder(object):
+
+    def __init__(self, host):
+        self.host = host
+        self.hosts = {}
+        self.trees = {}  # context -> {numeric oid: (type, value)}
+        self.unserved = set()  # Columns without a numeric OID in columns
+
+    def section(self, context, host=None):
+        host = host or self.host
+        name = "{}/{}".format(host, context) if context else host
+        return self.hosts.setdefault(name, {'get': {}, 'walk': {}})
+
+    def add_tree(self, context, column, index, value, snmp_type):
+        if column.startswith('.'):
+            oid = column
+        elif column in columns:
+            oid = columns[column]
+        else:
+            self.unserved.add(column)
+            return
+        value = sprint_values.get(column, {}).get(value, value)
+        self.trees.setdefault(context, {})["{}.{}".format(oid, index)] = (snmp_type, value)
+
+    # A walk of the requested (symbolic) OIDs, returning rows of (column, index, value, type)
+    def walk(self, oids, rows, context="", host=None):
+        key = ' '.join(oids)
+        self.section(context, host)['walk'][key] = [list(row) for row in rows]
+        if host is not None:
+            return
+        for row in rows:
+            self.add_tree(context, *row)
+
+    # A get of a symbolic OID, or of a numeric one as some checks ask for
+    def get(self, oid, value, snmp_type, context="", host=None):
+        if '::' in oid:
+            column, index = oid.split('::', 1)[1].split('.', 1)
+        else:
+            column, sep, index = oid.rpartition('.')
+        self.section(context, host)['get'][oid] = [column, index, value, snmp_type]
+        if host is None:
+            self.add_tree(context, column, index, value, snmp_type)
+
+    def fixture(self):
+        return {'hosts': self.hosts}
+
+
+def peer_ip(i):
+    return "10.{}.{}.1".format(i >> 8 & 255, i & 255)
+
+
+# The rows of a walk of several columns of a table, column by column as net-snmp
+# walks them. Each entry is (index, {column: (value, type)}).
+def table_rows(oids, entries):
+    rows = []
+    for oid in oids:
+        column = oid.split('::', 1)[1]
+        for index, values in entries:
+            value, snmp_type = values[column]
+            rows.append((column, index, value, snmp_type))
+    return rows
+
+
+# The peer table walked in the column order of check_bgp.py and of check_ibgp.py,
+# and the row of the first peer as check_bgp.py gets it for a single peer
+def bgp(builder, peers):
+    builder.get('BGP4-MIB::bgpLocalAs.0', u'65000', 'INTEGER')
+    entries = []
+    for i in xrange(peers):
+        entries.append(("1.4." + peer_ip(i), {
+            'cbgpPeer2AdminStatus': (u'2', 'INTEGER'),
+            'cbgpPeer2State': (u'6', 'INTEGER'),
+            'cbgpPeer2LastErrorTxt': (u'', 'OCTETSTR'),
+            'cbgpPeer2RemoteAs': (unicode(65000 + i % 100), 'GAUGE')
+        }))
+    for oids in (['CISCO-BGP4-MIB::cbgpPeer2AdminStatus', 'CISCO-BGP4-MIB::cbgpPeer2State',
+                  'CISCO-BGP4-MIB::cbgpPeer2LastErrorTxt', 'CISCO-BGP4-MIB::cbgpPeer2RemoteAs'],
+                 ['CISCO-BGP4-MIB::cbgpPeer2RemoteAs', 'CISCO-BGP4-MIB::cbgpPeer2AdminStatus',
+                  'CISCO-BGP4-MIB::cbgpPeer2LastErrorTxt', 'CISCO-BGP4-MIB::cbgpPeer2State']):
+        builder.walk(oids, table_rows(oids, entries))
+    index, values = entries[0]
+    for column, (value, snmp_type) in values.iteritems():
+        builder.get("CISCO-BGP4-MIB::{}.{}".format(column, index), value, snmp_type)
+
+
+# Chassis, then per slot a module with a power supply or fan and sensors on it
+def entity(builder, entities):
+    kinds = [(3, u'Chassis'), (9, u'Module'), (6, u'Power Supply'), (7, u'Fan'), (8, u'Temperature Sensor'), (8, u'Transceiver Sensor')]
+    ents = []
+    for i in xrange(entities):
+        physical_class, descr = kinds[0] if i == 0 else kinds[1 + i % (len(kinds) - 1)]
+        ents.append((str(i + 1), physical_class, u"{} {}".format(descr, i)))
+    rows = []
+    for column in ['entPhysicalDescr', 'entPhysicalClass', 'entPhysicalName', 'entPhysicalSerialNum', 'entPhysicalModelName']:
+        for index, physical_class, descr in ents:
+            value, snmp_type = {
+                'entPhysicalDescr': (descr, 'OCTETSTR'),
+                'entPhysicalClass': (unicode(physical_class), 'INTEGER'),
+                'entPhysicalName': (u'Chassis' if physical_class == 3 else descr, 'OCTETSTR'),
+                'entPhysicalSerialNum': (u"SN{:08d}".format(int(index)), 'OCTETSTR'),
+                'entPhysicalModelName': (u'N7K-C7010', 'OCTETSTR')
+            }[column]
+            rows.append((column, index, value, snmp_type))
+    builder.walk(['ENTITY-MIB::entPhysicalTable'], rows)
+    # The status columns both as gets per entity, as cisco_entity_sensors.py did, and
+    # as the sparse column walks it does now
+    status_rows = {'cefcFRUPowerAdminStatus': [], 'cefcFRUPowerOperStatus': [], 'entSensorStatus': []}
+    for index, physical_class, descr in ents:
+        if physical_class in (6, 9):
+            builder.get("CISCO-ENTITY-FRU-CONTROL-MIB::cefcFRUPowerAdminStatus.{}".format(index), u'1', 'INTEGER')
+            builder.get("CISCO-ENTITY-FRU-CONTROL-MIB::cefcFRUPowerOperStatus.{}".format(index), u'2', 'INTEGER')
+            status_rows['cefcFRUPowerAdminStatus'].append(('cefcFRUPowerAdminStatus', index, u'1', 'INTEGER'))
+            status_rows['cefcFRUPowerOperStatus'].append(('cefcFRUPowerOperStatus', index, u'2', 'INTEGER'))
+        if physical_class == 8:
+            builder.get("CISCO-ENTITY-SENSOR-MIB::entSensorStatus.{}".format(index), u'1', 'INTEGER')
+            status_rows['entSensorStatus'].append(('entSensorStatus', index, u'1', 'INTEGER'))
+    builder.walk(['CISCO-ENTITY-FRU-CONTROL-MIB::cefcFRUPowerAdminStatus'], status_rows['cefcFRUPowerAdminStatus'])
+    builder.walk(['CISCO-ENTITY-FRU-CONTROL-MIB::cefcFRUPowerOperStatus'], status_rows['cefcFRUPowerOperStatus'])
+    builder.walk(['CISCO-ENTITY-SENSOR-MIB::entSensorStatus'], status_rows['entSensorStatus'])
+    # The states mlnx_entity_sensors.py gets of the power supplies and sensors
+    for index, physical_class, descr in ents:
+        if physical_class in (6, 8):
+            builder.get("ENTITY-STATE-MIB::entStateStandby.{}".format(index), u'3', 'INTEGER')
+            builder.get("ENTITY-STATE-MIB::entStateOper.{}".format(index), u'3', 'INTEGER')
+            builder.get("ENTITY-STATE-MIB::entStateUsage.{}".format(index), u'3', 'INTEGER')
+            builder.get("ENTITY-STATE-MIB::entStateAlarm.{}".format(index), u'\x00', 'OCTETSTR')
+        if physical_class == 8:
+            builder.get("ENTITY-SENSOR-MIB::entPhySensorOperStatus.{}".format(index), u'1', 'INTEGER')
+
+
+# VRF contexts with a routing table each, the checked neighbor is in the last one.
+# Each neighbor also has an OSPFv3 adjacency over its link-local address, with
+# the values as nxos_ospfv3_if.py gets them from net-snmp (use_sprint_value).
+def ospf_if(builder, routes, contexts=2, neighbors=4):
+    rows = []
+    for c in xrange(contexts):
+        name = "vrf{}".format(c)
+        rows.append(('cContextMappingVrfName', "{}.{}".format(len(name), '.'.join(str(ord(char)) for char in name)), unicode(name), 'OCTETSTR'))
+    builder.walk(['CISCO-CONTEXT-MAPPING-MIB::cContextMappingVrfName'], rows)
+    for c in xrange(contexts):
+        context = "vrf{}".format(c)
+        rows = []
+        for i in xrange(routes):
+            prefix = "10.{}.{}.0".format(i >> 8 & 255, i & 255)
+            rows.append(('inetCidrRouteIfIndex', "1.4.{}.24.2.0.0.1.4.{}".format(prefix, prefix[:-1] + '1'), unicode(i % 48 + 1), 'INTEGER'))
+        builder.walk(['IP-FORWARD-MIB::inetCidrRouteIfIndex.1.4'], rows, context)
+        rows = []
+        for column in ['ospfNbrIpAddr', 'ospfNbrRtrId', 'ospfNbrState']:
+            for i in xrange(neighbors):
+                nei_ip = "10.0.{}.2".format(i)
+                value, snmp_type = {
+                    'ospfNbrIpAddr': (unicode(nei_ip), 'IPADDR'),
+                    'ospfNbrRtrId': (u"192.0.2.{}".format(i + 1), 'IPADDR'),
+                    'ospfNbrState': (u'8', 'INTEGER')
+                }[column]
+                rows.append((column, nei_ip + '.0', value, snmp_type))
+        builder.walk(['OSPF-MIB::ospfNbrIpAddr', 'OSPF-MIB::ospfNbrRtrId', 'OSPF-MIB::ospfNbrState'], rows, context)
+        for i in xrange(neighbors):
+            builder.get("IF-MIB::ifDescr.{}".format(i + 1), u"Ethernet{}/{}".format(c + 1, i + 1), 'OCTETSTR', context)
+        ndp_rows = []
+        entries = []
+        for i in xrange(neighbors):
+            address = [0xfe, 0x80] + [0] * 10 + [0, c, 0, i + 1]
+            ndp_rows.append(('ipNetToPhysicalPhysAddress', "{}.2.16.{}".format(i + 1, '.'.join(str(octet) for octet in address)),
+                             u"0:0:5e:0:{:x}:{:x}".format(c, i + 1), 'OCTETSTR'))
+            entries.append(("{}.0.{}".format(i + 1, 3221225985 + i), {
+                'ospfv3NbrState': (u'full', 'INTEGER'),
+                'ospfv3NbrAddress': (u'"{} "'.format(' '.join("{:02X}".format(octet) for octet in address)), 'OCTETSTR')
+            }))
+        builder.walk(['IP-MIB::ipNetToPhysicalPhysAddress'], ndp_rows, context)
+        oids = ['OSPFV3-MIB::ospfv3NbrState', 'OSPFV3-MIB::ospfv3NbrAddress']
+        builder.walk(oids, table_rows(oids, entries), context)
+
+
+# The walks per VLAN are what arp_vlans.py did before it walked the whole column,
+# which also has IPv6 neighbors on every tenth VLAN
+def arp(builder, vlans, entries):
+    rows = [('ifDescr', str(i + 1), u"Ethernet1/{}".format(i + 1), 'OCTETSTR') for i in xrange(48)]
+    rows += [('ifDescr', str(1000 + v), u"Vlan {}".format(v + 1), 'OCTETSTR') for v in xrange(vlans)]
+    builder.walk(['IF-MIB::ifDescr'], rows)
+    column_rows = []
+    for v in xrange(vlans):
+        ifindex = 1000 + v
+        rows = []
+        for i in xrange(entries):
+            rows.append(('ipNetToPhysicalType', "{}.1.4.10.{}.{}.{}".format(ifindex, v & 255, i >> 8 & 255, i & 255),
+                         u'dynamic' if i % 10 else u'static', 'INTEGER'))
+        builder.walk(["IP-MIB::ipNetToPhysicalType.{}.1".format(ifindex)], rows)
+        column_rows += [(column, index, sprint_values[column][value], snmp_type) for column, index, value, snmp_type in rows]
+        if v % 10 == 0:
+            for i in xrange(entries):
+                address = '.'.join(['254', '128'] + ['0'] * 10 + [str(v >> 8 & 255), str(v & 255), str(i >> 8 & 255), str(i & 255)])
+                column_rows.append(('ipNetToPhysicalType', "{}.2.16.{}".format(ifindex, address), u'3', 'INTEGER'))
+    builder.walk(['IP-MIB::ipNetToPhysicalType'], column_rows)
+
+
+qos_columns = dict((oid.split('::')[1], oid) for oid in [
+    'CISCO-CLASS-BASED-QOS-MIB::cbQosCMName', 'CISCO-CLASS-BASED-QOS-MIB::cbQosPolicyMapName',
+    'CISCO-CLASS-BASED-QOS-MIB::cbQosIfIndex', 'CISCO-CLASS-BASED-QOS-MIB::cbQosIfType',
+    'CISCO-CLASS-BASED-QOS-MIB::cbQosConfigIndex', 'CISCO-CLASS-BASED-QOS-MIB::cbQosCMDropByte',
+    'CISCO-CLASS-BASED-QOS-MIB::cbQosCMPrePolicyByte', 'CISCO-CLASS-BASED-QOS-MIB::cbQosCMPostPolicyByte',
+    'CISCO-CLASS-BASED-QOS-MIB::cbQosCMDropByte64', 'CISCO-CLASS-BASED-QOS-MIB::cbQosCMPrePolicyByte64',
+    'CISCO-CLASS-BASED-QOS-MIB::cbQosCMPostPolicyByte64', 'IF-MIB::ifDescr'])
+
+
+# One service policy per interface, each with a number of classes. The gets and
+# walks per policy are what cisco_qos.py did before it walked whole columns, the
+# columns are recorded one by one.
+def qos(builder, interfaces, classes):
+    builder.get('SNMPv2-MIB::sysUpTime.0', u'123456789', 'TICKS')
+    policy_rows = dict((column, []) for column in qos_columns)
+    policy_rows['cbQosPolicyMapName'].append(('cbQosPolicyMapName', '1000', u'EDGE-OUT', 'OCTETSTR'))
+    for k in xrange(classes):
+        policy_rows['cbQosCMName'].append(('cbQosCMName', str(2000 + k), u"CLASS-{}".format(k), 'OCTETSTR'))
+    for p in xrange(1, interfaces + 1):
+        policy_rows['cbQosIfIndex'].append(('cbQosIfIndex', str(p), unicode(p), 'INTEGER'))
+        policy_rows['cbQosIfType'].append(('cbQosIfType', str(p), u'1', 'INTEGER'))
+        policy_rows['ifDescr'].append(('ifDescr', str(p), u"GigabitEthernet0/{}".format(p), 'OCTETSTR'))
+        builder.get("CISCO-CLASS-BASED-QOS-MIB::cbQosIfType.{}".format(p), u'1', 'INTEGER')
+        builder.get("CISCO-CLASS-BASED-QOS-MIB::cbQosConfigIndex.{0}.{0}".format(p), u'1000', 'GAUGE')
+        builder.get("IF-MIB::ifDescr.{}".format(p), u"GigabitEthernet0/{}".format(p), 'OCTETSTR')
+        config_rows = [('cbQosConfigIndex', "{0}.{0}".format(p), u'1000', 'GAUGE')]
+        for k in xrange(classes):
+            obj = str(100000 + k)
+            config_rows.append(('cbQosConfigIndex', "{}.{}".format(p, obj), unicode(2000 + k), 'GAUGE'))
+            for column in ['cbQosCMDropByte', 'cbQosCMPrePolicyByte', 'cbQosCMPostPolicyByte']:
+                value = p * 1000003 + k * 7919
+                policy_rows[column].append((column, "{}.{}".format(p, obj), unicode(value), 'COUNTER'))
+                policy_rows[column + '64'].append((column + '64', "{}.{}".format(p, obj), unicode(value << 32), 'COUNTER64'))
+        builder.walk(["CISCO-CLASS-BASED-QOS-MIB::cbQosConfigIndex.{}".format(p)], config_rows)
+        policy_rows['cbQosConfigIndex'] += config_rows
+    for column, oid in qos_columns.iteritems():
+        builder.walk([oid], policy_rows[column])
+
+
+# The configuration change history, there is a single row of it
+def config(builder):
+    oids = ['CISCO-CONFIG-MAN-MIB::ccmHistoryRunningLastChanged', 'CISCO-CONFIG-MAN-MIB::ccmHistoryStartupLastChanged',
+            'CISCO-CONFIG-MAN-MIB::ccmCTIDWhoChanged']
+    builder.walk(oids, table_rows(oids, [('0', {
+        'ccmHistoryRunningLastChanged': (u'120000000', 'TICKS'),
+        'ccmHistoryStartupLastChanged': (u'120004500', 'TICKS'),
+        'ccmCTIDWhoChanged': (u'admin', 'OCTETSTR')
+    })]))
+    builder.get('SNMPv2-MIB::sysUpTime.0', u'123456789', 'TICKS')
+
+
+# EoMPLS and VPLS pseudowires
+def pw(builder, vcs):
+    entries = []
+    for i in xrange(vcs):
+        entries.append((str(i + 1), {
+            'cpwVcPsnType': (u'1', 'INTEGER'),
+            'cpwVcID': (unicode(100 + i), 'GAUGE'),
+            'cpwVcLocalIfMtu': (u'9000', 'GAUGE'),
+            'cpwVcRemoteIfMtu': (u'9000', 'GAUGE'),
+            'cpwVcInboundOperStatus': (u'1', 'INTEGER'),
+            'cpwVcOutboundOperStatus': (u'1', 'INTEGER'),
+            'cpwVcAdminStatus': (u'1', 'INTEGER'),
+            'cpwVcOperStatus': (u'1', 'INTEGER')
+        }))
+    oids = ['CISCO-IETF-PW-MIB::cpwVcPsnType', 'CISCO-IETF-PW-MIB::cpwVcID', 'CISCO-IETF-PW-MIB::cpwVcLocalIfMtu',
+            'CISCO-IETF-PW-MIB::cpwVcRemoteIfMtu', 'CISCO-IETF-PW-MIB::cpwVcInboundOperStatus',
+            'CISCO-IETF-PW-MIB::cpwVcOutboundOperStatus', 'CISCO-IETF-PW-MIB::cpwVcAdminStatus',
+            'CISCO-IETF-PW-MIB::cpwVcOperStatus']
+    builder.walk(oids, table_rows(oids, entries))
+
+
+# OSPF neighbors in the default VRF, as check_ospf.py gets them, and port-channels
+# with an OSPFv3 neighbor each, walked per interface by check_ospfv3_if.py
+def ospf(builder, interfaces):
+    rows = []
+    for i in xrange(interfaces):
+        builder.get("OSPF-MIB::ospfNbrState.10.1.{}.2.0".format(i), u'8', 'INTEGER')
+        rows.append(('ifDescr', str(3001 + i), u"Port-channel{}".format(i + 1), 'OCTETSTR'))
+    builder.walk(['IF-MIB::ifDescr'], rows)
+    for i in xrange(interfaces):
+        builder.walk(["OSPFV3-MIB::ospfv3NbrState.{}".format(3001 + i)],
+                     [('ospfv3NbrState', "{}.0.{}".format(3001 + i, 3221225985 + i), u'8', 'INTEGER')])
+
+
+# A VSS pair of chassis, active and standby, and their VSL connections
+def vss(builder):
+    builder.get('CISCO-VIRTUAL-SWITCH-MIB::cvsSwitchCapability.0', u'\xc0', 'OCTETSTR')
+    builder.get('CISCO-VIRTUAL-SWITCH-MIB::cvsSwitchMode.0', u'2', 'INTEGER')
+    oids = ['CISCO-VIRTUAL-SWITCH-MIB::cvsChassisRole', 'CISCO-VIRTUAL-SWITCH-MIB::cvsChassisUpTime']
+    builder.walk(oids, table_rows(oids, [
+        ('1', {'cvsChassisRole': (u'2', 'INTEGER'), 'cvsChassisUpTime': (u'864000000', 'TICKS')}),
+        ('2', {'cvsChassisRole': (u'3', 'INTEGER'), 'cvsChassisUpTime': (u'864000000', 'TICKS')})
+    ]))
+    last_change = pack('>HBBBBBB', 2020, 1, 1, 12, 0, 0, 0).decode('latin1')  # DateAndTime
+    entries = []
+    for i in xrange(2):
+        entries.append((str(i + 1), {
+            'cvsVSLConnectOperStatus': (u'1', 'INTEGER'),
+            'cvsVSLLastConnectionStateChange': (last_change, 'OCTETSTR'),
+            'cvsVSLConfiguredPortCount': (u'2', 'GAUGE'),
+            'cvsVSLOperationalPortCount': (u'2', 'GAUGE')
+        }))
+    oids = ['CISCO-VIRTUAL-SWITCH-MIB::cvsVSLConnectOperStatus', 'CISCO-VIRTUAL-SWITCH-MIB::cvsVSLLastConnectionStateChange',
+            'CISCO-VIRTUAL-SWITCH-MIB::cvsVSLConfiguredPortCount', 'CISCO-VIRTUAL-SWITCH-MIB::cvsVSLOperationalPortCount']
+    builder.walk(oids, table_rows(oids, entries))
+
+
+# A vPC domain with a port-channel to each host
+def vpc(builder, host_links):
+    oids = ['CISCO-VPC-MIB::cVpcPeerKeepAliveStatus', 'CISCO-VPC-MIB::cVpcPeerKeepAliveMsgSendStatus',
+            'CISCO-VPC-MIB::cVpcPeerKeepAliveMsgRcvrStatus', 'CISCO-VPC-MIB::cVpcPeerKeepAliveVrfName',
+            'CISCO-VPC-MIB::cVpcRoleStatus', 'CISCO-VPC-MIB::cVpcDualActiveDetectionStatus']
+    builder.walk(oids, table_rows(oids, [('10', {
+        'cVpcPeerKeepAliveStatus': (u'2', 'INTEGER'),
+        'cVpcPeerKeepAliveMsgSendStatus': (u'1', 'INTEGER'),
+        'cVpcPeerKeepAliveMsgRcvrStatus': (u'1', 'INTEGER'),
+        'cVpcPeerKeepAliveVrfName': (u'management', 'OCTETSTR'),
+        'cVpcRoleStatus': (u'2', 'INTEGER'),
+        'cVpcDualActiveDetectionStatus': (u'2', 'INTEGER')
+    })]))
+    entries = []
+    for i in xrange(host_links):
+        ifindex = 369098752 + i + 1  # port-channel<n> on NX-OS
+        entries.append(("10.{}".format(i + 1), {
+            'cVpcStatusHostLinkIfIndex': (unicode(ifindex), 'INTEGER'),
+            'cVpcStatusHostLinkStatus': (u'3', 'INTEGER'),
+            'cVpcStatusHostLinkConsistencyStatus': (u'1', 'INTEGER'),
+            'cVpcStatusHostLinkConsistencyDetail': (u'SUCCESS', 'OCTETSTR')
+        }))
+        builder.get("IF-MIB::ifName.{}".format(ifindex), u"port-channel{}".format(i + 1), 'OCTETSTR')
+    oids = ['CISCO-VPC-MIB::cVpcStatusHostLinkIfIndex', 'CISCO-VPC-MIB::cVpcStatusHostLinkStatus',
+            'CISCO-VPC-MIB::cVpcStatusHostLinkConsistencyStatus', 'CISCO-VPC-MIB::cVpcStatusHostLinkConsistencyDetail']
+    builder.walk(oids, table_rows(oids, entries))
+
+
+# A stack of FTOS units, the first one managing it, with two power supplies and
+# three fan trays each
+def ftos_chassis(builder, units, psus=2, fans=3):
+    builder.get('DELL-NETWORKING-CHASSIS-MIB::dellNetDeviceType.0', u'2', 'INTEGER')
+    builder.get('DELL-NETWORKING-CHASSIS-MIB::dellNetNumStackUnits.0', unicode(units), 'INTEGER')
+    entries = []
+    for unit in xrange(1, units + 1):
+        entries.append((str(unit), {
+            'dellNetStackUnitNumber': (unicode(unit), 'INTEGER'),
+            'dellNetStackUnitStatus': (u'1', 'INTEGER'),
+            'dellNetStackUnitUpTime': (u'864000000', 'TICKS')
+        }))
+        builder.get("DELL-NETWORKING-CHASSIS-MIB::dellNetStackUnitMgmtStatus.{}".format(unit), u'1' if unit == 1 else u'2', 'INTEGER')
+        builder.get("DELL-NETWORKING-CHASSIS-MIB::dellNetStackUnitNumPowerSupplies.{}".format(unit), unicode(psus), 'INTEGER')
+        builder.get("DELL-NETWORKING-CHASSIS-MIB::dellNetStackUnitNumFanTrays.{}".format(unit), unicode(fans), 'INTEGER')
+        builder.get("DELL-NETWORKING-CHASSIS-MIB::dellNetCpuUtil1Min.2.{}.1".format(unit), u'12', 'GAUGE')
+        builder.get("DELL-NETWORKING-CHASSIS-MIB::dellNetCpuUtilMemUsage.2.{}.1".format(unit), u'40', 'GAUGE')
+        for psu in xrange(1, psus + 1):
+            builder.get("DELL-NETWORKING-CHASSIS-MIB::dellNetPowerSupplyOperStatus.2.{}.{}".format(unit, psu), u'1', 'INTEGER')
+        for fan in xrange(1, fans + 1):
+            builder.get("DELL-NETWORKING-CHASSIS-MIB::dellNetFanTrayOperStatus.2.{}.{}".format(unit, fan), u'1', 'INTEGER')
+    oids = ['DELL-NETWORKING-CHASSIS-MIB::dellNetStackUnitNumber', 'DELL-NETWORKING-CHASSIS-MIB::dellNetStackUnitStatus',
+            'DELL-NETWORKING-CHASSIS-MIB::dellNetStackUnitUpTime']
+    builder.walk(oids, table_rows(oids, entries))
+
+
+# The FTOS peer table, walked whole by ftos_ibgp.py and a column of it by
+# ftos_bgp_peer.py, which then gets the row of the first peer
+def ftos_bgp(builder, peers):
+    builder.get('DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2LocalAs.0', u'65000', 'GAUGE')
+    entries = []
+    for i in xrange(peers):
+        remote = peer_ip(i)
+        entries.append(("1.1.4.10.255.0.1.1.4." + remote, {
+            'dellNetBgpM2PeerIdentifier': (u"192.0.2.{}".format(i % 250 + 1), 'IPADDR'),
+            'dellNetBgpM2PeerState': (u'6', 'INTEGER'),
+            'dellNetBgpM2PeerStatus': (u'2', 'INTEGER'),
+            'dellNetBgpM2PeerRemoteAddrType': (u'1', 'INTEGER'),
+            'dellNetBgpM2PeerRemoteAddr': (socket.inet_aton(remote).decode('latin1'), 'OCTETSTR'),
+            'dellNetBgpM2PeerRemoteAs': (unicode(65000 + i % 100), 'GAUGE')
+        }))
+    oids = ['DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2PeerIdentifier', 'DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2PeerState',
+            'DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2PeerStatus', 'DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2PeerRemoteAddrType',
+            'DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2PeerRemoteAddr', 'DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2PeerRemoteAs']
+    builder.walk(oids, table_rows(oids, entries))
+    builder.walk(oids[1:2], table_rows(oids[1:2], entries))
+    index, values = entries[0]
+    for column in ['dellNetBgpM2PeerStatus', 'dellNetBgpM2PeerRemoteAs']:
+        value, snmp_type = values[column]
+        builder.get("DELL-NETWORKING-BGP4-V2-MIB::{}.{}".format(column, index), value, snmp_type)
+
+
+# FTOS port-channels of two ports each
+def lag(builder, lags):
+    entries = []
+    for i in xrange(lags):
+        ifindex = 1258291200 + (i + 1) * 128
+        entries.append((str(i + 1), {
+            'dot3aAggCfgNumPorts': (u'2', 'INTEGER'),
+            'dot3aAggCfgOperStatus': (u'1', 'INTEGER'),
+            'dot3aAggCfgIfIndex': (unicode(ifindex), 'INTEGER'),
+            'dot3aAggCfgPortListString': (u"Te 1/{} Te 2/{}".format(i + 1, i + 1), 'OCTETSTR')
+        }))
+        builder.get("IF-MIB::ifDescr.{}".format(ifindex), u"Port-channel {}".format(i + 1), 'OCTETSTR')
+    oids = ['DELL-NETWORKING-LINK-AGGREGATION-MIB::dot3aAggCfgNumPorts', 'DELL-NETWORKING-LINK-AGGREGATION-MIB::dot3aAggCfgOperStatus',
+            'DELL-NETWORKING-LINK-AGGREGATION-MIB::dot3aAggCfgIfIndex', 'DELL-NETWORKING-LINK-AGGREGATION-MIB::dot3aAggCfgPortListString']
+    builder.walk(oids, table_rows(oids, entries))
+
+
+# A VLT domain with its peer up
+def vlt(builder):
+    builder.walk(['DELL-NETWORKING-VIRTUAL-LINK-TRUNK-MIB::dellNetVLTDomainId'], [('dellNetVLTDomainId', '1', u'1', 'INTEGER')])
+    oids = ['DELL-NETWORKING-VIRTUAL-LINK-TRUNK-MIB::dellNetVLTPeerStatus', 'DELL-NETWORKING-VIRTUAL-LINK-TRUNK-MIB::dellNetVLTIclStatus',
+            'DELL-NETWORKING-VIRTUAL-LINK-TRUNK-MIB::dellNetVLTHBeatStatus', 'DELL-NETWORKING-VIRTUAL-LINK-TRUNK-MIB::dellNetVLTIclBwStatus']
+    builder.walk(oids, table_rows(oids, [('1', {
+        'dellNetVLTPeerStatus': (u'1', 'INTEGER'),
+        'dellNetVLTIclStatus': (u'1', 'INTEGER'),
+        'dellNetVLTHBeatStatus': (u'1', 'INTEGER'),
+        'dellNetVLTIclBwStatus': (u'2', 'INTEGER')
+    })]))
+
+
+# A keepalived pair, the device master of all its instances and peer_host backup
+def keepalived(builder, instances, syncgroups=1):
+    for host, router_id, state in ((None, u'lb1', u'2'), (peer_host, u'lb2', u'1')):
+        builder.get('KEEPALIVED-MIB::routerId.0', router_id, 'OCTETSTR', host=host)
+        rows = []
+        for column in ('vrrpSyncGroupName', 'vrrpSyncGroupState'):
+            for i in xrange(syncgroups):
+                rows.append((column, str(i + 1), u"VG_{}".format(i + 1) if column == 'vrrpSyncGroupName' else state,
+                             'OCTETSTR' if column == 'vrrpSyncGroupName' else 'INTEGER'))
+        builder.walk(['KEEPALIVED-MIB::vrrpSyncGroupName', 'KEEPALIVED-MIB::vrrpSyncGroupState'], rows, host=host)
+        entries = []
+        for i in xrange(instances):
+            entries.append((str(i + 1), {
+                'vrrpInstanceName': (u"VI_{}".format(i + 1), 'OCTETSTR'),
+                'vrrpInstanceState': (state, 'INTEGER'),
+                'vrrpInstancePreempt': (u'1', 'INTEGER'),
+                'vrrpInstanceSyncGroup': (u"VG_{}".format(i % syncgroups + 1), 'OCTETSTR')
+            }))
+        names = ['vrrpInstanceName', 'vrrpInstanceState', 'vrrpInstancePreempt', 'vrrpInstanceSyncGroup']
+        rows = [(column, index, values[column][0], values[column][1]) for column in names for index, values in entries]
+        builder.walk(["KEEPALIVED-MIB::" + column for column in names], rows, host=host)
+
+
+# Device sizes, as the arguments of each generator
+sizes = {
+    'tor': {'bgp': [4], 'entity': [60], 'ospf_if': [300], 'arp': [10, 50], 'qos': [4, 4], 'config': [], 'pw': [8],
+            'ospf': [4], 'vss': [], 'vpc': [16], 'ftos_chassis': [1], 'ftos_bgp': [4], 'lag': [4], 'vlt': [],
+            'keepalived': [2]},
+    'chassis': {'bgp': [32], 'entity': [1500], 'ospf_if': [5000], 'arp': [200, 100], 'qos': [48, 8], 'config': [], 'pw': [500],
+                'ospf': [48], 'vss': [], 'vpc': [200], 'ftos_chassis': [12], 'ftos_bgp': [32], 'lag': [48], 'vlt': [],
+                'keepalived': [16]},
+    'rr': {'bgp': [600], 'entity': [150], 'ospf_if': [20000], 'arp': [20, 20], 'qos': [4, 4], 'config': [], 'pw': [50],
+           'ospf': [8], 'vss': [], 'vpc': [4], 'ftos_chassis': [2], 'ftos_bgp': [600], 'lag': [8], 'vlt': [],
+           'keepalived': [4]}
+}
+
+generators = {
+    'bgp': bgp,
+    'entity': entity,
+    'ospf_if': ospf_if,
+    'arp': arp,
+    'qos': qos,
+    'config': config,
+    'pw': pw,
+    'ospf': ospf,
+    'vss': vss,
+    'vpc': vpc,
+    'ftos_chassis': ftos_chassis,
+    'ftos_bgp': ftos_bgp,
+    'lag': lag,
+    'vlt': vlt,
+    'keepalived': keepalived
+}
+
+# The checks run against the fixtures, as (name, generator, script, arguments).
+# Arguments follow the -H of the device, so peer_host can be given as a second host.
+# Not covered is check_oxidized.py, which doesn't use SNMP.
+v3_args = ['-l', 'authPriv', '-u', 'bench', '-a', 'SHA', '-A', 'bench', '-x', 'AES', '-X', 'bench']
+cases = [
+    ('check_bgp', 'bgp', 'check_bgp.py', ['-C', 'public', '--all']),
+    ('check_bgp_peer', 'bgp', 'check_bgp.py', ['-C', 'public', '-p', '10.0.0.1']),
+    ('check_bgp_missing_peer', 'bgp', 'check_bgp.py', ['-C', 'public', '-p', '10.9.9.9']),
+    ('check_ibgp', 'bgp', 'check_ibgp.py', ['-C', 'public']),
+    ('check_keepalived', 'keepalived', 'check_keepalived.py', [peer_host, '-C', 'public']),
+    ('check_config_saved', 'config', 'check_config_saved.py', ['-C', 'public']),
+    ('check_mpls_l2vpn', 'pw', 'check_mpls_l2vpn.py', ['-C', 'public']),
+    ('check_ospf', 'ospf', 'check_ospf.py', ['-C', 'public', '-p', '10.1.0.2']),
+    ('check_ospfv3_if', 'ospf', 'check_ospfv3_if.py', ['-C', 'public', '-i', 'Port-channel1']),
+    ('check_vss_status', 'vss', 'check_vss_status.py', ['-C', 'public']),
+    ('cisco_entity_sensors', 'entity', 'cisco_entity_sensors.py', ['-C', 'public']),
+    ('cisco_vpc', 'vpc', 'cisco_vpc.py', ['-C', 'public']),
+    ('ftos_bgp_peer', 'ftos_bgp', 'ftos_bgp_peer.py', ['-C', 'public', '-p', '10.0.0.1']),
+    ('ftos_chassis', 'ftos_chassis', 'ftos_chassis.py', ['-C', 'public']),
+    ('ftos_ibgp', 'ftos_bgp', 'ftos_ibgp.py', ['-C', 'public']),
+    ('ftos_lag', 'lag', 'ftos_lag.py', ['-C', 'public']),
+    ('ftos_mxl_chassis', 'ftos_chassis', 'ftos_mxl_chassis.py', ['-C', 'public']),
+    ('ftos_vlt', 'vlt', 'ftos_vlt.py', ['-C', 'public']),
+    ('mlnx_entity_sensors', 'entity', 'mlnx_entity_sensors.py', ['-C', 'public']),
+    ('nxos_ospf_if', 'ospf_if', 'nxos_ospf_if.py', v3_args + ['-I', 'Ethernet2/4']),
+    ('nxos_ospf_nei', 'ospf_if', 'nxos_ospf_nei.py', v3_args + ['-p', '10.0.3.2']),
+    ('nxos_ospfv3_if', 'ospf_if', 'nxos_ospfv3_if.py', v3_args + ['-I', 'Ethernet2/4']),
+    ('arp_vlans', 'arp', 'graphite/arp_vlans.py', ['-C', 'public', '-g', '127.0.0.1']),
+    ('cisco_qos', 'qos', 'graphite/cisco_qos.py', ['-C', 'public', '-g', '127.0.0.1'])
+]
+
+
+# Swallow what the graphite scripts send, they always connect to port 2003
+def graphite_sink():
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind(('127.0.0.1', 2003))
+    except socket.error:
+        return False
+    sock.listen(128)
+
+    def drain(conn):
+        while conn.recv(65536):
+            pass
+        conn.close()
+
+    def serve():
+        while True:
+            conn, _ = sock.accept()
+            thread = threading.Thread(target=drain, args=(conn,))
+            thread.daemon = True
+            thread.start()
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    return True
+
+
+# Build the fixture of a generator for a device size
+def build(generator, size, host='bench'):
+    builder = FixtureBuilder(host)
+    generators[generator](builder, *sizes[size][generator])
+    return builder
+
+
+if __name__ == '__main__':
+    import json
+    if len(sys.argv) != 2:
+        print "Usage: {} <directory>".format(sys.argv[0])
+        sys.exit(1)
+    for size in sorted(sizes):
+        for generator in sorted(generators):
+            path = os.path.join(sys.argv[1], "{}-{}.json".format(size, generator))
+            with open(path, 'w') as f:
+                json.dump(build(generator, size).fixture(), f)
+            print path
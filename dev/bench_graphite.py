@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#
+# @descr    Throughput benchmark of sending metrics to a local TCP sink, a connection
+#           per metric against lib.graphite over one persistent connection
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# The sink counts what it receives and optionally sleeps per read to play a slow
+# carbon relay. Reports metrics per second and connects for each way of sending:
+#   dev/bench_graphite.py -n 10000 -b 500 -l 0.01
+#
+
+import argparse
+import os
+import socket
+import sys
+import threading
+from time import sleep, time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.graphite import GraphiteClient, GraphiteSender, GraphiteSpool  # noqa
+
+
+# Argument parsing
+parser = argparse.ArgumentParser(description='Benchmark sending metrics to a local graphite sink')
+parser.add_argument('-n', metavar='<metrics>', type=int, default=5000,
+                    help='Metrics to send per run (default: 5000)')
+parser.add_argument('-b', metavar='<size>', type=int, default=500,
+                    help='Batch size of the persistent client (default: 500)')
+parser.add_argument('-l', metavar='<seconds>', type=float, default=0.0,
+                    help='Latency of the sink per read (default: 0)')
+args = parser.parse_args()
+
+
+# Accepts connections on a random local port and counts the bytes received
+class Sink(object):
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.received = 0
+        self.lock = threading.Lock()
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(128)
+        self.port = self.sock.getsockname()[1]
+        thread = threading.Thread(target=self.accept)
+        thread.daemon = True
+        thread.start()
+
+    def accept(self):
+        while True:
+            conn, _ = self.sock.accept()
+            thread = threading.Thread(target=self.read, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def read(self, conn):
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                break
+            with self.lock:
+                self.received += len(data)
+            if self.latency:
+                sleep(self.latency)
+        conn.close()
+
+    # Wait until nothing more arrives, returns the bytes received in total
+    def settle(self):
+        received = -1
+        while received != self.received:
+            received = self.received
+            sleep(0.05)
+        return received
+
+
+def metric_names(n):
+    return ["qos.router1.GigabitEthernet0_0_{}.POLICY.CLASS{}.cbQosCMPostPolicyByte".format(i // 50, i % 50) for i in xrange(n)]
+
+
+# How the collectors used to send, a new connection per metric
+def send_connection_per_metric(port, names):
+    timestamp = int(time())
+    for name in names:
+        sock = socket.socket()
+        sock.settimeout(5)
+        sock.connect(('127.0.0.1', port))
+        sock.send("%s %d %d\n" % (name, 123456789, timestamp))
+        sock.close()
+    return len(names)
+
+
+def send_client(port, names, protocol, batch_size):
+    graphite = GraphiteClient('127.0.0.1', port, protocol=protocol, batch_size=batch_size)
+    for name in names:
+        graphite.send(name, 123456789)
+    graphite.close()
+    return graphite.connects
+
+
+# The collectors wait for the background sender only when closing it
+def send_sender(port, names, batch_size):
+    graphite = GraphiteSender('127.0.0.1', port, batch_size=batch_size, queue_size=len(names),
+                              spool=GraphiteSpool(os.devnull))
+    for name in names:
+        graphite.send(name, 123456789)
+    graphite.close()
+    return graphite.client.connects
+
+
+# Metrics per second as seen by the collector, until its last write returned
+def run(sink, title, send):
+    before = sink.settle()
+    start = time()
+    connects = send()
+    elapsed = time() - start
+    print "{:28} {:12.0f} {:10d} {:12d}".format(title, args.n / elapsed, connects, sink.settle() - before)
+
+
+sink = Sink(args.l)
+names = metric_names(args.n)
+print "{:28} {:>12} {:>10} {:>12}".format('sender', 'metrics/s', 'connects', 'bytes')
+run(sink, 'connection per metric', lambda: send_connection_per_metric(sink.port, names))
+run(sink, 'persistent, batch 1', lambda: send_client(sink.port, names, 'plaintext', 1))
+run(sink, "persistent, batch {}".format(args.b), lambda: send_client(sink.port, names, 'plaintext', args.b))
+run(sink, "pickle, batch {}".format(args.b), lambda: send_client(sink.port, names, 'pickle', args.b))
+run(sink, "background, batch {}".format(args.b), lambda: send_sender(sink.port, names, args.b))
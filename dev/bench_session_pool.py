@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+#
+# @descr    Benchmark one-shot easysnmp sessions against the pooled sessions in lib.cnh_nm
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# Replays the GET pattern of cisco_entity_sensors.py (three GETs per entity) against
+# a device, preferrably a recorded one served by snmpsimd, e.g:
+#   snmpsimd.py --data-dir=./recordings --agent-udpv4-endpoint=127.0.0.1:1161
+#   dev/bench_session_pool.py -C nexus7k -H 127.0.0.1:1161
+#
+
+import argparse
+import os
+import sys
+from time import time
+from easysnmp import snmp_get
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.cnh_nm import my_snmp_get, my_snmp_walk, snmpresult_to_dict  # noqa
+from lib.cnh_nm import close_snmp_sessions, snmp_session_stats  # noqa
+
+
+# Argument parsing
+parser = argparse.ArgumentParser(description='Benchmark pooled against one-shot SNMP sessions')
+parser.add_argument('-C', metavar='<community>', required=True,
+                    help='SNMP Community')
+parser.add_argument('-H', metavar='<host>', required=True,
+                    help='Host to benchmark against')
+parser.add_argument('-n', metavar='<entities>', type=int, default=0,
+                    help='Limit number of entities (default: all)')
+args = parser.parse_args()
+
+
+oids_per_entity = [
+    'CISCO-ENTITY-FRU-CONTROL-MIB::cefcFRUPowerAdminStatus.{}',
+    'CISCO-ENTITY-FRU-CONTROL-MIB::cefcFRUPowerOperStatus.{}',
+    'CISCO-ENTITY-SENSOR-MIB::entSensorStatus.{}'
+]
+
+
+indexes = list(snmpresult_to_dict(my_snmp_walk(args, 'ENTITY-MIB::entPhysicalClass')))
+if args.n:
+    indexes = indexes[:args.n]
+close_snmp_sessions()
+
+
+# Before: one net-snmp session per request, as the old snmp_get helper did
+oneshot_sessions = 0
+start = time()
+for index in indexes:
+    for oid in oids_per_entity:
+        snmp_get(oid.format(index), hostname=args.H, community=args.C, version=2)
+        oneshot_sessions += 1
+oneshot_time = time() - start
+
+
+# After: the pooled session layer
+created_before = snmp_session_stats['created']
+start = time()
+for index in indexes:
+    for oid in oids_per_entity:
+        my_snmp_get(args, oid.format(index))
+pooled_time = time() - start
+pooled_sessions = snmp_session_stats['created'] - created_before
+
+
+print "Entities: {}, GETs per run: {}".format(len(indexes), len(indexes) * len(oids_per_entity))
+print "one-shot: {} sessions, {:.3f}s".format(oneshot_sessions, oneshot_time)
+print "pooled:   {} sessions, {:.3f}s".format(pooled_sessions, pooled_time)
+if pooled_time > 0:
+    print "speedup:  {:.2f}x".format(oneshot_time / pooled_time)
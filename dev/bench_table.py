@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+#
+# @descr    Memory and time benchmark of snmpresult_to_dict against snmpresult_to_table
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# Builds a synthetic ipNetToPhysicalTable-like walk result of <rows> rows and 3
+# columns, converts it with both functions in separate forked processes, and
+# reports the time taken, the peak and retained memory and the time of a pass
+# over all rows. The walk result is a list, as my_snmp_walk returns it, which is
+# built before the conversion starts and kept alive like the scripts keep their
+# rawdata. Memory is counted from before the walk result is built, so it includes
+# the walk result itself (reported as walk) and is what a check would need.
+#
+
+import argparse
+import gc
+import os
+import resource
+import sys
+from time import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.cnh_nm import snmpresult_to_dict, snmpresult_to_table  # noqa
+try:
+    from easysnmp.variables import SNMPVariable
+except ImportError:
+    from lib.snmp_engine import SnmpVariable as SNMPVariable
+
+
+# Argument parsing
+parser = argparse.ArgumentParser(description='Benchmark walk result representations')
+parser.add_argument('-n', metavar='<rows>', type=int, default=500000,
+                    help='Number of rows (default: 500000)')
+args = parser.parse_args()
+
+
+# Synthetic walk result, column by column as a bulkwalk returns it
+def walk_result(rows):
+    for column, snmp_type in [('ipNetToPhysicalPhysAddress', 'OCTETSTR'), ('ipNetToPhysicalType', 'INTEGER'), ('ipNetToPhysicalState', 'INTEGER')]:
+        for row in xrange(rows):
+            index = u"{}.1.4.10.{}.{}.{}".format(row % 800 + 1, (row >> 16) & 255, (row >> 8) & 255, row & 255)
+            if snmp_type == 'OCTETSTR':
+                value = u"\x00\x1b\x21{}{}{}".format(unichr((row >> 16) & 255), unichr((row >> 8) & 255), unichr(row & 255))
+            else:
+                value = unicode(row % 3 + 3)
+            yield SNMPVariable(column, index, value, snmp_type)
+
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+# Run a benchmark in a forked child, so memory measurements don't affect each other
+def bench(name, convert, count_dynamic):
+    pid = os.fork()
+    if pid:
+        os.waitpid(pid, 0)
+        return
+    gc.collect()
+    rss_before = rss_bytes()
+    rawdata = list(walk_result(args.n))
+    walk_size = rss_bytes() - rss_before
+    start = time()
+    data = convert(rawdata)
+    convert_time = time() - start
+    gc.collect()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - rss_before
+    start = time()
+    dynamic = count_dynamic(data)
+    scan_time = time() - start
+    print "{:7} walk: {:7.1f}MB  convert: {:6.2f}s  peak: {:7.1f}MB  retained: {:7.1f}MB  scan: {:6.3f}s  (dynamic: {})".format(
+        name, walk_size / 1048576.0, convert_time, peak / 1048576.0, (rss_bytes() - rss_before) / 1048576.0, scan_time, dynamic)
+    os._exit(0)
+
+
+print "Rows: {}, columns: 3".format(args.n)
+bench('dict', snmpresult_to_dict,
+      lambda data: sum(1 for row in data.itervalues() if row['ipNetToPhysicalType'].value == u'3'))
+bench('table', snmpresult_to_table,
+      lambda data: sum(1 for value in data.column('ipNetToPhysicalType', int) if value == 3))
+bench('table/r', snmpresult_to_table,
+      lambda data: sum(1 for row in data.itervalues() if row['ipNetToPhysicalType'].value == u'3'))
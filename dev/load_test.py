@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+#
+# @descr    Load test of a monitoring node against a local farm of simulated SNMP agents
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# Starts a farm of lib.snmp_agent agents, each on its own loopback address and
+# serving one of the device sizes of dev/bench_fixtures.py, with the given latency
+# and loss. Then runs a mix of the checks against random agents from a number of
+# workers for a while, and reports throughput, latency percentiles and error rates.
+#   dev/load_test.py -a 50 -w 16 -d 60 -l 0.002 -m check_bgp=4,cisco_entity_sensors=1
+#
+# Needs easysnmp, as the checks talk to the agents over the network. SNMPv3 checks
+# can't be run against the agents, nor checks of the vendor MIBs the fixtures
+# have no numeric OIDs for.
+#
+
+import argparse
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+from time import sleep, time
+
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(basedir)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bench_fixtures  # noqa
+from lib.snmp_agent import SnmpAgent  # noqa
+
+
+# Argument parsing
+parser = argparse.ArgumentParser(description='Load test checks against a local farm of simulated SNMP agents')
+parser.add_argument('-a', metavar='<agents>', type=int, default=20,
+                    help='Number of simulated devices (default: 20)')
+parser.add_argument('-F', metavar='<processes>', type=int, default=4,
+                    help='Processes to run the agents in (default: 4)')
+parser.add_argument('-s', metavar='<size>', action='append', choices=sorted(bench_fixtures.sizes),
+                    help='Device sizes of the agents, given round-robin (default: all)')
+parser.add_argument('-p', metavar='<port>', type=int, default=1161,
+                    help='UDP port of the agents, each has its own address in 127.0.1.0/16 (default: 1161)')
+parser.add_argument('-l', metavar='<seconds>', type=float, default=0.0,
+                    help='Response latency of the agents (default: 0)')
+parser.add_argument('-L', metavar='<ratio>', type=float, default=0.0,
+                    help='Share of requests the agents drop (default: 0)')
+parser.add_argument('-m', metavar='<mix>',
+                    help='Checks to run with their weights, e.g. check_bgp=4,cisco_qos=1 (default: all SNMPv2c checks, equally)')
+parser.add_argument('-w', metavar='<workers>', type=int, default=8,
+                    help='Checks run concurrently (default: 8)')
+parser.add_argument('-d', metavar='<seconds>', type=float, default=60,
+                    help='Duration of the test (default: 60)')
+parser.add_argument('-t', metavar='<seconds>', type=float, default=60,
+                    help='Kill and count checks running longer than this as errors (default: 60)')
+parser.add_argument('-D', metavar='<socket>',
+                    help='Run the checks through cnh_nm_daemon.py listening on this socket')
+args = parser.parse_args()
+
+
+# Checks to run, as (name, script, arguments) with their weights
+cases = dict((name, (script, script_args)) for name, generator, script, script_args in bench_fixtures.cases
+             if '-C' in script_args and not bench_fixtures.build(generator, 'tor').unserved)
+if args.m:
+    mix = []
+    for item in args.m.split(','):
+        name, sep, weight = item.partition('=')
+        if name not in cases:
+            parser.error("Unknown check {}, available: {}".format(name, ', '.join(sorted(cases))))
+        mix += [name] * int(weight or 1)
+else:
+    mix = sorted(cases)
+
+
+def agent_address(i):
+    return "127.0.{}.{}".format(1 + i // 250, 1 + i % 250)
+
+
+# The OID tree of a device of a size, all tables of all generators
+def device_tree(size):
+    tree = {}
+    for generator in bench_fixtures.generators:
+        tree.update(bench_fixtures.build(generator, size).trees.get('', {}))
+    return tree
+
+
+# Run agents in a forked process until it is killed
+def run_farm(agents, trees):
+    pid = os.fork()
+    if pid:
+        return pid
+    try:
+        for i, size in agents:
+            agent = SnmpAgent(trees[size], bind=(agent_address(i), args.p), latency=args.l, loss=args.L)
+            agent.start()
+        while True:
+            sleep(3600)
+    finally:
+        os._exit(0)
+
+
+sizes = sorted(args.s or bench_fixtures.sizes)
+print "Building device trees..."
+trees = dict((size, device_tree(size)) for size in sizes)
+agents = [(i, sizes[i % len(sizes)]) for i in xrange(args.a)]
+farm = [run_farm(agents[n::args.F], trees) for n in xrange(min(args.F, args.a))]
+if any(script.startswith('graphite/') for script, script_args in cases.values()) and not bench_fixtures.graphite_sink():
+    print "Can't listen on port 2003, graphite checks will fail"
+sleep(1)  # Let the agents bind
+
+
+env = dict(os.environ)
+if args.D:
+    env['CNH_NM_DAEMON_SOCKET'] = args.D
+results = []  # (check, size, latency, exit code)
+results_lock = threading.Lock()
+deadline = time() + args.d
+
+
+def worker():
+    while time() < deadline:
+        name = random.choice(mix)
+        script, script_args = cases[name]
+        i, size = random.choice(agents)
+        peer, peer_size = random.choice(agents)  # For checks polling a second device
+        script_args = ["{}:{}".format(agent_address(peer), args.p) if arg == bench_fixtures.peer_host else arg
+                       for arg in script_args]
+        cmd = ['-H', "{}:{}".format(agent_address(i), args.p)] + script_args
+        if args.D:
+            cmd = [sys.executable, os.path.join(basedir, 'cnh_nm_client.py'), script] + cmd
+        else:
+            cmd = [sys.executable, os.path.join(basedir, script)] + cmd
+        start = time()
+        with open(os.devnull, 'w') as devnull:
+            proc = subprocess.Popen(cmd, cwd=basedir, env=env, stdout=devnull, stderr=devnull)
+            while proc.poll() is None:
+                if time() - start > args.t:
+                    proc.kill()
+                    proc.wait()
+                    break
+                sleep(0.005)
+        with results_lock:
+            results.append((name, size, time() - start, proc.returncode))
+
+
+print "Running {} workers against {} agents for {:.0f}s...".format(args.w, args.a, args.d)
+start = time()
+workers = [threading.Thread(target=worker) for i in xrange(args.w)]
+for thread in workers:
+    thread.start()
+try:
+    for thread in workers:
+        thread.join()
+finally:
+    for pid in farm:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+elapsed = time() - start
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+# Exit codes 0-2 are check results, UNKNOWN and anything else (killed, crashed) are errors
+def report(name, runs):
+    latencies = [latency for check, size, latency, rc in runs]
+    errors = len([rc for check, size, latency, rc in runs if rc not in (0, 1, 2)])
+    print "{:28} {:7d} {:9.1f} {:8.1f} {:8.1f} {:8.1f} {:8.1f} {:7.1f}%".format(
+        name, len(runs), 60 * len(runs) / elapsed, 1000 * percentile(latencies, 50), 1000 * percentile(latencies, 90),
+        1000 * percentile(latencies, 99), 1000 * max(latencies), 100.0 * errors / len(runs))
+
+
+print
+print "{:28} {:>7} {:>9} {:>8} {:>8} {:>8} {:>8} {:>8}".format('check', 'runs', 'per min', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'errors')
+for name in sorted(set(check for check, size, latency, rc in results)):
+    for size in sizes:
+        runs = [r for r in results if r[0] == name and r[1] == size]
+        if runs:
+            report("{}/{}".format(name, size), runs)
+if results:
+    report('total', results)
@@ -7,9 +7,10 @@
 
 import sys
 import argparse
-from lib.cnh_nm import STATE_OK, STATE_WARN, STATE_CRIT
-from lib.cnh_nm import snmpresult_to_dict, my_snmp_walk
-from lib.cnh_nm import trigger_not_ok, check_if_ok, ftos_get_peer_ip
+from lib.cnh_nm import STATE_OK, STATE_WARN, STATE_CRIT, STATE_UNKNOWN
+from ipaddress import ip_address
+from lib.cnh_nm import my_snmp_walk, my_snmp_get_many, snmp_oid_encode_ip, snmp_oid_decode_ip
+from lib.cnh_nm import trigger_not_ok, check_if_ok, snmp_perfdata
 
 
 # Argument parsing
@@ -20,60 +21,77 @@ parser.add_argument('-H', metavar='<host>', required=True,
                     help='Host to check')
 parser.add_argument('-p', metavar='<peer>', required=True,
                     help='Peer to check')
+parser.add_argument('-T', metavar='<seconds>', type=int, default=None,
+                    help='Share walk results with other checks of this host for this many seconds')
 args = parser.parse_args()
+try:
+    peer_remote_index = snmp_oid_encode_ip(args.p)
+except ValueError:
+    print "UNKNOWN: Invalid peer {}, -p takes the IP address of a peer".format(args.p)
+    sys.exit(STATE_UNKNOWN)
 
 
-# Get all BGP peers
+# The remote address part of a peer table index, which is instance, local address
+# type, local address length, local address, remote address type, remote address
+# length and remote address
+def get_remote_index(index):
+    parts = index.split('.')
+    try:
+        return '.'.join(parts[3 + int(parts[2]):])
+    except (IndexError, ValueError):
+        return None
+
+
+# The peer table is indexed on instance, local address and remote address, and we only
+# know the remote one. So walk a single column to find the row of the peer by the
+# remote address part of its index, and then get only that row.
+oid_peer_state = 'DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2PeerState'
 oids = [
-    'DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2PeerIdentifier',
-    'DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2PeerState',
     'DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2PeerStatus',
-    'DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2PeerRemoteAddrType',
-    'DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2PeerRemoteAddr',
     'DELL-NETWORKING-BGP4-V2-MIB::dellNetBgpM2PeerRemoteAs'
 ]
-rawdata = my_snmp_walk(args, oids)
-data = snmpresult_to_dict(rawdata)
+peer_index = None
+peer_state = None
+for snmpobj in my_snmp_walk(args, oid_peer_state, cache_ttl=args.T):
+    if get_remote_index(snmpobj.oid_index) == peer_remote_index:
+        peer_index = snmpobj.oid_index
+        peer_state = int(str(snmpobj.value))
+        break
 
+if not peer_index:
+    print "CRITICAL: Cannot find any configured BGP session with peer {}".format(args.p) + snmp_perfdata()
+    sys.exit(STATE_CRIT)
 
-# Now loop over data, and for _iBGP_ check the states
-status = STATE_OK
-statusstr = ''
-peer_as = ""
-peername = ""
-peer_found = False
-for index, peer in data.iteritems():
-    peername = ftos_get_peer_ip(peer['dellNetBgpM2PeerRemoteAddr'], peer['dellNetBgpM2PeerRemoteAddrType'])
-    if peername.lower() != args.p.lower():
-        continue
-    peer_found = True
-    peer_as = "AS" + str(peer['dellNetBgpM2PeerRemoteAs'].value)
+rawdata = my_snmp_get_many(args, ["{}.{}".format(oid, peer_index) for oid in oids])
+peer = dict((oid.split('::', 1)[1], rawdata["{}.{}".format(oid, peer_index)]) for oid in oids)
+if any('NOSUCH' in var.snmp_type for var in peer.itervalues()):  # Removed since the walk
+    print "CRITICAL: Cannot find any configured BGP session with peer {}".format(args.p) + snmp_perfdata()
+    sys.exit(STATE_CRIT)
 
-    bgp_fsm_state = int(str(peer['dellNetBgpM2PeerStatus'].value))
-    if bgp_fsm_state == 1:  # 1=halted, 2=running
-        status, statusstr = trigger_not_ok(
-            status,
-            statusstr,
-            STATE_WARN,
-            "{}({}) BGP Admin down".format(peername, peer_as))
-        break
 
-    peer_state = int(str(peer['dellNetBgpM2PeerState'].value))
-    if peer_state in [1, 2, 3, 4, 5]:  # idle/connect/active/opensent/openconfirm, 6=established
-        status, statusstr = trigger_not_ok(
-            status,
-            statusstr,
-            STATE_CRIT,
-            "{}({}) BGP session down".format(peername, peer_as))
-    break
+# Now check the states
+status = STATE_OK
+statusstr = ''
+peername = ip_address(unicode(snmp_oid_decode_ip(get_remote_index(peer_index)))).compressed
+peer_as = "AS" + str(peer['dellNetBgpM2PeerRemoteAs'].value)
 
-if not peer_found:
-    print "CRITICAL: Cannot find any configured BGP session with peer {}".format(args.p)
-    sys.exit(STATE_CRIT)
+bgp_fsm_state = int(str(peer['dellNetBgpM2PeerStatus'].value))
+if bgp_fsm_state == 1:  # 1=halted, 2=running
+    status, statusstr = trigger_not_ok(
+        status,
+        statusstr,
+        STATE_WARN,
+        "{}({}) BGP Admin down".format(peername, peer_as))
+elif peer_state in [1, 2, 3, 4, 5]:  # idle/connect/active/opensent/openconfirm, 6=established
+    status, statusstr = trigger_not_ok(
+        status,
+        statusstr,
+        STATE_CRIT,
+        "{}({}) BGP session down".format(peername, peer_as))
 
 
 # All checks completed, exiting with the relevant message
 check_if_ok(status, statusstr)
 
-print "OK: BGP session with {}({}) established".format(peername, peer_as)
+print "OK: BGP session with {}({}) established".format(peername, peer_as) + snmp_perfdata()
 sys.exit(STATE_OK)
@@ -8,8 +8,8 @@
 import sys
 import argparse
 from lib.cnh_nm import STATE_OK, STATE_WARN, STATE_CRIT
-from lib.cnh_nm import snmpresult_to_dict, my_snmp_walk, my_snmp_get
-from lib.cnh_nm import trigger_not_ok, check_if_ok
+from lib.cnh_nm import snmpresult_to_dict, my_snmp_walk, my_snmp_get_many
+from lib.cnh_nm import trigger_not_ok, check_if_ok, snmp_perfdata
 
 
 # Argument parsing
@@ -40,13 +40,15 @@ oids = [
 ]
 rawdata = my_snmp_walk(args, oids)
 data = snmpresult_to_dict(rawdata)
+oid_t_ifdescr = 'IF-MIB::ifDescr.{}'
+lag_names = my_snmp_get_many(args, [oid_t_ifdescr.format(lag['dot3aAggCfgIfIndex'].value) for lag in data.itervalues()])
 
 
 # Loop through them and check num ports vs num active ports and operational status
 status = STATE_OK
 statusstr = ""
 for index, lag in data.iteritems():
-    lag_name = my_snmp_get(args, 'IF-MIB::ifDescr.{}'.format(lag['dot3aAggCfgIfIndex'].value)).value
+    lag_name = lag_names[oid_t_ifdescr.format(lag['dot3aAggCfgIfIndex'].value)].value
 
     num_ports = int(str(lag['dot3aAggCfgNumPorts'].value))
     if num_ports < 1:
@@ -84,5 +86,5 @@ for index, lag in data.iteritems():
 # All done, check status and exit
 check_if_ok(status, statusstr)
 
-print "OK: All port-channels is ok"
+print "OK: All port-channels is ok" + snmp_perfdata()
 sys.exit(STATE_OK)
@@ -8,8 +8,8 @@
 import sys
 import argparse
 from lib.cnh_nm import STATE_OK, STATE_CRIT, STATE_WARN
-from lib.cnh_nm import trigger_not_ok, check_if_ok, my_snmp_get, my_snmp_walk, my_snmp_get_int
-from lib.cnh_nm import dell_parse_snmp_uptime, snmpresult_to_dict
+from lib.cnh_nm import trigger_not_ok, check_if_ok, my_snmp_get, my_snmp_walk, my_snmp_get_many
+from lib.cnh_nm import dell_parse_snmp_uptime, snmpresult_to_dict, snmp_perfdata
 
 # Argument parsing
 parser = argparse.ArgumentParser(description='Check FTOS environmental status')
@@ -39,11 +39,12 @@ oid_mgmt_status = 'DELL-NETWORKING-CHASSIS-MIB::dellNetStackUnitMgmtStatus.{}'
 oid_num_psus = 'DELL-NETWORKING-CHASSIS-MIB::dellNetStackUnitNumPowerSupplies.{}'
 oid_num_fans = 'DELL-NETWORKING-CHASSIS-MIB::dellNetStackUnitNumFanTrays.{}'
 
-# Does not work with symbolic oids in easysnmp (but it does work with commandline snmpget)
-oid_psu_oper = '.1.3.6.1.4.1.6027.3.26.1.4.6.1.4.2.{}.{}'  # dellNetPowerSupplyOperStatus
-oid_fans_oper = '.1.3.6.1.4.1.6027.3.26.1.4.7.1.4.2.{}.{}'  # dellNetFanTrayOperStatus
-oid_mem_usage = '.1.3.6.1.4.1.6027.3.26.1.4.4.1.6.2.{}.1'  # dellNetCpuUtilMemUsage
-oid_cpu_usage = '.1.3.6.1.4.1.6027.3.26.1.4.4.1.4.2.{}.1'  # dellNetCpuUtil1Min
+# Indexed by unit type (2=stack unit), unit and PSU/fan tray/CPU. Sent numeric
+# through lib/oids.py or net-snmp, as easysnmp can't parse them symbolically.
+oid_psu_oper = 'DELL-NETWORKING-CHASSIS-MIB::dellNetPowerSupplyOperStatus.2.{}.{}'
+oid_fans_oper = 'DELL-NETWORKING-CHASSIS-MIB::dellNetFanTrayOperStatus.2.{}.{}'
+oid_mem_usage = 'DELL-NETWORKING-CHASSIS-MIB::dellNetCpuUtilMemUsage.2.{}.1'
+oid_cpu_usage = 'DELL-NETWORKING-CHASSIS-MIB::dellNetCpuUtil1Min.2.{}.1'
 
 # Oids for devices with older firmware
 f10_oid_stack_num_units = 'F10-M-SERIES-CHASSIS-MIB::chNumStackUnits.0'
@@ -80,10 +81,37 @@ raw_stackunit_status = my_snmp_walk(args, oids_stack_status)
 status = STATE_OK
 statusstr = ""
 stackunit_status = snmpresult_to_dict(raw_stackunit_status)
+
+
+# Fetch the per stack-unit values for all units in one go
+unit_oids = []
+for index in stackunit_status:
+    unit_oids.append(oid_mgmt_status.format(index))
+    unit_oids.append(oid_num_psus.format(index))
+    unit_oids.append(oid_num_fans.format(index))
+    if not f10:
+        unit_oids.append(oid_cpu_usage.format(index))
+        unit_oids.append(oid_mem_usage.format(index))
+unit_data = my_snmp_get_many(args, unit_oids)
+
+# And then the PSU and fan statuses of all units
+num_psus = {}
+num_fans = {}
+oper_oids = []
+for index in stackunit_status:
+    num_psus[index] = int(str(unit_data[oid_num_psus.format(index)].value))
+    num_fans[index] = int(str(unit_data[oid_num_fans.format(index)].value))
+    for psu_id in xrange(1, num_psus[index] + 1):
+        oper_oids.append(oid_psu_oper.format(index, psu_id))
+    for fan_id in xrange(1, num_fans[index] + 1):
+        oper_oids.append(oid_fans_oper.format(index, fan_id))
+oper_data = my_snmp_get_many(args, oper_oids)
+
+
 num_mgmt_units = 0
 for index, su in stackunit_status.iteritems():
 
-    mgmt_status = my_snmp_get(args, oid_mgmt_status.format(index))
+    mgmt_status = unit_data[oid_mgmt_status.format(index)]
     if mgmt_status.value == u'1':
         num_mgmt_units += 1
 
@@ -145,9 +173,8 @@ for index, su in stackunit_status.iteritems():
                 'Stack-unit {} uptime less than {} seconds!'.format(index, uptime_warn))
 
     # Power supplys
-    num_psus = my_snmp_get_int(args, oid_num_psus.format(index))
-    for psu_id in xrange(1, num_psus + 1):
-        psu_oper_status = my_snmp_get_int(args, oid_psu_oper.format(index, psu_id))
+    for psu_id in xrange(1, num_psus[index] + 1):
+        psu_oper_status = int(str(oper_data[oid_psu_oper.format(index, psu_id)].value))
         if psu_oper_status == 2:  # down
             status, statusstr = trigger_not_ok(
                 status,
@@ -162,9 +189,8 @@ for index, su in stackunit_status.iteritems():
                 'Stack-unit {} PSU {} absent'.format(index, psu_id))
 
     # Fans
-    num_fans = my_snmp_get_int(args, oid_num_fans.format(index))
-    for fan_id in xrange(1, num_fans + 1):
-        fan_oper_status = my_snmp_get_int(args, oid_fans_oper.format(index, fan_id))
+    for fan_id in xrange(1, num_fans[index] + 1):
+        fan_oper_status = int(str(oper_data[oid_fans_oper.format(index, fan_id)].value))
         if fan_oper_status == 2:  # down
             status, statusstr = trigger_not_ok(
                 status,
@@ -180,7 +206,7 @@ for index, su in stackunit_status.iteritems():
 
     # CPU Usage
     if not f10:
-        cpu_usage = my_snmp_get_int(args, oid_cpu_usage.format(index))
+        cpu_usage = int(str(unit_data[oid_cpu_usage.format(index)].value))
         if cpu_usage > cpu_usage_crit_percent:
             status, statusstr = trigger_not_ok(
                 status,
@@ -196,7 +222,7 @@ for index, su in stackunit_status.iteritems():
 
     # MEM Usage
     if not f10:
-        mem_usage = my_snmp_get_int(args, oid_mem_usage.format(index))
+        mem_usage = int(str(unit_data[oid_mem_usage.format(index)].value))
         if mem_usage > mem_usage_crit_percent:
             status, statusstr = trigger_not_ok(
                 status,
@@ -225,5 +251,5 @@ elif num_mgmt_units > 1:
 
 check_if_ok(status, statusstr)
 
-print "OK: Switch is healthy"
+print "OK: Switch is healthy" + snmp_perfdata()
 sys.exit(STATE_OK)
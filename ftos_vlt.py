@@ -9,7 +9,7 @@ import sys
 import argparse
 from lib.cnh_nm import STATE_OK, STATE_CRIT
 from lib.cnh_nm import trigger_not_ok, check_if_ok, my_snmp_walk
-from lib.cnh_nm import snmpresult_to_dict
+from lib.cnh_nm import snmpresult_to_dict, snmp_perfdata
 
 # Argument parsing
 parser = argparse.ArgumentParser(description='Check FTOS environmental status')
@@ -32,7 +32,7 @@ oids = [
 # Check if we can do anything useful against this switch
 res = my_snmp_walk(args, vlt_detection_oid)
 if not res or not res[0] or res[0].value in [u'NOSUCHOBJECT', u'NOSUCHINSTANCE']:
-    print "OK: Either switch doesn't support the VLT MIB, or it doesn't run VLT."
+    print "OK: Either switch doesn't support the VLT MIB, or it doesn't run VLT." + snmp_perfdata()
     sys.exit(STATE_OK)
 
 
@@ -96,5 +96,5 @@ for index, vltdomain in data.iteritems():
 
 check_if_ok(status, statusstr)
 
-print "OK: VLT and ICL status good"
+print "OK: VLT and ICL status good" + snmp_perfdata()
 sys.exit(STATE_OK)
@@ -4,50 +4,131 @@
 #
 # @author   Johan Hedberg <jh@citynetwork.se>
 #
+# Polls a single device with -H, or all devices of an inventory file with -f,
+# a host and optionally its community per line (-C is the community of the hosts
+# without one):
+#   graphite/arp_vlans.py -C public -g graphite.example.net -f /etc/cnh_nm/l3_switches
+# Devices are polled by a pool of -w worker processes (easysnmp holds the GIL
+# during requests, so threads wouldn't overlap), and all metrics are sent over
+# one carbon connection together with the poll time, failure and SNMP work of
+# every device under <CNH_NM_STATS_PREFIX>.arp_vlans.<host>.
+#
 
 import argparse
 import os
 import sys
+from collections import defaultdict
+from multiprocessing import Pool
 from time import time
-from socket import socket
 
 sys.path.append(os.path.dirname('..'))
 
-from lib.cnh_nm import my_snmp_walk, snmpresult_to_dict  # noqa
-
-
-def send_metrics(name, value):
-    global args
-    sock = socket()
-    sock.settimeout(5)
-    sock.connect( (args.g, 2003) )
-    sock.send("%s %d %d\n" % (name, value, int(time())))
-    sock.close()
+from lib import cnh_nm  # noqa
+from lib.cnh_nm import my_snmp_walk, STATE_OK, STATE_UNKNOWN  # noqa
+from lib.graphite import GraphiteSender  # noqa
 
 
 # Argument parsing
 parser = argparse.ArgumentParser(description='Output per-vlan ARP table size in graphite format')
-parser.add_argument('-C', metavar='<community>', required=True,
-                    help='SNMP Community')
-parser.add_argument('-H', metavar='<host>', required=True,
-                    help='Host to check')
+parser.add_argument('-C', metavar='<community>',
+                    help='SNMP Community, with -f the default for hosts without one')
+hosts = parser.add_mutually_exclusive_group(required=True)
+hosts.add_argument('-H', metavar='<host>',
+                   help='Host to check')
+hosts.add_argument('-f', metavar='<file>',
+                   help='Inventory file of hosts to check, one per line with an optional community')
+parser.add_argument('-w', metavar='<workers>', type=int, default=16,
+                    help='Devices polled at the same time with -f (default: 16)')
 parser.add_argument('-g', metavar='<host>', required=True,
                     help='Graphite host')
+parser.add_argument('-P', metavar='<protocol>', choices=['plaintext', 'pickle'], default='plaintext',
+                    help='Graphite protocol, plaintext (port 2003) or pickle (port 2004) (default: plaintext)')
 args = parser.parse_args()
+if args.H and not args.C:
+    parser.error('argument -C is required with -H')
+
+
+# A single walk of the whole neighbor table, counted per ifIndex and address type
+# (1 = IPv4/ARP, 2 = IPv6/ND) as the rows come by. Returns [(metric, value)]
+def poll(device_args):
+    rawdata = my_snmp_walk(device_args, ['IF-MIB::ifDescr', 'IP-MIB::ipNetToPhysicalType'])
+    vlans = dict()  # ifIndex -> vlan
+    counts = defaultdict(int)  # (ifIndex, address type) -> dynamic entries
+    for snmpobj in rawdata:
+        if snmpobj.oid == 'ipNetToPhysicalType':
+            if snmpobj.value == '3':  # dynamic
+                if_index, address_type, address = snmpobj.oid_index.split('.', 2)
+                counts[(if_index, address_type)] += 1
+        elif snmpobj.oid == 'ifDescr' and snmpobj.value.lower().startswith('vlan'):
+            vlans[snmpobj.oid_index] = snmpobj.value.split(" ")[1]
+
+    metrics = list()
+    for if_index, vlan in vlans.iteritems():
+        metrics.append(("arp.{}.vlan.{}".format(device_args.H, vlan), counts[(if_index, '1')]))
+        metrics.append(("nd.{}.vlan.{}".format(device_args.H, vlan), counts[(if_index, '2')]))
+    return metrics
+
+
+# Poll a device of the inventory in a worker process, returns (host, metrics, poll
+# time, error or None, SNMP counters)
+def poll_device(device):
+    host, community = device
+    if community is None:
+        return host, list(), 0.0, "no SNMP community in the inventory or -C", {}
+    device_args = argparse.Namespace(**vars(args))
+    device_args.H = host
+    device_args.C = community
+    cnh_nm.snmp_restart_clock()
+    try:
+        metrics = poll(device_args)
+        error = None
+    except Exception as err:
+        metrics = list()
+        error = "{}: {}".format(type(err).__name__, err)
+    return host, metrics, time() - cnh_nm.snmp_start_time, error, cnh_nm.snmp_stats.pop(host, {})
+
+
+def read_inventory(path):
+    devices = list()
+    with open(path, 'r') as f:
+        for line in f:
+            fields = line.split('#', 1)[0].split()
+            if fields:
+                devices.append((fields[0], fields[1] if len(fields) > 1 else args.C))
+    return devices
+
+
+if args.H:
+    metrics = poll(args)
+    graphite = GraphiteSender(args.g, protocol=args.P)
+    for name, value in metrics:
+        graphite.send(name, value)
+    graphite.close()
+    sys.exit(STATE_OK)
+
 
+# The workers are forked before the sender starts its thread
+devices = read_inventory(args.f)
+cnh_nm.snmp_errors_fatal = False
+pool = Pool(max(1, min(args.w, len(devices))))
+graphite = GraphiteSender(args.g, protocol=args.P)
+start = time()
+failed = list()
+for host, metrics, poll_time, error, snmp_counts in pool.imap_unordered(poll_device, devices):
+    for name, value in metrics:
+        graphite.send(name, value)
+    stats_prefix = "{}.arp_vlans.{}".format(cnh_nm.snmp_stats_prefix, host)
+    graphite.send(stats_prefix + '.poll_time', round(poll_time, 3))
+    graphite.send(stats_prefix + '.failed', int(error is not None))
+    for counter, value in sorted(snmp_counts.iteritems()):
+        graphite.send("{}.{}".format(stats_prefix, counter), value)
+    cnh_nm.snmp_stats_count(host, **snmp_counts)
+    if error is not None:
+        failed.append("{} ({})".format(host, error))
+pool.close()
+pool.join()
+graphite.close()
 
-rawdata = my_snmp_walk(args, 'IF-MIB::ifDescr')
-data = snmpresult_to_dict(rawdata)
-
-for if_index, if_data in data.iteritems():
-    if if_data['ifDescr'].value.lower().startswith('vlan'):
-        vlan_rawdata = my_snmp_walk(args, 'IP-MIB::ipNetToPhysicalType.{}.1'.format(if_index), True)
-        vlan_data = snmpresult_to_dict(vlan_rawdata)
-        cnt = 0
-        for vl_index, vl_data in vlan_data.iteritems():
-            if vl_data['ipNetToPhysicalType'].value == 'dynamic':
-                cnt += 1
-        send_metrics(
-            "arp.{}.vlan.{}".format(args.H, if_data['ifDescr'].value.split(" ")[1]),
-            cnt
-        )
+if failed:
+    print "UNKNOWN: {} of {} devices failed in {:.1f}s: {}".format(len(failed), len(devices), time() - start, ', '.join(sorted(failed)))
+    sys.exit(STATE_UNKNOWN)
@@ -8,21 +8,14 @@
 import argparse
 import os
 import sys
+from hashlib import sha1
+from itertools import izip
 from time import time
-from socket import socket
 
 sys.path.append(os.path.dirname('..'))
 
-from lib.cnh_nm import my_snmp_walk, my_snmp_get  # noqa
-
-
-def send_metrics(name, value):
-    global args
-    sock = socket()
-    sock.settimeout(5)
-    sock.connect( (args.g, 2003) )
-    sock.send("%s %d %d\n" % (name, value, int(time())))
-    sock.close()
+from lib.cnh_nm import my_snmp_walk, my_snmp_get, read_state, write_state  # noqa
+from lib.graphite import GraphiteSender  # noqa
 
 
 # Argument parsing
@@ -33,80 +26,162 @@ parser.add_argument('-H', metavar='<host>', required=True,
                     help='Host to check')
 parser.add_argument('-g', metavar='<host>', required=True,
                     help='Graphite host')
+parser.add_argument('-P', metavar='<protocol>', choices=['plaintext', 'pickle'], default='plaintext',
+                    help='Graphite protocol, plaintext (port 2003) or pickle (port 2004) (default: plaintext)')
+parser.add_argument('-T', metavar='<seconds>', type=int, default=3600,
+                    help='Reuse the QoS topology this long, while the device has not rebooted or changed policies (default: 3600, 0 disables)')
 args = parser.parse_args()
+graphite = GraphiteSender(args.g, protocol=args.P)
 
-bulk_oids = [
+# The policy-map, class-map and interface structure only changes when a service
+# policy is edited. It is cached and reused as long as sysUpTime hasn't gone back
+# and the counter rows are the same, so most runs only walk the counters.
+# Every column is walked as a whole and joined here, so the number of round trips
+# doesn't grow with the number of service policies.
+topology_oids = [
     'CISCO-CLASS-BASED-QOS-MIB::cbQosCMName',
     'CISCO-CLASS-BASED-QOS-MIB::cbQosPolicyMapName',
     'CISCO-CLASS-BASED-QOS-MIB::cbQosIfIndex',
-    'CISCO-CLASS-BASED-QOS-MIB::cbQosCMDropByte',
-    'CISCO-CLASS-BASED-QOS-MIB::cbQosCMPrePolicyByte',
-    'CISCO-CLASS-BASED-QOS-MIB::cbQosCMPostPolicyByte'
+    'CISCO-CLASS-BASED-QOS-MIB::cbQosIfType',
+    'CISCO-CLASS-BASED-QOS-MIB::cbQosConfigIndex',
+    'IF-MIB::ifDescr'
 ]
-QOS_IFTYPE_OID = 'CISCO-CLASS-BASED-QOS-MIB::cbQosIfType'
-QOS_CONFIG_INDEX_OID = 'CISCO-CLASS-BASED-QOS-MIB::cbQosConfigIndex'
-
-
-rawdata = my_snmp_walk(args, bulk_oids)
-policy_maps = dict()  # policy-map index -> policy-map name
-class_maps = dict()  # class-map index -> class-map name
-qos_interfaces = list()  # qos ifIndex -> IF-MIB ifIndex
-cmstats = dict()  # <interface>: {<qos_ifindex>: {<statsname>: <value>} }
-qos_config_index_mapping = dict()
-
-# Parse the first bulkwalk into the above datastructures
-for snmpobj in rawdata:
-    if snmpobj.oid == 'cbQosCMName':
-        class_maps[snmpobj.oid_index] = snmpobj.value
-    elif snmpobj.oid == 'cbQosPolicyMapName':
-        policy_maps[snmpobj.oid_index] = snmpobj.value
-    elif snmpobj.oid == 'cbQosIfIndex':
-        iftype = my_snmp_get(args, "{}.{}".format(QOS_IFTYPE_OID, snmpobj.oid_index))
-        if iftype.value != '5':  # control-plane auto-copp
-            policy_map_id = my_snmp_get(args, "{}.{}.{}".format(QOS_CONFIG_INDEX_OID, snmpobj.oid_index, snmpobj.oid_index))
-            qos_interfaces.append({
-                'qos_ifindex': snmpobj.oid_index,
-                'ifmib_ifindex': snmpobj.value,
-                'policy_map_id': policy_map_id.value
-            })
-            config_indexes = my_snmp_walk(args, "{}.{}".format(QOS_CONFIG_INDEX_OID, snmpobj.oid_index))
-            for ci in config_indexes:
-                index_parts = ci.oid_index.split(".")
-                if index_parts[0] not in qos_config_index_mapping:
-                    qos_config_index_mapping[index_parts[0]] = dict()
-                qos_config_index_mapping[index_parts[0]][index_parts[1]] = ci.value
-    elif snmpobj.oid.startswith('cbQosCM') and snmpobj.oid != 'cbQosCMName':
-        index_parts = snmpobj.oid_index.split(".")
-        iface = index_parts[0]
-        qos_ifindex = index_parts[1]
-        if iface not in cmstats:
-            cmstats[iface] = dict()
-        if qos_ifindex not in cmstats[iface]:
-            cmstats[iface][qos_ifindex] = dict()
-        if snmpobj.oid not in cmstats[iface][qos_ifindex]:
-            cmstats[iface][qos_ifindex][snmpobj.oid] = snmpobj.value
-
-
-# Generating graphite output
-for qos_interface in qos_interfaces:
-    ifmib_name = my_snmp_get(args, 'IF-MIB::ifDescr.{}'.format(qos_interface['ifmib_ifindex']))
-    policy_map_name = policy_maps[qos_interface['policy_map_id']]
-    for qcim_index, qcim_value in qos_config_index_mapping[qos_interface['qos_ifindex']].iteritems():
-        if qcim_value in class_maps:
-            if qcim_index not in cmstats[qos_interface['qos_ifindex']]:
-                continue  # class-default doesn't have any policy stats
-            for statsname, statsvalue in cmstats[qos_interface['qos_ifindex']][qcim_index].iteritems():
-                send_metrics(
-                    "qos.{}.{}.{}.{}.{}".format(
-                        args.H,  # hostname
-                        ifmib_name.value.replace('/', '_'),  # interface name
-                        policy_map_name,  # policy-map name
-                        class_maps[qcim_value],  # class-map name
-                        statsname  # Key for the value
-                    ),
-                    int(statsvalue)  # The value
-                )
+# The high-capacity counters, devices without them fall back to the 32-bit ones
+# which wrap within seconds at 10G. Metrics keep the names of the 32-bit columns.
+counter_names = ['cbQosCMDropByte', 'cbQosCMPrePolicyByte', 'cbQosCMPostPolicyByte']
+counter_oids = {
+    64: ["CISCO-CLASS-BASED-QOS-MIB::{}64".format(name) for name in counter_names],
+    32: ["CISCO-CLASS-BASED-QOS-MIB::{}".format(name) for name in counter_names]
+}
+
+
+# Parse the counters, <qos_ifindex>: {<object index>: {<statsname>: <value>} }
+def parse_counters(rawdata):
+    cmstats = dict()
+    for snmpobj in rawdata:
+        if snmpobj.oid.startswith('cbQosCM') and snmpobj.oid != 'cbQosCMName':
+            statsname = snmpobj.oid[:-2] if snmpobj.oid.endswith('64') else snmpobj.oid
+            index_parts = snmpobj.oid_index.split(".")
+            iface = index_parts[0]
+            qos_ifindex = index_parts[1]
+            if iface not in cmstats:
+                cmstats[iface] = dict()
+            if qos_ifindex not in cmstats[iface]:
+                cmstats[iface][qos_ifindex] = dict()
+            if statsname not in cmstats[iface][qos_ifindex]:
+                cmstats[iface][qos_ifindex][statsname] = int(snmpobj.value)
+    return cmstats
+
+
+# The counter rows are one per class-map of each service policy, so they change
+# with the structure of cbQosObjectsTable
+def fingerprint(cmstats):
+    rows = sorted("{}.{}".format(iface, qos_ifindex) for iface in cmstats for qos_ifindex in cmstats[iface])
+    return sha1(' '.join(rows)).hexdigest()
+
+
+# Parse the topology into series of [qos ifIndex, object index, metric prefix]
+def parse_topology(rawdata):
+    policy_maps = dict()  # policy-map index -> policy-map name
+    class_maps = dict()  # class-map index -> class-map name
+    qos_ifindexes = dict()  # qos ifIndex -> IF-MIB ifIndex
+    qos_iftypes = dict()  # qos ifIndex -> cbQosIfType
+    qos_config_index_mapping = dict()  # qos ifIndex -> {object index: config index}
+    if_descr = dict()  # IF-MIB ifIndex -> interface name
+    for snmpobj in rawdata:
+        if snmpobj.oid == 'cbQosCMName':
+            class_maps[snmpobj.oid_index] = snmpobj.value
+        elif snmpobj.oid == 'cbQosPolicyMapName':
+            policy_maps[snmpobj.oid_index] = snmpobj.value
+        elif snmpobj.oid == 'cbQosIfIndex':
+            qos_ifindexes[snmpobj.oid_index] = snmpobj.value
+        elif snmpobj.oid == 'cbQosIfType':
+            qos_iftypes[snmpobj.oid_index] = snmpobj.value
+        elif snmpobj.oid == 'cbQosConfigIndex':
+            index_parts = snmpobj.oid_index.split(".")
+            if index_parts[0] not in qos_config_index_mapping:
+                qos_config_index_mapping[index_parts[0]] = dict()
+            qos_config_index_mapping[index_parts[0]][index_parts[1]] = snmpobj.value
+        elif snmpobj.oid == 'ifDescr':
+            if_descr[snmpobj.oid_index] = snmpobj.value
+
+    series = list()
+    for qos_ifindex, ifmib_ifindex in qos_ifindexes.iteritems():
+        if qos_iftypes.get(qos_ifindex) == '5':  # control-plane auto-copp
+            continue
+        config_indexes = qos_config_index_mapping[qos_ifindex]
+        policy_map_name = policy_maps[config_indexes[qos_ifindex]]
+        for qcim_index, qcim_value in config_indexes.iteritems():
+            if qcim_value in class_maps:
+                series.append([qos_ifindex, qcim_index, "qos.{}.{}.{}.{}".format(
+                    args.H,  # hostname
+                    if_descr[ifmib_ifindex].replace('/', '_'),  # interface name
+                    policy_map_name,  # policy-map name
+                    class_maps[qcim_value]  # class-map name
+                )])
             # If we later want to get per-police-statement data we will have to use qcim_index
             # and check cbQosParentObjectsIndex and walk the entries which has a corresponding
             # cbQosObjectsType set to INTEGER: police(7), then bulkwalk
             # cbQosPolice(Conformed|Violated|Exceeded)BitRate to get the data
+    return sorted(series)
+
+
+# The counters of all series as one vector, None where a series has no stats
+def counter_vector(series, cmstats):
+    return [cmstats.get(qos_ifindex, {}).get(qcim_index, {}).get(name)
+            for qos_ifindex, qcim_index, prefix in series for name in counter_names]
+
+
+# Per-second rates of all counters since the previous sample. A counter that went
+# back has wrapped if it is 32-bit, a 64-bit one has been cleared.
+def counter_rates(values, previous, seconds, bits):
+    modulo = 2 ** bits
+    return [None if value is None or last is None or (value < last and bits == 64)
+            else float((value - last) % modulo) / seconds
+            for value, last in izip(values, previous)]
+
+
+uptime = int(my_snmp_get(args, 'SNMPv2-MIB::sysUpTime.0').value)
+topology = read_state('cisco_qos', args.H) if args.T > 0 else None
+if topology and 'bits' in topology and time() - topology['time'] < args.T and topology['uptime'] <= uptime:
+    cmstats = parse_counters(my_snmp_walk(args, counter_oids[topology['bits']]))
+    if fingerprint(cmstats) != topology['fingerprint']:
+        topology = None
+else:
+    topology = None
+
+if topology is None:
+    rawdata = my_snmp_walk(args, topology_oids + counter_oids[64])
+    cmstats = parse_counters(rawdata)
+    bits = 64
+    if not cmstats:
+        cmstats = parse_counters(my_snmp_walk(args, counter_oids[32]))
+        bits = 32
+    topology = {'time': time(), 'uptime': uptime, 'fingerprint': fingerprint(cmstats), 'bits': bits,
+                'series': parse_topology(rawdata)}
+    if args.T > 0:
+        write_state('cisco_qos', args.H, topology)
+
+
+# Rates against the previous sample, timed by sysUpTime (hundredths of a second) so
+# they don't depend on when the poll got scheduled. A sysUpTime that went back means
+# the device rebooted, the counters start over then.
+values = counter_vector(topology['series'], cmstats)
+rates = [None] * len(values)
+previous = read_state('cisco_qos_counters', args.H)
+if previous and previous['fingerprint'] == topology['fingerprint'] and previous['bits'] == topology['bits'] \
+        and previous['uptime'] < uptime:
+    rates = counter_rates(values, previous['values'], (uptime - previous['uptime']) / 100.0, topology['bits'])
+write_state('cisco_qos_counters', args.H, {'uptime': uptime, 'fingerprint': topology['fingerprint'],
+                                           'bits': topology['bits'], 'values': values})
+
+
+# Generating graphite output, class-default doesn't have any policy stats
+names = ["{}.{}".format(prefix, name) for qos_ifindex, qcim_index, prefix in topology['series'] for name in counter_names]
+for name, value, rate in izip(names, values, rates):
+    if value is not None:
+        graphite.send(name, value)
+    if rate is not None:
+        graphite.send(name + 'Rate', round(rate, 3))
+
+graphite.close()
@@ -5,13 +5,50 @@
 # @author   Johan Hedberg <jh@citynetwork.se>
 #
 
+import atexit
+import ctypes
+import fcntl
+import gc
+import json
+import os
+import select
 import sys
+from array import array
 from collections import defaultdict
-from easysnmp import snmp_get, snmp_bulkwalk, EasySNMPConnectionError, EasySNMPTimeoutError
+from ConfigParser import Error as ConfigParserError, RawConfigParser
+from contextlib import contextmanager
+from copy import copy
+from datetime import datetime
+from hashlib import sha1
+from itertools import groupby, izip
+from operator import attrgetter
 from struct import unpack
-from time import mktime
+from tempfile import gettempdir, mkstemp
+from time import mktime, sleep, time
 from dateutil.parser import parse
 from ipaddress import ip_address
+from lib.snmp_engine import SnmpEngine, SnmpBulkWalk, SnmpVariable
+from lib.snmp_replay import SnmpFixture, ReplaySession, RecordingSession, ReplayEngine, RecordingEngine
+try:
+    from easysnmp import Session, EasySNMPError, EasySNMPConnectionError, EasySNMPTimeoutError
+    from easysnmp.variables import SNMPVariable
+except ImportError:  # Only good for replaying fixtures, see lib/snmp_replay.py
+    Session = None
+    SNMPVariable = SnmpVariable
+
+    class EasySNMPError(Exception):
+        pass
+
+    class EasySNMPConnectionError(EasySNMPError):
+        pass
+
+    class EasySNMPTimeoutError(EasySNMPError):
+        pass
+try:
+    from lib.oids import OIDS as snmp_oid_table, COLUMNS as snmp_column_table
+except ImportError:  # Not compiled, see lib/oid_compiler.py
+    snmp_oid_table = {}
+    snmp_column_table = {}
 
 # Nagios states
 STATE_OK = 0
@@ -27,26 +64,1056 @@ status_txt_mapper = {
 }
 
 
-# Handle (or rather not handle) SNMP errors
+# Handle (or rather not handle) SNMP errors. When a deadline is set, running out
+# of time is reported in the deadline state, or in a worse one the check already
+# gave trigger_not_ok.
 def snmp_err(err):
-    global STATE_UNKNOWN
-    print "UNKNOWN: SNMP Error: {0}".format(err)
-    sys.exit(STATE_UNKNOWN)
+    global STATE_UNKNOWN, snmp_deadline, snmp_partial_result, snmp_errors_fatal
+    if not snmp_errors_fatal:
+        raise err
+    if snmp_deadline is None or (not isinstance(err, SnmpDeadlineExceeded) and time() < snmp_deadline - snmp_min_timeout):
+        print "UNKNOWN: SNMP Error: {0}{1}".format(err, snmp_perfdata())
+        sys.exit(STATE_UNKNOWN)
+    snmp_deadline_exit(err, *snmp_partial_result)
+
+
+# Report the findings of a check cut short by the deadline, in the deadline state
+# unless they are worse
+def snmp_deadline_exit(err, status, statusstr):
+    global snmp_deadline, snmp_deadline_state, snmp_deadline_stats, snmp_start_time
+    if status in (STATE_OK, STATE_UNKNOWN):
+        status = snmp_deadline_state
+    reason = "Deadline of {:.1f}s exceeded after {} SNMP requests ({})".format(
+        snmp_deadline - snmp_start_time, snmp_deadline_stats['requests'], err)
+    if statusstr:
+        reason += ", partial results: " + statusstr.rstrip(",")
+    print "{}: {}{}".format(status_txt_mapper[status], reason, snmp_perfdata())
+    sys.exit(status)
+
+
+# Scripts polling many devices in one run clear this, SNMP errors are then raised
+# to them instead of ending the run
+snmp_errors_fatal = True
+
+
+# Raised instead of sending a request when there is no time left before the deadline.
+# A walk cut short carries the varbinds it got so far.
+class SnmpDeadlineExceeded(EasySNMPTimeoutError):
+    def __init__(self, message, result=None):
+        super(SnmpDeadlineExceeded, self).__init__(message)
+        self.result = result if result is not None else []
+
+
+# Optional deadline for the whole check run, in seconds from start, set through
+# CNH_NM_DEADLINE or set_snmp_deadline(). The time left is divided among the
+# requests still to be made by shortening the timeout (and retries) of each one.
+snmp_start_time = time()
+snmp_timeout = 1.0  # net-snmp defaults
+snmp_retries = 3
+snmp_min_timeout = 0.2
+snmp_deadline = None
+snmp_deadline_requests = None  # Expected number of requests, if the check knows it
+snmp_deadline_state = STATE_WARN if os.environ.get('CNH_NM_DEADLINE_STATE', '').lower().startswith('warn') else STATE_UNKNOWN
+snmp_deadline_stats = {
+    'requests': 0
+}
+snmp_partial_result = [STATE_OK, '']  # Last status and status text given to trigger_not_ok
+snmp_partial_walk = None  # SnmpDeadlineExceeded of the first walk returned cut short
+if os.environ.get('CNH_NM_DEADLINE'):
+    snmp_deadline = snmp_start_time + float(os.environ['CNH_NM_DEADLINE'])
+
+
+# Set the deadline, optionally with the number of requests the check expects to make
+def set_snmp_deadline(seconds, requests=None):
+    global snmp_deadline, snmp_deadline_requests, snmp_start_time
+    snmp_deadline = snmp_start_time + seconds
+    snmp_deadline_requests = requests
+
+
+# Timeout and retries for the next request. Without a known number of requests
+# left, half of the remaining time is kept for whatever comes after this one.
+def snmp_request_timeout():
+    global snmp_deadline, snmp_deadline_requests, snmp_deadline_stats, snmp_timeout, snmp_retries, snmp_min_timeout
+    snmp_deadline_stats['requests'] += 1
+    if snmp_deadline is None:
+        return snmp_timeout, snmp_retries
+    remaining = snmp_deadline - time()
+    if remaining < snmp_min_timeout:
+        raise SnmpDeadlineExceeded("no time left for request")
+    if snmp_deadline_requests:
+        budget = remaining / max(1, snmp_deadline_requests - snmp_deadline_stats['requests'] + 1)
+    else:
+        budget = remaining / 2
+    budget = max(budget, snmp_min_timeout)
+    timeout = min(snmp_timeout, budget / (snmp_retries + 1))
+    timeout = max(snmp_min_timeout, int(timeout * 10) / 10.0)  # In steps of 0.1s, so sessions can be reused
+    retries = min(snmp_retries, max(0, int(budget / timeout) - 1))
+    return timeout, retries
+
+
+# Start the clock of a new check run, for cnh_nm_daemon.py which runs many checks
+# after a single import. A deadline from the environment moves along.
+def snmp_restart_clock():
+    global snmp_start_time, snmp_deadline, snmp_partial_result, snmp_partial_walk
+    now = time()
+    if snmp_deadline is not None:
+        snmp_deadline += now - snmp_start_time
+    snmp_start_time = now
+    snmp_partial_result = [STATE_OK, '']
+    snmp_partial_walk = None
+
+
+# Opt-in profiling of the whole check run, CNH_NM_PROFILE=cprofile|tracemalloc|wall.
+# The result is written at exit to a file per run in CNH_NM_PROFILE_DIR. Where
+# tracemalloc isn't available (Python 2) object counts and peak RSS are written.
+# Wall mode records spans of the SNMP requests and of what checks wrap in profile_span.
+profile_mode = os.environ.get('CNH_NM_PROFILE', '').lower()
+profile_dir = os.environ.get('CNH_NM_PROFILE_DIR', os.path.join(gettempdir(), 'cnh_nm_profile'))
+profile_spans = []  # (start offset, duration, name, detail)
+profile_max_spans = 100000
+
+
+# Time a block of code in wall mode, e.g. with profile_span('route lookup', nei_ip):
+@contextmanager
+def profile_span(name, detail=''):
+    global profile_mode, profile_spans, snmp_start_time
+    if profile_mode != 'wall':
+        yield
+        return
+    start = time()
+    try:
+        yield
+    finally:
+        if len(profile_spans) < profile_max_spans:
+            profile_spans.append((start - snmp_start_time, time() - start, name, detail))
+
+
+def profile_path(extension):
+    global profile_dir
+    if not os.path.isdir(profile_dir):
+        try:
+            os.makedirs(profile_dir, 0700)
+        except OSError:
+            pass  # Created by someone else in the meantime
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0] or 'python'
+    return os.path.join(profile_dir, "{}-{}-{}.{}".format(script, datetime.now().strftime('%Y%m%d-%H%M%S'), os.getpid(), extension))
+
+
+def profile_write_wall():
+    global profile_spans, snmp_start_time
+    total = time() - snmp_start_time
+    summary = {}
+    for offset, duration, name, detail in profile_spans:
+        count, spent, longest = summary.get(name, (0, 0.0, 0.0))
+        summary[name] = (count + 1, spent + duration, max(longest, duration))
+    with open(profile_path('wall'), 'w') as f:
+        f.write("# {}\n# total {:.3f}s\n\n".format(' '.join(sys.argv), total))
+        f.write("{:32} {:>8} {:>10} {:>10} {:>6}\n".format('span', 'count', 'total s', 'max s', '%'))
+        for name, (count, spent, longest) in sorted(summary.iteritems(), key=lambda item: -item[1][1]):
+            f.write("{:32} {:8d} {:10.3f} {:10.3f} {:6.1f}\n".format(name, count, spent, longest, 100 * spent / total if total else 0))
+        f.write("\n{:>10} {:>10}  span\n".format('start s', 'duration s'))
+        for offset, duration, name, detail in profile_spans:
+            f.write("{:10.4f} {:10.4f}  {} {}\n".format(offset, duration, name, detail))
+
+
+def profile_write_memory(tracemalloc):
+    with open(profile_path('mem'), 'w') as f:
+        f.write("# {}\n".format(' '.join(sys.argv)))
+        if tracemalloc is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            f.write("# traced current {} bytes, peak {} bytes\n\n".format(current, peak))
+            for stat in tracemalloc.take_snapshot().statistics('lineno')[:50]:
+                f.write("{}\n".format(stat))
+            return
+        import resource
+        f.write("# peak RSS {} kB (tracemalloc not available)\n\n".format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+        counts = defaultdict(int)
+        for obj in gc.get_objects():
+            counts[type(obj).__name__] += 1
+        for name, count in sorted(counts.iteritems(), key=lambda item: -item[1])[:50]:
+            f.write("{:10d} {}\n".format(count, name))
+
+
+# Start profiling in the given mode, writing the result at exit
+def profile_start(mode):
+    global profile_mode
+    profile_mode = mode
+    if mode == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def write_cprofile():
+            profiler.disable()
+            profiler.dump_stats(profile_path('prof'))
+        atexit.register(write_cprofile)
+    elif mode == 'tracemalloc':
+        try:
+            import tracemalloc
+            tracemalloc.start(25)
+        except ImportError:
+            tracemalloc = None
+        atexit.register(profile_write_memory, tracemalloc)
+    elif mode == 'wall':
+        atexit.register(profile_write_wall)
+
+
+if profile_mode:
+    profile_start(profile_mode)
+
+
+# Largest SNMP message we expect agents to accept, and rough estimates of the encoded
+# size of a PDU without varbinds and of a single varbind in a response
+snmp_max_msg_size = 1472
+snmp_pdu_overhead = 64
+snmp_varbind_size = 48
+
+# Walk results can be shared between check processes for the same device through
+# a file cache, disabled unless a TTL (seconds) is given per call or in the environment
+walk_cache_dir = os.environ.get('CNH_NM_CACHE_DIR', os.path.join(gettempdir(), 'cnh_nm_cache'))
+walk_cache_ttl = int(os.environ.get('CNH_NM_WALK_CACHE_TTL', 0))
+
+# With the compiled OID table net-snmp doesn't have to load any MIBs, this has to be
+# decided before the first session is opened. Note that use_sprint_value output of
+# enumerations and textual conventions needs the MIBs.
+snmp_no_mibs = os.environ.get('CNH_NM_NO_MIBS', '0') == '1' and bool(snmp_oid_table)
+if snmp_no_mibs:
+    os.environ['MIBS'] = ''
+    os.environ['MIBDIRS'] = ''
+
+# Counters of the SNMP work done by this run, per host. Through easysnmp the PDUs
+# of walks and the bytes are estimates, retries are only the ones we can see
+# (timeouts and tooBig). Added to the output as perfdata with CNH_NM_PERFDATA=1,
+# and written as graphite lines to CNH_NM_STATS_FILE when set.
+snmp_stats = {}
+snmp_stats_counters = ['get_pdus', 'bulk_pdus', 'varbinds', 'bytes', 'retries', 'snmp_time']
+snmp_perfdata_enabled = os.environ.get('CNH_NM_PERFDATA', '0') == '1'
+snmp_stats_prefix = os.environ.get('CNH_NM_STATS_PREFIX', 'cnh_nm')
+
+
+def snmp_stats_count(host, **counts):
+    global snmp_stats, snmp_stats_counters
+    if host not in snmp_stats:
+        snmp_stats[host] = dict.fromkeys(snmp_stats_counters, 0)
+    for counter, value in counts.iteritems():
+        snmp_stats[host][counter] += value
+
+
+# Add the counters of a lib.snmp_engine.SnmpEngine after running it
+def snmp_stats_add_engine(engine):
+    for host, counts in engine.stats.iteritems():
+        snmp_stats_count(host, **counts)
+
+
+# Rough size of the response PDUs carrying a list of variables
+def snmp_estimate_bytes(result, pdus):
+    global snmp_pdu_overhead
+    size = pdus * snmp_pdu_overhead
+    for var in result:
+        size += len(var.oid) + len(var.oid_index or '') + len(var.value or '') + 8
+    return size
+
+
+# Totals over all hosts, with the time not spent in SNMP or the limiter as python_time
+def snmp_stats_totals():
+    global snmp_stats, snmp_stats_counters, snmp_start_time, snmp_limiter_stats
+    totals = dict.fromkeys(snmp_stats_counters, 0)
+    for counts in snmp_stats.itervalues():
+        for counter, value in counts.iteritems():
+            totals[counter] += value
+    totals['limiter_wait'] = snmp_limiter_stats['slot_wait'] + snmp_limiter_stats['rate_wait']
+    totals['python_time'] = max(0.0, time() - snmp_start_time - totals['snmp_time'] - totals['limiter_wait'])
+    return totals
+
+
+# Perfdata to append to the check output, empty unless enabled
+def snmp_perfdata():
+    global snmp_perfdata_enabled
+    if not snmp_perfdata_enabled:
+        return ""
+    totals = snmp_stats_totals()
+    return " | get_pdus={get_pdus} bulk_pdus={bulk_pdus} varbinds={varbinds} bytes={bytes}B retries={retries} snmp_time={snmp_time:.3f}s python_time={python_time:.3f}s limiter_wait={limiter_wait:.3f}s".format(**totals)
+
+
+# Write the counters of this run per host as graphite plaintext lines
+def snmp_stats_write():
+    global snmp_stats, snmp_stats_prefix
+    path = os.environ.get('CNH_NM_STATS_FILE')
+    if not path or not snmp_stats:
+        return
+    prefix = snmp_stats_prefix
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    now = int(time())
+    lines = []
+    for host, counts in snmp_stats.iteritems():
+        for counter, value in sorted(counts.iteritems()):
+            lines.append("{}.{}.{}.{} {} {}\n".format(prefix, script, host, counter, value, now))
+    python_time = snmp_stats_totals()['python_time']
+    lines.append("{}.{}.python_time {} {}\n".format(prefix, script, python_time, now))
+    with open(path, 'a') as f:
+        f.write(''.join(lines))
+
+
+atexit.register(snmp_stats_write)
+
+
+# Responses can be recorded into a fixture file, or replayed from one instead of
+# talking to the device (optionally with a latency per PDU), see lib/snmp_replay.py
+snmp_record_file = os.environ.get('CNH_NM_RECORD')
+snmp_replay_file = os.environ.get('CNH_NM_REPLAY')
+snmp_replay_latency = float(os.environ.get('CNH_NM_REPLAY_LATENCY', 0))
+snmp_fixture = None
+
+
+def snmp_get_fixture():
+    global snmp_fixture, snmp_record_file, snmp_replay_file
+    if snmp_fixture is None:
+        snmp_fixture = SnmpFixture(snmp_replay_file or snmp_record_file)
+        if snmp_record_file and not snmp_replay_file:
+            atexit.register(snmp_fixture.save)
+    return snmp_fixture
+
+
+# Pool of open SNMP sessions, keyed by (host, version, credentials, context, sprint)
+# and reused for the lifetime of the process instead of one session per request
+snmp_session_pool = {}
+snmp_session_stats = {
+    'created': 0,
+    'reused': 0
+}
+
+
+# Build the session pool key for a set of arguments
+def snmp_session_key(args, version=2, context="", use_sprint_value=False, timeout=None):
+    return (args.H, version, snmp_credentials(args, version), context, use_sprint_value, timeout)
+
+
+def snmp_credentials(args, version=2):
+    if version == 3:
+        return (args.l, args.u, args.a, args.A, args.x, args.X)
+    return (args.C,)
+
+
+# Get a pooled SNMP session, opening it on first use. Sessions are also keyed on
+# their timeout and retries, which shrink as a deadline comes closer.
+def get_snmp_session(args, version=2, context="", use_sprint_value=False):
+    global snmp_session_pool, snmp_session_stats, snmp_no_mibs, snmp_replay_file, snmp_replay_latency, snmp_record_file
+    timeout, retries = snmp_request_timeout()
+    key = snmp_session_key(args, version, context, use_sprint_value, (timeout, retries))
+    session = snmp_session_pool.get(key)
+    if session is not None:
+        snmp_session_stats['reused'] += 1
+        return session
+    if snmp_replay_file:
+        session = ReplaySession(snmp_get_fixture(), args.H, context, snmp_replay_latency, retries)
+    elif version == 3:
+        session = Session(hostname=args.H, security_level=args.l, security_username=args.u, auth_protocol=args.a, auth_password=args.A, privacy_protocol=args.x, privacy_password=args.X, context=context, version=3, use_sprint_value=use_sprint_value, use_numeric=snmp_no_mibs, timeout=timeout, retries=retries)
+    else:
+        session = Session(hostname=args.H, community=args.C, version=2, use_sprint_value=use_sprint_value, use_numeric=snmp_no_mibs, timeout=timeout, retries=retries)
+    if snmp_record_file and not snmp_replay_file:
+        session = RecordingSession(session, snmp_get_fixture(), context, snmp_numeric_oid, snmp_name_vars)
+    snmp_session_pool[key] = session
+    snmp_session_stats['created'] += 1
+    return session
+
+
+# Drop all pooled sessions (net-snmp closes them when they are garbage collected)
+def close_snmp_sessions():
+    global snmp_session_pool
+    snmp_session_pool.clear()
+
+
+# Per-device limits on concurrent requests and PDUs/second, shared by all check
+# processes through lock files. Configured per host in an INI file, e.g.
+#   [DEFAULT]
+#   concurrency = 4
+#   [core1.example.net]
+#   concurrency = 2
+#   rate = 20
+#   burst = 40
+# Hosts without any limits configured are not limited at all.
+snmp_limits_file = os.environ.get('CNH_NM_LIMITS', '/etc/cnh_nm/limits.ini')
+snmp_limits_dir = os.path.join(walk_cache_dir, 'limits')
+snmp_limiter_timeout = float(os.environ.get('CNH_NM_LIMITER_TIMEOUT', 30))  # Seconds to wait for a slot
+snmp_limits = {}  # host -> (concurrency, rate, burst), parsed on first use
+snmp_limiter_stats = {
+    'requests': 0,
+    'waits': 0,
+    'slot_wait': 0.0,
+    'rate_wait': 0.0
+}
+
+
+# Limits for a host as (concurrency, rate, burst), 0 meaning unlimited. A limits
+# file that can't be parsed leaves the host unlimited rather than failing the check.
+def snmp_host_limits(host):
+    global snmp_limits, snmp_limits_file
+    if host not in snmp_limits:
+        config = RawConfigParser({'concurrency': '0', 'rate': '0', 'burst': '0'})
+        try:
+            config.read(snmp_limits_file)
+            section = host if config.has_section(host) else 'DEFAULT'
+            concurrency = config.getint(section, 'concurrency')
+            rate = config.getfloat(section, 'rate')
+            burst = config.getfloat(section, 'burst') or max(1.0, rate)
+        except (ConfigParserError, ValueError):
+            concurrency, rate, burst = 0, 0.0, 1.0
+        snmp_limits[host] = (concurrency, rate, burst)
+    return snmp_limits[host]
+
+
+def snmp_limits_path(host, suffix):
+    global snmp_limits_dir
+    if not os.path.isdir(snmp_limits_dir):
+        try:
+            os.makedirs(snmp_limits_dir, 0700)
+        except OSError:
+            pass  # Created by someone else in the meantime
+    return os.path.join(snmp_limits_dir, "{}.{}".format(host.replace('/', '_'), suffix))
+
+
+# Raised when none of the concurrency slots of a host frees up in time, a connection
+# error so the walk and get wrappers hand it to snmp_err
+class SnmpLimiterBusy(EasySNMPConnectionError):
+    pass
+
+
+# Take one of the concurrency slots of a host, polling them all until one is free.
+# Returns the open slot file, the slot is released when it is closed (or we die).
+# Gives up after snmp_limiter_timeout seconds, or when only the time for a request
+# is left before the deadline. Returns None, running unlimited, when the slot files
+# can't be opened.
+def snmp_limiter_acquire_slot(host, concurrency):
+    global snmp_limiter_timeout, snmp_deadline, snmp_min_timeout
+    start = time()
+    give_up = start + snmp_limiter_timeout
+    if snmp_deadline is not None:
+        give_up = min(give_up, snmp_deadline - snmp_min_timeout)
+    delay = 0.005
+    while True:
+        for slot in xrange(concurrency):
+            try:
+                slotfile = open(snmp_limits_path(host, "slot{}".format(slot)), 'a')
+            except IOError:
+                return None
+            try:
+                fcntl.flock(slotfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slotfile
+            except IOError:
+                slotfile.close()
+        now = time()
+        if now >= give_up:
+            raise SnmpLimiterBusy("limiter busy, all {} slots of {} taken for {:.1f}s".format(concurrency, host, now - start))
+        sleep(min(delay, give_up - now))
+        delay = min(delay * 2, 0.1)
+
+
+# Take PDUs from the token bucket of a host, returns how long to wait before sending.
+# The bucket may go negative, whoever takes tokens from it then waits for the debt.
+# Without a bucket file there is no limit.
+def snmp_limiter_take_tokens(host, rate, burst, pdus):
+    try:
+        bucketfile = open(snmp_limits_path(host, 'bucket'), 'a+')
+    except IOError:
+        return 0.0
+    with bucketfile:
+        fcntl.flock(bucketfile, fcntl.LOCK_EX)
+        try:
+            bucketfile.seek(0)
+            now = time()
+            try:
+                tokens, last = [float(field) for field in bucketfile.read().split()]
+                tokens = min(burst, tokens + (now - last) * rate)
+            except ValueError:
+                tokens = burst
+            tokens -= pdus
+            bucketfile.seek(0)
+            bucketfile.truncate()
+            bucketfile.write("{!r} {!r}\n".format(tokens, now))
+        finally:
+            fcntl.flock(bucketfile, fcntl.LOCK_UN)
+    return max(0.0, -tokens / rate)
+
+
+# Hold a concurrency slot of a host and pay for one PDU while sending requests to it.
+# More PDUs, like those of a bulkwalk, can be paid for afterwards with snmp_limiter_charge.
+@contextmanager
+def snmp_limiter(host):
+    global snmp_limiter_stats
+    concurrency, rate, burst = snmp_host_limits(host)
+    snmp_limiter_stats['requests'] += 1
+    slotfile = None
+    if concurrency > 0:
+        start = time()
+        slotfile = snmp_limiter_acquire_slot(host, concurrency)
+        waited = time() - start
+        if waited > 0.001:
+            snmp_limiter_stats['waits'] += 1
+            snmp_limiter_stats['slot_wait'] += waited
+    try:
+        if rate > 0:
+            wait = snmp_limiter_take_tokens(host, rate, burst, 1)
+            if wait > 0:
+                snmp_limiter_stats['waits'] += 1
+                snmp_limiter_stats['rate_wait'] += wait
+                sleep(wait)
+        yield
+    finally:
+        if slotfile is not None:
+            slotfile.close()
+
+
+# Pay for PDUs sent beyond the first one, the next request to the host waits for them
+def snmp_limiter_charge(host, pdus):
+    concurrency, rate, burst = snmp_host_limits(host)
+    if rate > 0 and pdus > 0:
+        snmp_limiter_take_tokens(host, rate, burst, pdus)
+
+
+# Time spent waiting in the limiter, appended to CNH_NM_LIMITER_LOG when set
+def snmp_limiter_log():
+    global snmp_limiter_stats
+    path = os.environ.get('CNH_NM_LIMITER_LOG')
+    if not path or not snmp_limiter_stats['requests']:
+        return
+    with open(path, 'a') as f:
+        f.write("{} {} requests={} waits={} slot_wait={:.3f} rate_wait={:.3f}\n".format(
+            int(time()), os.path.basename(sys.argv[0]), snmp_limiter_stats['requests'], snmp_limiter_stats['waits'],
+            snmp_limiter_stats['slot_wait'], snmp_limiter_stats['rate_wait']))
+
+
+atexit.register(snmp_limiter_log)
+
+
+# GETBULK max_repetitions is learned per host and kept in a profile between runs.
+# It grows while walks need several PDUs per column and the agent keeps up, and is
+# halved on timeouts. A tooBig answer also caps it for snmp_bulk_ceiling_ttl seconds.
+snmp_bulk_profiles_dir = os.path.join(walk_cache_dir, 'profiles')
+snmp_bulk_default_repetitions = 10
+snmp_bulk_max_repetitions = int(os.environ.get('CNH_NM_MAX_REPETITIONS', 200))
+snmp_bulk_ceiling_ttl = 86400
+snmp_bulk_profiles = {}
+
+
+def snmp_bulk_profile_path(host):
+    global snmp_bulk_profiles_dir
+    return os.path.join(snmp_bulk_profiles_dir, host.replace('/', '_'))
+
+
+# Bulk profile of a host, as stored by the last run that walked it
+def snmp_bulk_profile(host):
+    global snmp_bulk_profiles, snmp_bulk_default_repetitions, snmp_bulk_max_repetitions, snmp_bulk_ceiling_ttl
+    if host not in snmp_bulk_profiles:
+        try:
+            with open(snmp_bulk_profile_path(host), 'r') as f:
+                profile = json.load(f)
+        except (IOError, OSError, ValueError):
+            profile = {}
+        if time() - profile.get('toobig', 0) > snmp_bulk_ceiling_ttl:
+            profile['ceiling'] = snmp_bulk_max_repetitions
+        profile.setdefault('max_repetitions', snmp_bulk_default_repetitions)
+        profile.setdefault('varbind_time', None)
+        profile['max_repetitions'] = max(1, min(profile['max_repetitions'], profile['ceiling']))
+        snmp_bulk_profiles[host] = profile
+    return snmp_bulk_profiles[host]
+
+
+def snmp_bulk_profile_write(host, profile):
+    global snmp_bulk_profiles_dir
+    if not os.path.isdir(snmp_bulk_profiles_dir):
+        try:
+            os.makedirs(snmp_bulk_profiles_dir, 0700)
+        except OSError:
+            pass  # Created by someone else in the meantime
+    try:
+        fd, tmppath = mkstemp(dir=snmp_bulk_profiles_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(profile, f)
+        os.rename(tmppath, snmp_bulk_profile_path(host))
+    except (IOError, OSError):
+        pass  # Learning is best effort
+
+
+# Back off after a timeout, or after a tooBig which also caps max_repetitions for a while
+def snmp_bulk_backoff(host, profile, toobig):
+    profile['max_repetitions'] = max(1, profile['max_repetitions'] // 2)
+    if toobig:
+        profile['ceiling'] = profile['max_repetitions']
+        profile['toobig'] = time()
+    snmp_bulk_profile_write(host, profile)
+
+
+# Learn from a successful walk. Only walks where a column needed more than one PDU
+# tell us anything, max_repetitions is then doubled unless the time per varbind got
+# noticeably worse than usual, which means the agent is struggling with large PDUs.
+def snmp_bulk_learn(host, profile, num_oids, num_varbinds, elapsed):
+    max_repetitions = profile['max_repetitions']
+    if num_varbinds <= max_repetitions * num_oids:
+        return
+    varbind_time = elapsed / num_varbinds
+    if profile['varbind_time'] is None:
+        profile['varbind_time'] = varbind_time
+    if varbind_time > 1.5 * profile['varbind_time']:
+        profile['max_repetitions'] = max(1, max_repetitions * 3 // 4)
+    else:
+        profile['max_repetitions'] = min(profile['ceiling'], max_repetitions * 2)
+    profile['varbind_time'] = 0.7 * profile['varbind_time'] + 0.3 * varbind_time
+    snmp_bulk_profile_write(host, profile)
+
+
+# Translate a symbolic OID (MIB::name[.index]) to numeric through the compiled OID table,
+# OIDs that aren't in it are left for net-snmp to translate
+def snmp_numeric_oid(oid):
+    global snmp_oid_table
+    if '::' not in oid:
+        return oid
+    mib, name = oid.split('::', 1)
+    name, sep, index = name.partition('.')
+    numeric = snmp_oid_table.get("{}::{}".format(mib, name))
+    if numeric is None:
+        return oid
+    return numeric + sep + index
+
+
+# Translate a symbolic OID to numeric with net-snmp's own parser, through the MIBs
+# easysnmp has loaded. None if it can't be translated, or net-snmp can't be reached.
+def snmp_netsnmp_oid(oid):
+    global snmp_netsnmp, snmp_netsnmp_oids
+    if oid not in snmp_netsnmp_oids:
+        if snmp_netsnmp is None:
+            snmp_netsnmp = snmp_netsnmp_load()
+        numeric = None
+        if snmp_netsnmp:
+            objid = (ctypes.c_ulong * 128)()
+            length = ctypes.c_size_t(len(objid))
+            if snmp_netsnmp.read_objid(str(oid), objid, ctypes.byref(length)):
+                numeric = '.' + '.'.join(str(objid[i]) for i in xrange(length.value))
+        snmp_netsnmp_oids[oid] = numeric
+    return snmp_netsnmp_oids[oid]
+
+
+# The net-snmp library of easysnmp, looked up through its extension module so it
+# is the one easysnmp initialized even when the wheel bundles its own copy
+def snmp_netsnmp_load():
+    try:
+        from easysnmp import interface
+        netsnmp = ctypes.CDLL(interface.__file__)
+        netsnmp.read_objid.argtypes = [ctypes.c_char_p, ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_size_t)]
+        netsnmp.read_objid.restype = ctypes.c_int
+    except (ImportError, OSError, AttributeError):
+        return False
+    return netsnmp
+
+
+snmp_netsnmp = None  # Loaded on first use, False if not available
+snmp_netsnmp_oids = {}
+
+
+# Put column name and index back on variables that came back with numeric OIDs
+def snmp_name_vars(snmpresult):
+    global snmp_column_table
+    for var in snmpresult:
+        oid = var.oid
+        if oid.startswith('iso'):
+            oid = '.1' + oid[3:]
+        if not oid.startswith('.'):
+            continue  # Already translated by net-snmp
+        if var.oid_index:
+            oid = "{}.{}".format(oid, var.oid_index)
+        parts = oid.split('.')
+        for length in xrange(len(parts) - 1, 1, -1):
+            name = snmp_column_table.get('.'.join(parts[:length]))
+            if name is not None:
+                var.oid = name
+                var.oid_index = '.'.join(parts[length:])
+                break
+    return snmpresult
+
+
+# OIDs to request on a session, translated through the compiled OID table. Instances
+# it doesn't have are translated by net-snmp's parser like the command line tools
+# do, easysnmp fails on some symbolic ones (DELL-NETWORKING-CHASSIS-MIB). Fixture
+# sessions get them as the script gave them, so fixtures recorded with and without
+# lib/oids.py are keyed the same.
+def snmp_session_oids(session, oids):
+    if isinstance(session, (ReplaySession, RecordingSession)):
+        return list(oids)
+    numeric_oids = []
+    for oid in oids:
+        numeric_oid = snmp_numeric_oid(oid)
+        if not numeric_oid.startswith('.') and '.' in oid.split('::', 1)[-1]:
+            numeric_oid = snmp_netsnmp_oid(oid) or numeric_oid
+        numeric_oids.append(numeric_oid)
+    return numeric_oids
+
+
+# Get one or more OIDs on a session, translating OIDs through the compiled OID table
+def snmp_session_get(session, oids):
+    single = isinstance(oids, basestring)
+    if single:
+        oids = [oids]
+    with snmp_limiter(session.hostname), profile_span('snmp get', "{} {}".format(session.hostname, ' '.join(oids))):
+        start = time()
+        try:
+            result = session.get(snmp_session_oids(session, oids))
+        except EasySNMPTimeoutError:
+            snmp_stats_count(session.hostname, get_pdus=1, retries=session.retries, snmp_time=time() - start)
+            raise
+    snmp_stats_count(session.hostname, get_pdus=1, varbinds=len(result), bytes=snmp_estimate_bytes(result, 1),
+                     snmp_time=time() - start)
+    if single:
+        return snmp_name_vars(result)[0]
+    return snmp_name_vars(result)
+
+
+# Full numeric OID of a varbind, or None if net-snmp named it symbolically
+def snmp_var_numeric_oid(var):
+    oid = var.oid
+    if oid.startswith('iso'):
+        oid = '.1' + oid[3:]
+    if not oid.startswith('.'):
+        return None
+    if var.oid_index:
+        oid = "{}.{}".format(oid, var.oid_index)
+    return oid
+
+
+# Names of the objects below a numeric OID in the compiled OID table
+def snmp_subtree_columns(numeric_oid):
+    global snmp_column_table, snmp_subtree_columns_cache
+    if numeric_oid not in snmp_subtree_columns_cache:
+        prefix = numeric_oid + '.'
+        snmp_subtree_columns_cache[numeric_oid] = set(name for oid, name in snmp_column_table.iteritems() if oid.startswith(prefix))
+    return snmp_subtree_columns_cache[numeric_oid]
+
+
+snmp_subtree_columns_cache = {}
+
+
+# Whether a varbind returned for a walk of oid (numeric_oid once translated) is
+# still within the subtree walked. Columns of a table walked by name are looked up
+# in the compiled OID table, or else translated by net-snmp within the table's MIB.
+def snmp_in_subtree(oid, numeric_oid, var):
+    if var.snmp_type == 'ENDOFMIBVIEW':
+        return False
+    var_oid = snmp_var_numeric_oid(var)
+    if var_oid is not None:
+        return var_oid.startswith(numeric_oid + '.')
+    mib, sep, name = oid.rpartition('::')
+    column, sep, oid_index = name.partition('.')
+    if var.oid == column:
+        return not oid_index or var.oid_index == oid_index or var.oid_index.startswith(oid_index + '.')
+    if oid_index or not numeric_oid.startswith('.'):
+        return False
+    if var.oid in snmp_subtree_columns(numeric_oid):
+        return True
+    column_oid = snmp_netsnmp_oid("{}::{}".format(mib, var.oid)) if mib else None
+    return column_oid is not None and column_oid.startswith(numeric_oid + '.')
+
+
+# Numeric OID to start a walk from, translated by net-snmp when the compiled OID
+# table doesn't have it
+def snmp_walk_root(oid, numeric_oid):
+    if numeric_oid.startswith('.') or '::' not in oid:
+        return numeric_oid
+    return snmp_netsnmp_oid(oid) or numeric_oid
+
+
+# Walks are done a GETBULK at a time when a deadline is set, so it can be checked
+# between the PDUs. Where the subtree ends is told from the names of the varbinds,
+# which takes the numeric OID of tables (compiled or from net-snmp) for anything
+# but columns walked by name. Recordings are walked by net-snmp in one go.
+def snmp_walk_stepwise(session, oids, numeric_oids):
+    global snmp_deadline, snmp_no_mibs
+    if snmp_deadline is None or isinstance(session, RecordingSession):
+        return False
+    if isinstance(session, ReplaySession):
+        return True
+    for oid, numeric_oid in zip(oids, numeric_oids):
+        if numeric_oid.startswith('.'):
+            continue
+        column = oid.split('::', 1)[-1].split('.', 1)[0]
+        if snmp_no_mibs or column.startswith('.'):
+            return False
+        if (column.endswith('Table') or column.endswith('Entry')) and not snmp_walk_root(oid, numeric_oid).startswith('.'):
+            return False
+    return True
+
+
+# The GETBULK responses of a walk, a list of varbinds within the subtrees per PDU
+def snmp_bulkwalk_pdus(session, oids, numeric_oids, max_repetitions):
+    if isinstance(session, ReplaySession):
+        for varbinds in session.bulkwalk_pdus(numeric_oids, max_repetitions=max_repetitions):
+            yield varbinds
+        return
+    for oid, numeric_oid in zip(oids, numeric_oids):
+        numeric_oid = snmp_walk_root(oid, numeric_oid)
+        request = numeric_oid
+        while True:
+            varbinds = session.get_bulk([request], 0, max_repetitions)
+            in_subtree = []
+            for var in varbinds:
+                if not snmp_in_subtree(oid, numeric_oid, var):
+                    break
+                in_subtree.append(var)
+            yield in_subtree
+            if not in_subtree or len(in_subtree) < len(varbinds):
+                break
+            last = in_subtree[-1]
+            request = snmp_var_numeric_oid(last)
+            if request is None:
+                request = "{}.{}".format(last.oid, last.oid_index)
+                if '::' in oid:
+                    request = "{}::{}".format(oid.split('::', 1)[0], request)
+
+
+# Bulkwalk a PDU at a time, raising SnmpDeadlineExceeded when the deadline comes
+# before the walk is done. Returns the varbinds and the number of PDUs.
+def snmp_bulkwalk_stepwise(session, oids, numeric_oids, max_repetitions):
+    global snmp_deadline, snmp_min_timeout
+    host = session.hostname
+    pdus = snmp_bulkwalk_pdus(session, oids, numeric_oids, max_repetitions)
+    result = []
+    count = 0
+    start = time()
+    while True:
+        if time() > snmp_deadline - snmp_min_timeout:
+            snmp_stats_count(host, bulk_pdus=count, varbinds=len(result), bytes=snmp_estimate_bytes(result, count), snmp_time=time() - start)
+            raise SnmpDeadlineExceeded("walk of {} cut short after {} PDUs".format(' '.join(oids), count), result)
+        try:
+            varbinds = next(pdus)
+        except StopIteration:
+            break
+        result += varbinds
+        count += 1
+    return result, count
+
+
+# Bulkwalk on a session, translating OIDs through the compiled OID table. The
+# max_repetitions of the GETBULKs is taken from and adapted to the host's profile.
+def snmp_session_bulkwalk(session, oids):
+    if isinstance(oids, basestring):
+        oids = [oids]
+    numeric_oids = snmp_session_oids(session, oids)
+    host = session.hostname
+    profile = snmp_bulk_profile(host)
+    while True:
+        max_repetitions = profile['max_repetitions']
+        try:
+            with snmp_limiter(host), profile_span('snmp bulkwalk', "{} {}".format(host, ' '.join(oids))):
+                start = time()
+                if snmp_walk_stepwise(session, oids, numeric_oids):
+                    result, pdus = snmp_bulkwalk_stepwise(session, oids, numeric_oids, max_repetitions)
+                else:
+                    result = session.bulkwalk(numeric_oids, max_repetitions=max_repetitions)
+                    pdus = len(result) // max_repetitions + len(oids)  # net-snmp walks the OIDs one by one
+                elapsed = time() - start
+        except SnmpDeadlineExceeded as err:
+            err.result = snmp_name_vars(err.result)
+            raise
+        except EasySNMPConnectionError:
+            raise
+        except EasySNMPTimeoutError:
+            snmp_stats_count(host, bulk_pdus=1, retries=session.retries, snmp_time=time() - start)
+            snmp_bulk_backoff(host, profile, False)
+            raise
+        except EasySNMPError as err:
+            if max_repetitions < 2 or not snmp_err_is_toobig(err):
+                raise
+            snmp_stats_count(host, bulk_pdus=1, retries=1, snmp_time=time() - start)
+            snmp_bulk_backoff(host, profile, True)
+            continue
+        break
+    snmp_stats_count(host, bulk_pdus=pdus, varbinds=len(result), bytes=snmp_estimate_bytes(result, pdus), snmp_time=elapsed)
+    snmp_limiter_charge(host, pdus - 1)
+    snmp_bulk_learn(host, profile, len(oids), len(result), elapsed)
+    return snmp_name_vars(result)
+
+
+# Engine polling many hosts at once for checks like check_keepalived.py, see
+# lib/snmp_engine.py. Replays and records fixtures like the sessions do.
+def get_snmp_engine():
+    global snmp_timeout, snmp_retries, snmp_replay_file, snmp_replay_latency, snmp_record_file
+    if snmp_replay_file:
+        return ReplayEngine(snmp_get_fixture(), snmp_replay_latency)
+    engine = SnmpEngine(snmp_timeout, snmp_retries)
+    if snmp_record_file:
+        return RecordingEngine(engine, snmp_get_fixture())
+    return engine
+
+
+# Hold the limiter of each of the hosts, taken in the order given
+@contextmanager
+def snmp_limiters(hosts):
+    if not hosts:
+        yield
+        return
+    with snmp_limiter(hosts[0]):
+        with snmp_limiters(hosts[1:]):
+            yield
+
+
+# Run the requests queued on an engine of get_snmp_engine() until the deadline,
+# holding a limiter slot of every host polled and sizing the GETBULKs by their
+# bulk profiles. The work done is counted and learned from like that of the
+# sessions. The requests queued for the sessions are done after that, one at a
+# time. Returns False when the deadline came first.
+def snmp_engine_run(engine):
+    global snmp_deadline, snmp_engine_session_requests
+    operations = list(engine.operations)
+    hosts = sorted(set(operation.host for operation in operations))
+    profiles = dict((host, snmp_bulk_profile(host)) for host in hosts)
+    for host, profile in profiles.iteritems():
+        engine.repetitions[host] = profile['max_repetitions']
+    try:
+        with snmp_limiters(hosts):
+            completed = engine.run(snmp_deadline)
+    finally:
+        engine.close()
+    snmp_stats_add_engine(engine)
+    for host, counts in engine.stats.iteritems():
+        snmp_limiter_charge(host, counts.get('get_pdus', 0) + counts.get('bulk_pdus', 0) - 1)
+    for operation in operations:
+        if not isinstance(operation, SnmpBulkWalk) or not operation.done:
+            continue
+        if operation.timed_out or operation.error_status == 1:  # tooBig
+            snmp_bulk_backoff(operation.host, profiles[operation.host], not operation.timed_out)
+        elif not operation.error:
+            snmp_bulk_learn(operation.host, profiles[operation.host], len(operation.roots), len(operation.result), operation.elapsed)
+    requests, snmp_engine_session_requests = snmp_engine_session_requests, []
+    for request in requests:
+        if not request.run():
+            completed = False
+    return completed
+
+
+# Requests of snmp_engine_get() and snmp_engine_bulkwalk() that the engine can't do:
+# SNMPv3, which lib.snmp_engine doesn't speak, and OIDs without a numeric translation
+snmp_engine_session_requests = []
+
+
+# A request done through a pooled session by snmp_engine_run(), with the result,
+# error and done of the engine's operations
+class SnmpSessionRequest(object):
+
+    def __init__(self, args, host, version, context, walk, oids, names):
+        self.args = copy(args)
+        self.args.H = host
+        self.host = host
+        self.version = version
+        self.context = context
+        self.walk = walk
+        self.requested = oids
+        self.names = names
+        self.result = None
+        self.error = None
+        self.done = False
+
+    # Returns False when the deadline came first
+    def run(self):
+        try:
+            session = get_snmp_session(self.args, self.version, self.context)
+            if self.walk:
+                result = snmp_session_bulkwalk(session, self.requested)
+            else:
+                result = snmp_session_get(session, self.requested)
+        except SnmpDeadlineExceeded:
+            return False
+        except EasySNMPError as err:
+            self.error = "{}: {}".format(self.host, err)
+        else:
+            for var in result:
+                var.oid = self.names.get(var.oid, var.oid)
+            self.result = result
+        self.done = True
+        return True
+
+
+# Numeric OIDs for the engine, through the compiled OID table or net-snmp, and the
+# names of their columns. None if any of them can't be translated.
+def snmp_engine_oids(oids):
+    numeric_oids = []
+    names = {}
+    for oid in oids:
+        numeric_oid = snmp_numeric_oid(oid)
+        if not numeric_oid.startswith('.'):
+            numeric_oid = snmp_netsnmp_oid(oid)
+        if numeric_oid is None:
+            return None, None
+        numeric_oids.append(numeric_oid)
+        if '::' in oid:
+            column, _, index = oid.split('::', 1)[1].partition('.')
+            root = numeric_oid.split('.')
+            if index:
+                root = root[:-len(index.split('.'))]
+            names['.'.join(root)] = column
+    return numeric_oids, names
+
+
+# Queue a get or bulkwalk of a host on an engine of get_snmp_engine(), to be run by
+# snmp_engine_run(). OIDs can be symbolic, the varbinds are named like those of the
+# sessions. SNMPv2c is polled concurrently by the engine, while SNMPv3 goes through
+# the pooled easysnmp sessions. Returns the request.
+def snmp_engine_queue(engine, args, host, oids, walk, version=2, context=""):
+    global snmp_engine_session_requests
+    if isinstance(oids, basestring):
+        oids = [oids]
+    oids = list(oids)
+    queue = engine.bulkwalk if walk else engine.get
+    if isinstance(engine, ReplayEngine) and version == 2 and not context:
+        return queue(host, args.C, oids)  # Fixtures are keyed on the OIDs as the check asked for them
+    numeric_oids, names = snmp_engine_oids(oids)
+    if version == 3 or context or numeric_oids is None:
+        request = SnmpSessionRequest(args, host, version, context, walk, oids, names or {})
+        snmp_engine_session_requests.append(request)
+        return request
+    operation = queue(host, args.C, numeric_oids, names)
+    operation.requested = oids  # Recorded as the check asked for them
+    return operation
+
+
+def snmp_engine_get(engine, args, host, oids, version=2, context=""):
+    return snmp_engine_queue(engine, args, host, oids, False, version, context)
+
+
+def snmp_engine_bulkwalk(engine, args, host, oids, version=2, context=""):
+    return snmp_engine_queue(engine, args, host, oids, True, version, context)
 
 
 # SNMP get wrapper with error handling
 def my_snmp_get(args, oid, use_sprint_value=False):
     try:
-        retval = snmp_get(oid, hostname=args.H, community=args.C, version=2, use_sprint_value=use_sprint_value)
+        retval = snmp_session_get(get_snmp_session(args, use_sprint_value=use_sprint_value), oid)
     except (EasySNMPConnectionError, EasySNMPTimeoutError) as err:
         snmp_err(err)
     return retval
 
 
-# SNMP walk wrapper
-def my_snmp_walk(args, oids, use_sprint_value=False):
+# Varbinds of a walk cut short by the deadline, for checks that evaluate partial
+# results. The check is then ended by check_if_ok or check_if_complete.
+def snmp_partial_walk_result(err):
+    global snmp_partial_walk
+    if snmp_partial_walk is None:
+        snmp_partial_walk = err
+    return err.result
+
+
+# Whether a walk was cut short by the deadline, rows can then be missing
+def snmp_walk_partial():
+    global snmp_partial_walk
+    return snmp_partial_walk is not None
+
+
+# SNMP walk wrapper. With partial, a walk cut short by the deadline returns the
+# varbinds it got so far instead of ending the check.
+def my_snmp_walk(args, oids, use_sprint_value=False, cache_ttl=None, partial=False):
     try:
-        retval = snmp_bulkwalk(oids, hostname=args.H, community=args.C, version=2, use_sprint_value=use_sprint_value)
+        session = get_snmp_session(args, use_sprint_value=use_sprint_value)
+        retval = snmp_walk_cached(session, walk_cache_key(args, oids, 2, "", use_sprint_value), oids, cache_ttl)
+    except SnmpDeadlineExceeded as err:
+        if not partial:
+            snmp_err(err)
+        retval = snmp_partial_walk_result(err)
     except (EasySNMPConnectionError, EasySNMPTimeoutError) as err:
         snmp_err(err)
     return retval
@@ -55,43 +1122,351 @@ def my_snmp_walk(args, oids, use_sprint_value=False):
 # SNMPv3 get wrapper
 def my_snmp_get_v3(args, oid, context="", use_sprint_value=False):
     try:
-        retval = snmp_get(oid, hostname=args.H, security_level=args.l, security_username=args.u, auth_protocol=args.a, auth_password=args.A, privacy_protocol=args.x, privacy_password=args.X, context=context, version=3, use_sprint_value=use_sprint_value)
+        retval = snmp_session_get(get_snmp_session(args, 3, context, use_sprint_value), oid)
     except (EasySNMPConnectionError, EasySNMPTimeoutError) as err:
         snmp_err(err)
     return retval
 
 
 # SNMPv3 walk wrapper
-def my_snmp_walk_v3(args, oids, context="", use_sprint_value=False):
+def my_snmp_walk_v3(args, oids, context="", use_sprint_value=False, cache_ttl=None, partial=False):
     try:
-        retval = snmp_bulkwalk(oids, hostname=args.H, security_level=args.l, security_username=args.u, auth_protocol=args.a, auth_password=args.A, privacy_protocol=args.x, privacy_password=args.X, context=context, version=3, use_sprint_value=use_sprint_value)
+        session = get_snmp_session(args, 3, context, use_sprint_value)
+        retval = snmp_walk_cached(session, walk_cache_key(args, oids, 3, context, use_sprint_value), oids, cache_ttl)
+    except SnmpDeadlineExceeded as err:
+        if not partial:
+            snmp_err(err)
+        retval = snmp_partial_walk_result(err)
     except (EasySNMPConnectionError, EasySNMPTimeoutError) as err:
         snmp_err(err)
     return retval
 
 
+# Cache key of a walk, (host, context, OID set) plus whatever changes the result
+# format. The credentials are part of it as they may give access to different views.
+def walk_cache_key(args, oids, version=2, context="", use_sprint_value=False):
+    if isinstance(oids, basestring):
+        oids = [oids]
+    credentials = sha1(repr(snmp_credentials(args, version))).hexdigest()
+    return (args.H, version, credentials, context, sorted(oids), use_sprint_value)
+
+
+# Read a cached walk result, in the order of the requested OIDs. None if it is
+# missing or older than the TTL.
+def walk_cache_read(path, ttl, oids):
+    try:
+        if time() - os.stat(path).st_mtime > ttl:
+            return None
+        with open(path, 'r') as f:
+            walks = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(walks, dict) or not all(oid in walks for oid in oids):
+        return None  # Written by an older version
+    return [SNMPVariable(*row) for oid in oids for row in walks[oid]]
+
+
+# Write the walk results per OID to the cache, atomically so readers never need to
+# lock. A cache dir that is full or not writable just leaves the result uncached.
+def walk_cache_write(path, walks):
+    rows = dict((oid, [(var.oid, var.oid_index, var.value, var.snmp_type) for var in result])
+                for oid, result in walks.iteritems())
+    tmppath = None
+    try:
+        fd, tmppath = mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(rows, f)
+        os.rename(tmppath, path)
+    except (IOError, OSError):
+        if tmppath is not None:
+            try:
+                os.unlink(tmppath)
+            except OSError:
+                pass
+
+
+# Take the lock of a cache entry, polling it while another process fills the entry.
+# Gives up after the time of a request with all its retries, or when only the time
+# for a request is left before the deadline. Returns whether the lock was taken.
+def walk_cache_lock(lockfile):
+    global snmp_timeout, snmp_retries, snmp_deadline, snmp_min_timeout
+    give_up = time() + snmp_timeout * (snmp_retries + 1)
+    if snmp_deadline is not None:
+        give_up = min(give_up, snmp_deadline - snmp_min_timeout)
+    delay = 0.005
+    while True:
+        try:
+            fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except IOError:
+            pass
+        now = time()
+        if now >= give_up:
+            return False
+        sleep(min(delay, give_up - now))
+        delay = min(delay * 2, 0.1)
+
+
+# Bulkwalk the OIDs one at a time, as net-snmp walks them anyway, and write the
+# results per OID to the cache. A walk cut short by the deadline isn't cached.
+def walk_cache_fill(session, path, oids):
+    walks = {}
+    for oid in oids:
+        if oid in walks:
+            continue
+        try:
+            walks[oid] = snmp_session_bulkwalk(session, oid)
+        except SnmpDeadlineExceeded as err:
+            err.result = [var for done in oids if done in walks for var in walks[done]] + err.result
+            raise
+    walk_cache_write(path, walks)
+    return [var for oid in oids for var in walks[oid]]
+
+
+# Bulkwalk through the cache, a cold cache is filled by whoever gets the lock first
+# while other processes walking the same thing wait for and then read its result.
+# If the lock isn't released in time the walk is done uncached.
+def snmp_walk_cached(session, key, oids, cache_ttl=None):
+    global walk_cache_dir, walk_cache_ttl
+    if cache_ttl is None:
+        cache_ttl = walk_cache_ttl
+    if cache_ttl <= 0:
+        return snmp_session_bulkwalk(session, oids)
+    if isinstance(oids, basestring):
+        oids = [oids]
+
+    path = os.path.join(walk_cache_dir, sha1(repr(key)).hexdigest())
+    retval = walk_cache_read(path, cache_ttl, oids)
+    if retval is not None:
+        return retval
+
+    if not os.path.isdir(walk_cache_dir):
+        try:
+            os.makedirs(walk_cache_dir, 0700)
+        except OSError:
+            pass  # Created by someone else in the meantime
+    try:
+        lockfile = open(path + '.lock', 'a')
+    except IOError:
+        return snmp_session_bulkwalk(session, oids)
+    with lockfile:
+        if not walk_cache_lock(lockfile):
+            return snmp_session_bulkwalk(session, oids)
+        try:
+            retval = walk_cache_read(path, cache_ttl, oids)
+            if retval is None:
+                retval = walk_cache_fill(session, path, oids)
+        finally:
+            fcntl.flock(lockfile, fcntl.LOCK_UN)
+    return retval
+
+
+# State a script keeps about a device between runs, like a cached topology
+state_dir = os.path.join(walk_cache_dir, 'state')
+
+
+def state_path(name, host):
+    global state_dir
+    return os.path.join(state_dir, "{}-{}.json".format(name, host))
+
+
+# Read the state of a script for a device, None if there isn't any
+def read_state(name, host):
+    try:
+        with open(state_path(name, host), 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+# Write the state of a script for a device, atomically so runs never need to lock
+def write_state(name, host, state):
+    global state_dir
+    if not os.path.isdir(state_dir):
+        try:
+            os.makedirs(state_dir, 0700)
+        except OSError:
+            pass  # Created by someone else in the meantime
+    try:
+        fd, tmppath = mkstemp(dir=state_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.rename(tmppath, state_path(name, host))
+    except (IOError, OSError):
+        pass  # The next run starts over
+
+
+# Apply the CNH_NM_* settings of a single run on top of those read at import, for
+# cnh_nm_daemon.py which runs each check in a forked child with the environment of
+# its client. CNH_NM_NO_MIBS can't be changed once net-snmp is initialized, and
+# CNH_NM_PROFILE is started by the daemon.
+def snmp_apply_environment(environ):
+    global snmp_start_time, snmp_deadline, snmp_deadline_state, walk_cache_dir, walk_cache_ttl, snmp_perfdata_enabled
+    global snmp_stats_prefix, snmp_record_file, snmp_replay_file, snmp_replay_latency, snmp_limits_file, snmp_limits
+    global snmp_limits_dir, snmp_limiter_timeout, snmp_bulk_profiles_dir, snmp_bulk_max_repetitions, state_dir, profile_dir
+    os.environ.update(environ)  # Read again at exit and by lib.graphite
+    if 'CNH_NM_DEADLINE' in environ:
+        snmp_deadline = snmp_start_time + float(environ['CNH_NM_DEADLINE']) if environ['CNH_NM_DEADLINE'] else None
+    if 'CNH_NM_DEADLINE_STATE' in environ:
+        snmp_deadline_state = STATE_WARN if environ['CNH_NM_DEADLINE_STATE'].lower().startswith('warn') else STATE_UNKNOWN
+    if 'CNH_NM_CACHE_DIR' in environ:
+        walk_cache_dir = environ['CNH_NM_CACHE_DIR']
+        snmp_limits_dir = os.path.join(walk_cache_dir, 'limits')
+        snmp_bulk_profiles_dir = os.path.join(walk_cache_dir, 'profiles')
+        state_dir = os.path.join(walk_cache_dir, 'state')
+    walk_cache_ttl = int(environ.get('CNH_NM_WALK_CACHE_TTL', walk_cache_ttl))
+    if 'CNH_NM_PERFDATA' in environ:
+        snmp_perfdata_enabled = environ['CNH_NM_PERFDATA'] == '1'
+    snmp_stats_prefix = environ.get('CNH_NM_STATS_PREFIX', snmp_stats_prefix)
+    snmp_record_file = environ.get('CNH_NM_RECORD', snmp_record_file)
+    snmp_replay_file = environ.get('CNH_NM_REPLAY', snmp_replay_file)
+    snmp_replay_latency = float(environ.get('CNH_NM_REPLAY_LATENCY', snmp_replay_latency))
+    if 'CNH_NM_LIMITS' in environ:
+        snmp_limits_file = environ['CNH_NM_LIMITS']
+        snmp_limits = {}
+    snmp_limiter_timeout = float(environ.get('CNH_NM_LIMITER_TIMEOUT', snmp_limiter_timeout))
+    snmp_bulk_max_repetitions = int(environ.get('CNH_NM_MAX_REPETITIONS', snmp_bulk_max_repetitions))
+    profile_dir = environ.get('CNH_NM_PROFILE_DIR', profile_dir)
+
+
+# Split a list of OIDs into chunks small enough to fit into a single PDU
+def snmp_pdu_chunks(oids, max_msg_size=None):
+    global snmp_max_msg_size, snmp_pdu_overhead, snmp_varbind_size
+    if max_msg_size is None:
+        max_msg_size = snmp_max_msg_size
+    per_pdu = max(1, (max_msg_size - snmp_pdu_overhead) // snmp_varbind_size)
+    return [oids[i:i + per_pdu] for i in xrange(0, len(oids), per_pdu)]
+
+
+# Check whether an SNMP error was caused by the response being too big (tooBig)
+def snmp_err_is_toobig(err):
+    errstr = str(err).lower()
+    return 'too large' in errstr or 'toobig' in errstr
+
+
+# Multi-varbind get on a session, packing as many OIDs per PDU as we expect the
+# agent to accept and splitting chunks in half whenever the agent answers tooBig
+def snmp_get_many(session, oids):
+    retval = {}
+    pending = snmp_pdu_chunks(list(oids))
+    while pending:
+        chunk = pending.pop(0)
+        try:
+            result = snmp_session_get(session, chunk)
+        except (EasySNMPConnectionError, EasySNMPTimeoutError):
+            raise
+        except EasySNMPError as err:
+            if len(chunk) < 2 or not snmp_err_is_toobig(err):
+                raise
+            snmp_stats_count(session.hostname, retries=1)
+            half = len(chunk) // 2
+            pending[0:0] = [chunk[:half], chunk[half:]]
+            continue
+        for oid, var in zip(chunk, result):
+            retval[oid] = var
+    return retval
+
+
+# SNMP get wrapper for many OIDs at once, returns a dict keyed by the requested OIDs
+def my_snmp_get_many(args, oids, use_sprint_value=False):
+    try:
+        retval = snmp_get_many(get_snmp_session(args, use_sprint_value=use_sprint_value), oids)
+    except EasySNMPError as err:
+        snmp_err(err)
+    return retval
+
+
+# SNMPv3 get wrapper for many OIDs at once, returns a dict keyed by the requested OIDs
+def my_snmp_get_many_v3(args, oids, context="", use_sprint_value=False):
+    try:
+        retval = snmp_get_many(get_snmp_session(args, 3, context, use_sprint_value), oids)
+    except EasySNMPError as err:
+        snmp_err(err)
+    return retval
+
+
 # Getting an integer value and nothing else
 def my_snmp_get_int(args, oid):
     retval = my_snmp_get(args, oid)
     return int(str(retval.value))
 
 
-# Status change wrapper
+# Status change wrapper, also remembers the result so far for snmp_err
 def trigger_not_ok(status, statusstr, req_state, txt):
+    global snmp_partial_result
     if req_state > status:
         status = req_state
     statusstr += txt + ","
+    snmp_partial_result = [status, statusstr]
     return [status, statusstr]
 
 
-# Status check and alert wrapper
+# Status check and alert wrapper. After a walk was cut short by the deadline the
+# problems are reported along with the deadline.
 def check_if_ok(status, statusstr):
-    global status_txt_mapper
+    global status_txt_mapper, snmp_partial_walk
     if status != STATE_OK:
-        print "{}: {}".format(status_txt_mapper[status], statusstr.rstrip(","))
+        if snmp_partial_walk is not None:
+            snmp_deadline_exit(snmp_partial_walk, status, statusstr)
+        print "{}: {}{}".format(status_txt_mapper[status], statusstr.rstrip(","), snmp_perfdata())
         sys.exit(status)
 
 
+# End a check that found no problems in the deadline state if a walk was cut short,
+# as it can't tell all is OK
+def check_if_complete():
+    global snmp_partial_walk
+    if snmp_partial_walk is not None:
+        snmp_deadline_exit(snmp_partial_walk, STATE_OK, "no problems found in the rows walked")
+
+
+# Format a check result the same way check_if_ok and the OK prints do
+def format_check_result(status, statusstr):
+    global status_txt_mapper
+    return "{}: {}".format(status_txt_mapper[status], statusstr.rstrip(","))
+
+
+# Submit passive check results, as (host, service, status, output) tuples, in bulk
+# through the Nagios external command file. Writes are kept within PIPE_BUF so
+# they can't get interleaved with other writers to the FIFO.
+def nagios_write_command_file(results, command_file):
+    now = int(time())
+    lines = []
+    for host, service, status, output in results:
+        lines.append("[{}] PROCESS_SERVICE_CHECK_RESULT;{};{};{};{}\n".format(
+            now, host, service, status, output.replace("\n", " ")))
+    with open(command_file, 'a') as f:
+        buf = ""
+        for line in lines:
+            if buf and len(buf) + len(line) > select.PIPE_BUF:
+                f.write(buf)
+                f.flush()
+                buf = ""
+            buf += line
+        if buf:
+            f.write(buf)
+
+
+# Submit passive check results, as (host, service, status, output) tuples, in bulk
+# as a single check result file in the Nagios check result spool directory
+def nagios_write_checkresults(results, spool_dir):
+    now = time()
+    fd, path = mkstemp(prefix='c', dir=spool_dir)
+    with os.fdopen(fd, 'w') as f:
+        f.write("### Active Check Result File ###\nfile_time={}\n\n".format(int(now)))
+        for host, service, status, output in results:
+            f.write("### Nagios Service Check Result ###\n")
+            f.write("host_name={}\n".format(host))
+            f.write("service_description={}\n".format(service))
+            f.write("check_type=1\ncheck_options=0\nscheduled_check=0\nreschedule_check=0\nlatency=0.0\n")
+            f.write("start_time={0:.6f}\nfinish_time={0:.6f}\n".format(now))
+            f.write("early_timeout=0\nexited_ok=1\n")
+            f.write("return_code={}\n".format(status))
+            f.write("output={}\n\n".format(output.replace("\n", "\\n")))
+    os.chmod(path, 0644)
+    open(path + '.ok', 'w').close()
+
+
 # Re-formatting the SNMP walk result into something more workable
 def snmpresult_to_dict(snmpresult):
     retval = defaultdict(dict)
@@ -100,6 +1475,265 @@ def snmpresult_to_dict(snmpresult):
     return retval
 
 
+# Compact table of walk results. Each column is a plain list of values aligned to
+# a shared list of indexes, instead of a dict of dicts holding every SNMPVariable.
+# Columns of integer types are kept as arrays of machine integers while all their
+# values fit. Rows can still be accessed by index like with snmpresult_to_dict,
+# then yielding light-weight variables built on access.
+class SnmpTable(object):
+    integer_types = frozenset(['INTEGER', 'INTEGER32', 'UNSIGNED', 'UNSIGNED32', 'GAUGE', 'GAUGE32', 'COUNTER', 'COUNTER32', 'TICKS'])
+
+    def __init__(self):
+        self.indexes = []
+        self.positions = {}  # index -> position in the column lists
+        self.values = {}  # column -> [value, ...], or array('l') for integer columns
+        self.missing = {}  # column -> set of positions without a value, of integer columns
+        self.types = {}  # column -> snmp_type, the first one seen
+        self.type_exceptions = {}  # column -> {position: snmp_type} where it differs
+        self.converted = {}  # (column, convert) -> converted column
+        self.unconvertible = set()  # (column, convert) of columns with values convert fails on
+
+    def add(self, column, index, value, snmp_type):
+        self.insert(column, index, value, snmp_type)
+        self.converted.clear()
+        self.unconvertible.clear()
+
+    # Add a whole walk result, cached conversions are only dropped once
+    def extend(self, snmpresult):
+        for column, run in groupby(snmpresult, attrgetter('oid')):
+            self.insert_run(column, list(run))
+        self.converted.clear()
+        self.unconvertible.clear()
+
+    # Add a run of variables of one column, as walks return them. A run of the rows
+    # that follow in the column, or of rows not seen yet when the column holds all
+    # rows so far (as the first column does), is added in one go. Others a variable
+    # at a time.
+    def insert_run(self, column, run):
+        values = self.values.get(column)
+        snmp_type = self.types.get(column, run[0].snmp_type)
+        if map(attrgetter('snmp_type'), run).count(snmp_type) != len(run):
+            return self.insert_each(column, run)
+        run_indexes = map(attrgetter('oid_index'), run)
+        start = 0 if values is None else len(values)
+        if self.indexes[start:start + len(run)] != run_indexes:
+            positions = self.positions
+            if start != len(self.indexes) or any(map(positions.__contains__, run_indexes)):
+                return self.insert_each(column, run)
+            positions.update(izip(run_indexes, xrange(start, start + len(run))))
+            if len(positions) != start + len(run):  # Repeated indexes
+                for index in run_indexes:
+                    positions.pop(index, None)
+                return self.insert_each(column, run)
+            self.indexes.extend(run_indexes)
+        if values is None:
+            self.types[column] = snmp_type
+            if snmp_type in self.integer_types:
+                values = self.values[column] = array('l')
+                self.missing[column] = set()
+            else:
+                values = self.values[column] = []
+        raw = map(attrgetter('value'), run)
+        if column in self.missing:
+            try:
+                values.extend(array('l', map(int, raw)))
+                return
+            except (ValueError, OverflowError):
+                values = self.list_column(column)
+        values.extend(raw)
+
+    def insert_each(self, column, run):
+        for obj in run:
+            self.insert(column, obj.oid_index, obj.value, obj.snmp_type)
+
+    def insert(self, column, index, value, snmp_type):
+        pos = self.positions.get(index)
+        if pos is None:
+            pos = self.positions[index] = len(self.indexes)
+            self.indexes.append(index)
+        values = self.values.get(column)
+        if values is None:
+            self.types[column] = snmp_type
+            if snmp_type in self.integer_types:
+                values = self.values[column] = array('l')
+                self.missing[column] = set()
+            else:
+                values = self.values[column] = []
+        elif snmp_type != self.types[column]:
+            self.type_exceptions.setdefault(column, {})[pos] = snmp_type
+        missing = self.missing.get(column)
+        if missing is not None:
+            try:
+                number = int(value)
+                if len(values) <= pos:
+                    missing.update(xrange(len(values), pos))
+                    values.extend([0] * (pos + 1 - len(values)))
+                else:
+                    missing.discard(pos)
+                values[pos] = number
+                return
+            except (ValueError, OverflowError):
+                missing.add(pos)
+                values = self.list_column(column)
+        if len(values) <= pos:
+            values.extend([None] * (pos + 1 - len(values)))
+        values[pos] = value
+
+    # Turn an integer column into a list of values, once a value isn't an integer
+    def list_column(self, column):
+        missing = self.missing.pop(column)
+        values = self.values[column] = [None if pos in missing else unicode(value) for pos, value in enumerate(self.values[column])]
+        return values
+
+    # Indexes of the rows, aligned to the columns. Not to be modified.
+    def row_indexes(self):
+        return self.indexes
+
+    def columns(self):
+        return self.values.keys()
+
+    # Values of a column aligned to self.indexes (None where missing), optionally
+    # converted (e.g. with int), the conversion is done once and then cached
+    def column(self, column, convert=None):
+        values = self.values.get(column, [])
+        missing = self.missing.get(column)
+        if len(values) < len(self.indexes):
+            if missing is not None:
+                missing.update(xrange(len(values), len(self.indexes)))
+                values.extend([0] * (len(self.indexes) - len(values)))
+            else:
+                values.extend([None] * (len(self.indexes) - len(values)))
+        if missing is not None and not missing and convert in (int, long):
+            return values
+        if convert is None and missing is None:
+            return values
+        key = (column, convert)
+        if key not in self.converted:
+            if missing is not None:
+                convert = convert or unicode
+                converted = [None if pos in missing else convert(value) for pos, value in enumerate(values)]
+            else:
+                converted = [None if value is None else convert(value) for value in values]
+                if convert in (int, long) and None not in converted:
+                    try:
+                        converted = array('l', converted)
+                    except OverflowError:
+                        pass  # Counter64 and friends, keep as list
+            self.converted[key] = converted
+        return self.converted[key]
+
+    def get(self, index, column, convert=None):
+        pos = self.positions.get(index)
+        values = self.values.get(column)
+        if pos is None or values is None or pos >= len(values):
+            return None
+        missing = self.missing.get(column)
+        if missing is not None:
+            if pos in missing:
+                return None
+            if convert in (int, long):
+                return values[pos]
+            if convert is None:
+                return unicode(values[pos])
+        elif values[pos] is None:
+            return None
+        elif convert is None:
+            return values[pos]
+        key = (column, convert)
+        if key not in self.unconvertible:
+            try:
+                return self.column(column, convert)[pos]
+            except (ValueError, TypeError, OverflowError):  # Other rows, like a NOSUCHINSTANCE
+                self.unconvertible.add(key)
+        return convert(values[pos])
+
+    def variable(self, index, column):
+        pos = self.positions[index]
+        values = self.values[column]
+        missing = self.missing.get(column)
+        if missing is None:
+            if pos >= len(values) or values[pos] is None:
+                raise KeyError(column)
+            value = values[pos]
+        else:
+            if pos >= len(values) or pos in missing:
+                raise KeyError(column)
+            value = unicode(values[pos])
+        exceptions = self.type_exceptions.get(column)
+        if exceptions:
+            return SnmpVariable(column, index, value, exceptions.get(pos, self.types[column]))
+        return SnmpVariable(column, index, value, self.types[column])
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __iter__(self):
+        return iter(self.indexes)
+
+    def __contains__(self, index):
+        return index in self.positions
+
+    def __getitem__(self, index):
+        if index not in self.positions:
+            raise KeyError(index)
+        return SnmpTableRow(self, index)
+
+    def keys(self):
+        return list(self.indexes)
+
+    def iterkeys(self):
+        return iter(self.indexes)
+
+    def itervalues(self):
+        for index in self.indexes:
+            yield SnmpTableRow(self, index)
+
+    def iteritems(self):
+        for index in self.indexes:
+            yield index, SnmpTableRow(self, index)
+
+    def items(self):
+        return list(self.iteritems())
+
+
+# A row of an SnmpTable, behaves like the per-index dicts of snmpresult_to_dict
+class SnmpTableRow(object):
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, column):
+        return self.table.variable(self.index, column)
+
+    def __contains__(self, column):
+        return self.table.get(self.index, column) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, column, default=None):
+        if column not in self:
+            return default
+        return self[column]
+
+    def keys(self):
+        return [column for column in self.table.values if column in self]
+
+    def iteritems(self):
+        for column in self.keys():
+            yield column, self[column]
+
+
+# Re-formatting the SNMP walk result into a compact SnmpTable, the walk result can
+# be any iterable so it doesn't have to be kept around
+def snmpresult_to_table(snmpresult):
+    retval = SnmpTable()
+    retval.extend(snmpresult)
+    return retval
+
+
 # Parser for SNMP datetime (Needed by cvsVSLLastConnectionStateChange)
 def parse_snmp_datetime(input):
     octval = input.encode('latin1')
@@ -155,6 +1789,18 @@ def snmp_oid_decode_ip(oid):
             return unicode(ip_decoded.lower().rstrip(':'))
 
 
+# Encoding an IP as an (InetAddressType, InetAddress) SNMP OID index, the reverse
+# of snmp_oid_decode_ip, e.g. 10.0.0.1 -> 1.4.10.0.0.1 and 2001:db8::1 -> 2.16.32.1.13.184.[...]
+def snmp_oid_encode_ip(ip):
+    addr = ip_address(unicode(ip))
+    if addr.version == 4:
+        addr_type = 1
+    else:
+        addr_type = 2
+    octets = [str(octet) for octet in bytearray(addr.packed)]
+    return "{}.{}.{}".format(addr_type, len(octets), ".".join(octets))
+
+
 # Decode the dellNetBgpM2PeerRemoteAddr field from FTOS devices
 def ftos_get_peer_ip(peeraddr, peeraddr_type):
     packed = peeraddr.value.encode('latin1')
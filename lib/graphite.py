@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+#
+# @descr    Graphite client for the graphite/ collectors, sending the metrics of
+#           a run over one persistent connection in batches
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# Metrics are buffered and written batch_size at a time, as plaintext lines
+# (port 2003) or pickle protocol batches (port 2004). All metrics of a poll cycle
+# get the same timestamp, taken when the cycle starts. A failed write reconnects
+# and resends the batch, up to retries times.
+#   graphite = GraphiteClient('graphite.example.net')
+#   graphite.send('arp.router1.vlan.10', 42)
+#   graphite.close()
+#
+# GraphiteSender has the same interface but delivers from a background thread, so
+# polling doesn't wait for carbon. Metrics that can't be delivered, or don't fit
+# the queue, are appended to a spool file per carbon host which is replayed by
+# the next sender that gets through, a batch at a time. close() waits at most
+# close_timeout seconds.
+#
+
+import cPickle
+import errno
+import fcntl
+import os
+import socket
+import struct
+import threading
+from glob import glob
+from itertools import count
+from Queue import Queue, Empty, Full
+from tempfile import gettempdir
+from time import time
+
+default_ports = {'plaintext': 2003, 'pickle': 2004}
+spool_dir = os.environ.get('CNH_NM_GRAPHITE_SPOOL', os.path.join(
+    os.environ.get('CNH_NM_CACHE_DIR', os.path.join(gettempdir(), 'cnh_nm_cache')), 'graphite_spool'))
+spool_max_size = int(os.environ.get('CNH_NM_GRAPHITE_SPOOL_MAX', 100 * 1024 * 1024))
+claim_ids = count(1)
+
+
+class GraphiteClient(object):
+
+    def __init__(self, host, port=None, protocol='plaintext', timeout=5, batch_size=500, retries=2):
+        if protocol not in default_ports:
+            raise ValueError("Unknown graphite protocol {}".format(protocol))
+        self.host = host
+        self.port = port or default_ports[protocol]
+        self.protocol = protocol
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.retries = retries
+        self.sock = None
+        self.buffer = []  # (name, value, timestamp)
+        self.sent = 0
+        self.connects = 0
+        self.cycle()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Start a new poll cycle, the metrics sent from now on get its timestamp
+    def cycle(self):
+        self.timestamp = int(time())
+
+    def send(self, name, value, timestamp=None):
+        self.buffer.append((name, value, timestamp or self.timestamp))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), self.timeout)
+        self.connects += 1
+
+    def disconnect(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+            self.sock = None
+
+    def encode(self, metrics):
+        if self.protocol == 'pickle':
+            payload = cPickle.dumps([(name, (timestamp, value)) for name, value, timestamp in metrics], 2)
+            return struct.pack('!L', len(payload)) + payload
+        return ''.join("{} {} {}\n".format(name, value, timestamp) for name, value, timestamp in metrics)
+
+    # Write the buffered metrics, raises socket.error when carbon can't be reached
+    def flush(self):
+        if not self.buffer:
+            return
+        data = self.encode(self.buffer)
+        for attempt in xrange(self.retries + 1):
+            try:
+                if self.sock is None:
+                    self.connect()
+                self.sock.sendall(data)
+                break
+            except socket.error:
+                self.disconnect()
+                if attempt == self.retries:
+                    raise
+        self.sent += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.disconnect()
+
+
+# Append-only file of undelivered metrics as plaintext lines, shared by all
+# processes sending to the same carbon host. A sender replaying the spool first
+# renames it to a claim file of its own, <spool>.<pid>.<n>.claim, and removes that
+# only once it is delivered. Claim files of processes that died are taken over.
+class GraphiteSpool(object):
+
+    def __init__(self, path, max_size=spool_max_size):
+        self.path = path
+        self.max_size = max_size
+        self.dropped = 0
+        self.claims = set()  # Claim files of ours
+
+    @staticmethod
+    def parse_value(value):
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+
+    @staticmethod
+    def process_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except OSError as err:
+            return err.errno == errno.EPERM
+        return True
+
+    def claim_files(self):
+        return glob(self.path + '.*.claim')
+
+    def pending(self):
+        try:
+            if os.path.getsize(self.path) > 0:
+                return True
+        except OSError:
+            pass
+        return bool(self.claim_files())
+
+    # Open the spool for appending, locked. It may be renamed to a claim file while
+    # we wait for the lock, then the new spool is opened instead.
+    def open_locked(self):
+        while True:
+            f = open(self.path, 'a')
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.stat(self.path).st_ino == os.fstat(f.fileno()).st_ino:
+                    return f
+            except OSError:
+                pass
+            f.close()
+
+    def append(self, metrics):
+        if not metrics:
+            return
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory, 0700)
+            except OSError:
+                pass  # Created by someone else in the meantime
+        with self.open_locked() as f:
+            if os.fstat(f.fileno()).st_size > self.max_size:
+                self.dropped += len(metrics)
+                return
+            f.write(''.join("{} {} {}\n".format(name, value, timestamp) for name, value, timestamp in metrics))
+
+    def new_claim(self):
+        path = "{}.{}.{}.claim".format(self.path, os.getpid(), next(claim_ids))
+        self.claims.add(path)
+        return path
+
+    # Move the spooled metrics to a claim file of ours, and take over the claims of
+    # processes that died. Returns the paths of our claim files to replay.
+    def claim(self):
+        try:
+            with self.open_locked() as f:
+                if os.fstat(f.fileno()).st_size > 0:
+                    os.rename(self.path, self.new_claim())
+        except (IOError, OSError):
+            pass
+        for path in self.claim_files():
+            if path in self.claims:
+                continue
+            try:
+                pid = int(path[len(self.path) + 1:].split('.')[0])
+            except ValueError:
+                continue
+            if pid == os.getpid() or self.process_alive(pid):
+                continue
+            claim = self.new_claim()
+            try:
+                os.rename(path, claim)
+            except OSError:
+                self.claims.discard(claim)  # Taken over by someone else
+        return sorted(path for path in self.claims if os.path.exists(path))
+
+    # The metrics of a claim file, read as they are replayed. Yields (name, value, timestamp).
+    # Lines cut short by a full disk, or otherwise corrupt, are skipped and dropped.
+    def read(self, path):
+        with open(path, 'r') as f:
+            for line in f:
+                parts = line.split()
+                try:
+                    if len(parts) != 3:
+                        raise ValueError(line)
+                    metric = parts[0], self.parse_value(parts[1]), int(parts[2])
+                except ValueError:
+                    self.dropped += 1
+                    continue
+                yield metric
+
+    # A claim file was delivered
+    def release(self, path):
+        self.claims.discard(path)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class GraphiteSender(object):
+
+    def __init__(self, host, port=None, protocol='plaintext', timeout=5, batch_size=500, queue_size=10000,
+                 close_timeout=2.0, retry_interval=30, spool=None):
+        self.client = GraphiteClient(host, port, protocol=protocol, timeout=timeout, batch_size=batch_size, retries=1)
+        self.spool = spool or GraphiteSpool(os.path.join(spool_dir, "{}_{}.spool".format(host, self.client.port)))
+        self.queue = Queue(queue_size)
+        self.close_timeout = close_timeout
+        self.retry_interval = retry_interval
+        self.retry_at = 0
+        self.inflight = []
+        self.overflow = []  # Metrics that didn't fit the queue, spooled a batch at a time
+        self.spooled = 0
+        self.closing = threading.Event()
+        self.cycle()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Start a new poll cycle, the metrics sent from now on get its timestamp
+    def cycle(self):
+        self.timestamp = int(time())
+
+    def send(self, name, value, timestamp=None):
+        metric = (name, value, timestamp or self.timestamp)
+        try:
+            self.queue.put_nowait(metric)
+        except Full:
+            self.overflow.append(metric)
+            if len(self.overflow) >= self.client.batch_size:
+                self.to_spool(self.overflow)
+                self.overflow = []
+
+    # Spool metrics, or drop them when the spool can't be written
+    def to_spool(self, metrics):
+        try:
+            self.spool.append(metrics)
+        except (IOError, OSError):
+            self.spool.dropped += len(metrics)
+            return
+        self.spooled += len(metrics)
+
+    # The next batch from the queue, None when closing and the queue is drained.
+    # close() queues a None to wake us up, a get with timeout would poll.
+    def next_batch(self):
+        batch = []
+        while not batch:
+            if self.closing.is_set():
+                try:
+                    metric = self.queue.get_nowait()
+                except Empty:
+                    return None
+            else:
+                metric = self.queue.get()
+            if metric is not None:
+                batch.append(metric)
+        while len(batch) < self.client.batch_size:
+            try:
+                metric = self.queue.get_nowait()
+            except Empty:
+                break
+            if metric is not None:
+                batch.append(metric)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                break
+            self.deliver(batch)
+        self.client.disconnect()
+
+    # Send a batch, spooling it when carbon is, or recently was, unreachable
+    def deliver(self, batch):
+        if time() < self.retry_at:
+            self.to_spool(batch)
+            return
+        self.inflight = batch
+        try:
+            for name, value, timestamp in batch:
+                self.client.send(name, value, timestamp)
+            self.client.flush()
+            self.inflight = []
+            if self.spool.pending():
+                self.replay()
+        except socket.error:
+            self.client.buffer = []
+            self.to_spool(self.inflight)
+            self.retry_at = time() + self.retry_interval
+        except (IOError, OSError, ValueError):
+            # The spool can't be replayed now, its claim files are kept for later
+            self.client.buffer = []
+            self.spool.dropped += len(self.inflight)
+        self.inflight = []
+
+    # Deliver what's spooled, batch_size at a time. A claim file that can't be
+    # delivered, or read, is kept and replayed again by us or whoever takes it over.
+    def replay(self):
+        for path in self.spool.claim():
+            try:
+                for name, value, timestamp in self.spool.read(path):
+                    self.client.send(name, value, timestamp)
+            except socket.error:
+                raise
+            except (IOError, OSError):
+                continue
+            self.client.flush()
+            self.spool.release(path)
+
+    # Deliver what's queued, or spool it when that takes longer than close_timeout.
+    # A stuck write is aborted so the thread spools the rest itself. When it is
+    # stuck connecting the batch being sent is spooled as well, a duplicate just
+    # overwrites the same datapoint in graphite.
+    def close(self):
+        self.to_spool(self.overflow)
+        self.overflow = []
+        self.closing.set()
+        try:
+            self.queue.put_nowait(None)
+        except Full:
+            pass  # Not waiting for more anyway
+        self.thread.join(self.close_timeout)
+        if self.thread.is_alive():
+            self.retry_at = float('inf')
+            self.client.retries = 0
+            sock = self.client.sock
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+            self.thread.join(0.5)
+        if self.thread.is_alive():
+            metrics = list(self.inflight)
+            while True:
+                try:
+                    metrics.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            self.to_spool([metric for metric in metrics if metric is not None])
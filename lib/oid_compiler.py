@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# @descr    Compiles every OID the scripts use into lib/oids.py, so that lib.cnh_nm
+#           can translate them without net-snmp having to parse the MIB tree
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# Run by setup.py after the MIBs are installed, or by hand after adding OIDs to
+# a script: python lib/oid_compiler.py
+#
+# Requires snmptranslate (net-snmp) and the MIBs in its search path.
+#
+
+import os
+import re
+import subprocess
+import sys
+from glob import glob
+
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+default_output = os.path.join(basedir, 'lib', 'oids.py')
+
+symbolic_oid_re = re.compile(r"\b([A-Z][A-Za-z0-9-]*-MIB)::([a-zA-Z][A-Za-z0-9]*)")
+numeric_oid_re = re.compile(r"['\"](\.1\.3\.6\.1(?:\.[0-9]+)+)")
+translate_tree_re = re.compile(r'^"([^"]+)"\s+"([0-9.]+)"$')
+
+
+# Find all symbolic (MIB::name) and numeric OIDs used by the scripts
+def find_oids():
+    symbolic = set()
+    numeric = set()
+    paths = glob(os.path.join(basedir, '*.py')) + glob(os.path.join(basedir, 'graphite', '*.py'))
+    for path in paths:
+        with open(path) as f:
+            source = f.read()
+        for mib, name in symbolic_oid_re.findall(source):
+            symbolic.add("{}::{}".format(mib, name))
+        for oid in numeric_oid_re.findall(source):
+            numeric.add(oid)
+    return symbolic, numeric
+
+
+def snmptranslate(*args):
+    return subprocess.check_output(['snmptranslate', '-m', 'ALL'] + list(args)).strip()
+
+
+# The complete loaded MIB tree, as numeric OID -> name
+def mib_tree():
+    tree = {}
+    for line in snmptranslate('-Tz').splitlines():
+        match = translate_tree_re.match(line.strip())
+        if match:
+            tree['.' + match.group(2)] = match.group(1)
+    return tree
+
+
+# Compile the OID table: numeric OIDs of all symbolic names, and the names of all
+# objects below them (table columns) or above the numeric ones (columns of instances)
+def compile_oid_table(output=default_output):
+    symbolic, numeric = find_oids()
+    tree = mib_tree()
+
+    oids = {}
+    for name in sorted(symbolic):
+        try:
+            oids[name] = snmptranslate('-On', name)
+        except subprocess.CalledProcessError:
+            print "Failed to translate {}, skipping".format(name)
+
+    roots = set(oids.values())
+    for oid in numeric:
+        parts = oid.split('.')
+        while len(parts) > 1 and '.'.join(parts) not in tree:
+            parts.pop()
+        if len(parts) > 1:
+            roots.add('.'.join(parts))
+
+    columns = {}
+    for oid, name in tree.iteritems():
+        parts = oid.split('.')
+        for length in xrange(len(parts), 1, -1):
+            if '.'.join(parts[:length]) in roots:
+                columns[oid] = name
+                break
+
+    # Written next to the output and renamed into place, a failed write must not leave
+    # a half written table that every check would fail to import
+    tmpoutput = output + '.tmp'
+    with open(tmpoutput, 'w') as f:
+        f.write("#\n# Generated by lib/oid_compiler.py, do not edit\n#\n\n")
+        f.write("OIDS = {\n")
+        f.write(",\n".join("    {!r}: {!r}".format(name, oid) for name, oid in sorted(oids.iteritems())))
+        f.write("\n}\n\nCOLUMNS = {\n")
+        f.write(",\n".join("    {!r}: {!r}".format(oid, name) for oid, name in sorted(columns.iteritems())))
+        f.write("\n}\n")
+    os.rename(tmpoutput, output)
+    return len(oids), len(columns)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        num_oids, num_columns = compile_oid_table(sys.argv[1])
+    else:
+        num_oids, num_columns = compile_oid_table()
+    print "Compiled {} OIDs and {} column names".format(num_oids, num_columns)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#
+# @descr    Minimal in-process SNMPv2c agent, serving a static OID tree for testing
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# Answers GET, GETNEXT and GETBULK from a dict of numeric OID -> (easysnmp type
+# name, value), e.g.
+#   agent = SnmpAgent({'.1.3.6.1.2.1.1.5.0': ('OCTETSTR', 'router1')})
+#   agent.start()
+#   ... poll 127.0.0.1:agent.port ...
+#   agent.stop()
+#
+
+import random
+import select
+import socket
+import threading
+from bisect import bisect_left, bisect_right
+from time import sleep
+from lib.snmp_engine import PDU_GET, PDU_GETNEXT, PDU_GETBULK, PDU_RESPONSE
+from lib.snmp_engine import SNMP_NOSUCHINSTANCE, SNMP_ENDOFMIBVIEW, SnmpEngineError
+from lib.snmp_engine import ber_tlv, ber_value, oid_to_tuple, snmp_encode_message, snmp_decode_message
+
+
+class SnmpAgent(object):
+
+    def __init__(self, tree, community='public', bind=('127.0.0.1', 0), latency=0.0, loss=0.0):
+        self.community = community
+        self.latency = latency
+        self.loss = loss
+        self.oids = []
+        self.values = {}
+        self.update(tree)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(bind)
+        self.address, self.port = self.sock.getsockname()
+        self.requests = 0
+        self.running = False
+        self.thread = None
+
+    # Add or replace OIDs in the served tree
+    def update(self, tree):
+        for oid, (snmp_type, value) in tree.iteritems():
+            self.values[oid_to_tuple(oid)] = ber_value(snmp_type, value)
+        self.oids = sorted(self.values)
+
+    def get(self, oid):
+        if oid in self.values:
+            return oid, self.values[oid]
+        return oid, ber_tlv(SNMP_NOSUCHINSTANCE, bytearray())
+
+    def getnext(self, oid):
+        pos = bisect_right(self.oids, oid)
+        if pos < len(self.oids):
+            return self.oids[pos], self.values[self.oids[pos]]
+        return oid, ber_tlv(SNMP_ENDOFMIBVIEW, bytearray())
+
+    # Build the response varbinds for a decoded request
+    def handle(self, msg):
+        oids = [oid for oid, tag, data in msg['varbinds']]
+        if msg['pdu_type'] == PDU_GET:
+            return [self.get(oid) for oid in oids]
+        elif msg['pdu_type'] == PDU_GETNEXT:
+            return [self.getnext(oid) for oid in oids]
+        non_repeaters = max(0, msg['error_status'])
+        max_repetitions = max(0, msg['error_index'])
+        varbinds = [self.getnext(oid) for oid in oids[:non_repeaters]]
+        repeaters = oids[non_repeaters:]
+        for i in xrange(max_repetitions):
+            row = [self.getnext(oid) for oid in repeaters]
+            varbinds += row
+            repeaters = [oid for oid, value in row]
+            if bisect_left(self.oids, max(repeaters or [()])) >= len(self.oids):
+                break
+        return varbinds
+
+    def serve_once(self, timeout=0.1):
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        if not readable:
+            return
+        data, address = self.sock.recvfrom(65535)
+        try:
+            msg = snmp_decode_message(data)
+        except (SnmpEngineError, IndexError, ValueError):
+            return
+        if msg['community'] != self.community or msg['pdu_type'] not in (PDU_GET, PDU_GETNEXT, PDU_GETBULK):
+            return
+        self.requests += 1
+        if self.loss and random.random() < self.loss:
+            return
+        if self.latency:
+            sleep(self.latency)
+        response = snmp_encode_message(self.community, PDU_RESPONSE, msg['request_id'], self.handle(msg))
+        self.sock.sendto(response, address)
+
+    def serve_forever(self):
+        while self.running:
+            self.serve_once()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        self.sock.close()
@@ -0,0 +1,565 @@
+#!/usr/bin/env python
+#
+# @descr    Non-blocking SNMPv2c engine, multiplexing requests to many devices over one UDP socket per address family
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# Python 2 has no asyncio, so this is a small select() based reactor instead:
+# requests are queued on an SnmpEngine, and run() sends and drives all of them
+# until they are done. Responses are demultiplexed on their request-id, and every request
+# has its own timeout and retry budget.
+#
+# Only SNMPv2c is spoken natively. lib.cnh_nm's snmp_engine_get() and
+# snmp_engine_bulkwalk() queue SNMPv3 requests (USM auth/priv) on the pooled
+# easysnmp sessions instead, done by snmp_engine_run() after the engine's.
+#
+# OIDs have to be numeric since there is no MIB parser in here, a mapping of
+# column names can be given to get results keyed the same way as easysnmp
+# results run through snmpresult_to_dict().
+#
+
+import random
+import select
+import socket
+from time import time
+
+
+# BER/SNMP tags
+ASN_INTEGER = 0x02
+ASN_OCTET_STR = 0x04
+ASN_NULL = 0x05
+ASN_OBJECT_ID = 0x06
+ASN_SEQUENCE = 0x30
+ASN_IPADDRESS = 0x40
+ASN_COUNTER32 = 0x41
+ASN_GAUGE32 = 0x42
+ASN_TIMETICKS = 0x43
+ASN_OPAQUE = 0x44
+ASN_COUNTER64 = 0x46
+SNMP_NOSUCHOBJECT = 0x80
+SNMP_NOSUCHINSTANCE = 0x81
+SNMP_ENDOFMIBVIEW = 0x82
+PDU_GET = 0xa0
+PDU_GETNEXT = 0xa1
+PDU_RESPONSE = 0xa2
+PDU_GETBULK = 0xa5
+
+SNMP_VERSION_2C = 1
+
+# Value types as named by easysnmp
+snmp_type_mapper = {
+    ASN_INTEGER: 'INTEGER',
+    ASN_OCTET_STR: 'OCTETSTR',
+    ASN_NULL: 'NULL',
+    ASN_OBJECT_ID: 'OBJECTID',
+    ASN_IPADDRESS: 'IPADDR',
+    ASN_COUNTER32: 'COUNTER',
+    ASN_GAUGE32: 'GAUGE',
+    ASN_TIMETICKS: 'TICKS',
+    ASN_OPAQUE: 'OPAQUE',
+    ASN_COUNTER64: 'COUNTER64',
+    SNMP_NOSUCHOBJECT: 'NOSUCHOBJECT',
+    SNMP_NOSUCHINSTANCE: 'NOSUCHINSTANCE',
+    SNMP_ENDOFMIBVIEW: 'ENDOFMIBVIEW'
+}
+snmp_type_tags = dict((v, k) for k, v in snmp_type_mapper.iteritems())
+
+
+class SnmpEngineError(Exception):
+    pass
+
+
+# Minimal stand-in for easysnmp's SNMPVariable
+class SnmpVariable(object):
+    __slots__ = ('oid', 'oid_index', 'value', 'snmp_type')
+
+    def __init__(self, oid, oid_index, value, snmp_type):
+        self.oid = oid
+        self.oid_index = oid_index
+        self.value = value
+        self.snmp_type = snmp_type
+
+    def __repr__(self):
+        return "<SnmpVariable value={} (oid={}, oid_index={}, snmp_type={})>".format(
+            repr(self.value), repr(self.oid), repr(self.oid_index), repr(self.snmp_type))
+
+
+# Convert a numeric OID string into a tuple of ints
+def oid_to_tuple(oid):
+    return tuple(int(part) for part in oid.strip('.').split('.') if part)
+
+
+# Convert a tuple of ints into a numeric OID string
+def oid_to_str(oid):
+    return '.' + '.'.join(str(part) for part in oid)
+
+
+# BER encoding helpers
+def ber_length(length):
+    if length < 0x80:
+        return bytearray([length])
+    octets = bytearray()
+    while length:
+        octets.insert(0, length & 0xff)
+        length >>= 8
+    return bytearray([0x80 | len(octets)]) + octets
+
+
+def ber_tlv(tag, value):
+    return bytearray([tag]) + ber_length(len(value)) + value
+
+
+def ber_integer(value, tag=ASN_INTEGER):
+    octets = bytearray()
+    while True:
+        octets.insert(0, value & 0xff)
+        value >>= 8
+        if (value == 0 and not octets[0] & 0x80) or (value == -1 and octets[0] & 0x80):
+            break
+    return ber_tlv(tag, octets)
+
+
+def ber_unsigned(value, tag):
+    octets = bytearray()
+    while True:
+        octets.insert(0, value & 0xff)
+        value >>= 8
+        if value == 0:
+            break
+    if octets[0] & 0x80:
+        octets.insert(0, 0)
+    return ber_tlv(tag, octets)
+
+
+def ber_oid(oid):
+    if len(oid) < 2:
+        oid = tuple(oid) + (0,) * (2 - len(oid))
+    octets = bytearray()
+    for arc in [oid[0] * 40 + oid[1]] + list(oid[2:]):
+        encoded = bytearray([arc & 0x7f])
+        arc >>= 7
+        while arc:
+            encoded.insert(0, 0x80 | (arc & 0x7f))
+            arc >>= 7
+        octets += encoded
+    return ber_tlv(ASN_OBJECT_ID, octets)
+
+
+def ber_sequence(items, tag=ASN_SEQUENCE):
+    body = bytearray()
+    for item in items:
+        body += item
+    return ber_tlv(tag, body)
+
+
+# Encode a value of the given easysnmp type name
+def ber_value(snmp_type, value):
+    tag = snmp_type_tags[snmp_type]
+    if tag == ASN_INTEGER:
+        return ber_integer(int(value))
+    elif tag in (ASN_COUNTER32, ASN_GAUGE32, ASN_TIMETICKS, ASN_COUNTER64):
+        return ber_unsigned(int(value), tag)
+    elif tag == ASN_OBJECT_ID:
+        return ber_oid(oid_to_tuple(value))
+    elif tag == ASN_IPADDRESS:
+        return ber_tlv(tag, bytearray(socket.inet_aton(value)))
+    elif tag in (ASN_OCTET_STR, ASN_OPAQUE):
+        if isinstance(value, unicode):
+            value = value.encode('latin1')
+        return ber_tlv(tag, bytearray(value))
+    return ber_tlv(tag, bytearray())
+
+
+# BER decoding helpers
+def ber_decode_tlv(data, offset=0):
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        num_octets = length & 0x7f
+        length = 0
+        for octet in data[offset:offset + num_octets]:
+            length = (length << 8) | octet
+        offset += num_octets
+    if offset + length > len(data):
+        raise SnmpEngineError('Truncated BER data')
+    return tag, data[offset:offset + length], offset + length
+
+
+def ber_decode_sequence(data):
+    items = []
+    offset = 0
+    while offset < len(data):
+        tag, value, offset = ber_decode_tlv(data, offset)
+        items.append((tag, value))
+    return items
+
+
+def ber_decode_integer(data):
+    value = 0
+    for octet in data:
+        value = (value << 8) | octet
+    if data and data[0] & 0x80:
+        value -= 1 << (8 * len(data))
+    return value
+
+
+def ber_decode_unsigned(data):
+    value = 0
+    for octet in data:
+        value = (value << 8) | octet
+    return value
+
+
+def ber_decode_oid(data):
+    arcs = []
+    arc = 0
+    for octet in data:
+        arc = (arc << 7) | (octet & 0x7f)
+        if not octet & 0x80:
+            arcs.append(arc)
+            arc = 0
+    if not arcs:
+        return ()
+    first = min(arcs[0] // 40, 2)
+    return (first, arcs[0] - first * 40) + tuple(arcs[1:])
+
+
+# Decode a value into the (unicode value, easysnmp type name) easysnmp would give us
+def ber_decode_value(tag, data):
+    snmp_type = snmp_type_mapper.get(tag, 'UNKNOWN')
+    if tag == ASN_INTEGER:
+        value = unicode(ber_decode_integer(data))
+    elif tag in (ASN_COUNTER32, ASN_GAUGE32, ASN_TIMETICKS, ASN_COUNTER64):
+        value = unicode(ber_decode_unsigned(data))
+    elif tag == ASN_OBJECT_ID:
+        value = unicode(oid_to_str(ber_decode_oid(data)))
+    elif tag == ASN_IPADDRESS:
+        value = unicode(socket.inet_ntoa(str(data)))
+    elif tag in (SNMP_NOSUCHOBJECT, SNMP_NOSUCHINSTANCE, SNMP_ENDOFMIBVIEW):
+        value = unicode(snmp_type)
+    elif tag == ASN_NULL:
+        value = u''
+    else:
+        value = str(data).decode('latin1')
+    return value, snmp_type
+
+
+# Encode a complete SNMPv2c message
+def snmp_encode_message(community, pdu_type, request_id, varbinds, error_status=0, error_index=0):
+    encoded_varbinds = []
+    for oid, value in varbinds:
+        if value is None:
+            value = ber_tlv(ASN_NULL, bytearray())
+        encoded_varbinds.append(ber_sequence([ber_oid(oid), value]))
+    pdu = ber_sequence([
+        ber_integer(request_id),
+        ber_integer(error_status),
+        ber_integer(error_index),
+        ber_sequence(encoded_varbinds)
+    ], pdu_type)
+    return ber_sequence([
+        ber_integer(SNMP_VERSION_2C),
+        ber_tlv(ASN_OCTET_STR, bytearray(community)),
+        pdu
+    ])
+
+
+# Decode a complete SNMPv2c message into a dict, varbinds are (oid tuple, tag, raw value)
+def snmp_decode_message(data):
+    tag, message, _ = ber_decode_tlv(bytearray(data))
+    if tag != ASN_SEQUENCE:
+        raise SnmpEngineError('Not an SNMP message')
+    items = ber_decode_sequence(message)
+    if len(items) != 3:
+        raise SnmpEngineError('Malformed SNMP message')
+    pdu_type, pdu = items[2]
+    pdu_items = ber_decode_sequence(pdu)
+    if len(pdu_items) != 4:
+        raise SnmpEngineError('Malformed SNMP PDU')
+    varbinds = []
+    for vb_tag, varbind in ber_decode_sequence(pdu_items[3][1]):
+        (oid_tag, oid_data), (value_tag, value_data) = ber_decode_sequence(varbind)
+        varbinds.append((ber_decode_oid(oid_data), value_tag, value_data))
+    return {
+        'version': ber_decode_integer(items[0][1]),
+        'community': str(items[1][1]),
+        'pdu_type': pdu_type,
+        'request_id': ber_decode_integer(pdu_items[0][1]),
+        'error_status': ber_decode_integer(pdu_items[1][1]),
+        'error_index': ber_decode_integer(pdu_items[2][1]),
+        'varbinds': varbinds
+    }
+
+
+# Split "host", "host:port" or "udp6:[address]:port" the same way easysnmp accepts
+# hostnames. A bare IPv6 address is taken as a host without a port.
+def split_hostport(host, default_port=161):
+    if host.startswith('udp6:'):
+        host = host[5:]
+    if host.startswith('['):
+        address, sep, port = host[1:].partition(']')
+        if port.startswith(':'):
+            return address, int(port[1:])
+        return address, default_port
+    if host.count(':') == 1:
+        host, port = host.split(':')
+        return host, int(port)
+    return host, default_port
+
+
+# A single queued get or bulkwalk, done when either result or error is set
+class SnmpOperation(object):
+
+    def __init__(self, engine, host, community, oids, names, timeout, retries):
+        self.engine = engine
+        self.host = host
+        self.family = None
+        self.address = None
+        self.community = community
+        self.names = dict((oid_to_tuple(oid), name) for oid, name in (names or {}).iteritems())
+        self.timeout = timeout
+        self.retries = retries
+        self.result = None
+        self.error = None
+        self.error_status = 0
+        self.timed_out = False
+        self.done = False
+        self.elapsed = None
+        self.requested = oids
+        self.roots = [oid_to_tuple(oid) for oid in oids]
+        self.request_id = None
+        self.message = None
+        self.tries = 0
+        self.expires = None
+        self.started = time()
+
+    def begin(self):
+        self.started = time()
+        self.start()
+
+    # Name of the column and the index of a returned OID, preferring the longest
+    # named prefix and falling back on the given root
+    def split_oid(self, root, oid):
+        for length in xrange(len(oid) - 1, 0, -1):
+            if oid[:length] in self.names:
+                root = oid[:length]
+                return self.names[root], '.'.join(str(part) for part in oid[length:])
+        return oid_to_str(root), '.'.join(str(part) for part in oid[len(root):])
+
+    def send(self, pdu_type, varbinds, non_repeaters=0, max_repetitions=0):
+        self.request_id = self.engine.allocate_request_id(self)
+        if pdu_type == PDU_GETBULK:
+            error_status, error_index = non_repeaters, max_repetitions
+        else:
+            error_status, error_index = 0, 0
+        self.message = snmp_encode_message(self.community, pdu_type, self.request_id,
+                                           [(oid, None) for oid in varbinds], error_status, error_index)
+        self.engine.count(self.host, 'bulk_pdus' if pdu_type == PDU_GETBULK else 'get_pdus')
+        self.tries = 0
+        self.transmit()
+
+    def transmit(self):
+        self.tries += 1
+        self.expires = time() + self.timeout
+        self.engine.transmit(self)
+
+    def expired(self):
+        if self.tries <= self.retries:
+            self.engine.count(self.host, 'retries')
+            self.transmit()
+            return
+        self.timed_out = True
+        self.fail('Timeout')
+
+    def fail(self, error):
+        self.error = "{}: {}".format(self.host, error)
+        self.finish()
+
+    def finish(self):
+        self.done = True
+        self.elapsed = time() - self.started
+        self.engine.release_request_id(self.request_id)
+        self.engine.count(self.host, 'snmp_time', self.elapsed)
+
+
+class SnmpGet(SnmpOperation):
+
+    def start(self):
+        self.send(PDU_GET, self.roots)
+
+    def response(self, msg):
+        if msg['error_status']:
+            self.error_status = msg['error_status']
+            return self.fail("SNMP error status {} at index {}".format(msg['error_status'], msg['error_index']))
+        self.result = []
+        for (oid, tag, data), root in zip(msg['varbinds'], self.roots):
+            value, snmp_type = ber_decode_value(tag, data)
+            column, oid_index = self.split_oid(root[:-1], oid)
+            self.result.append(SnmpVariable(column, oid_index, value, snmp_type))
+        self.finish()
+
+
+class SnmpBulkWalk(SnmpOperation):
+
+    def start(self):
+        self.result = []
+        self.columns = [(root, root) for root in self.roots]  # (root, last seen oid)
+        self.next_request()
+
+    def next_request(self):
+        if not self.columns:
+            return self.finish()
+        max_repetitions = self.engine.repetitions.get(self.host, self.engine.max_repetitions)
+        self.send(PDU_GETBULK, [last for root, last in self.columns], 0, max_repetitions)
+
+    def response(self, msg):
+        if msg['error_status']:
+            self.error_status = msg['error_status']
+            return self.fail("SNMP error status {} at index {}".format(msg['error_status'], msg['error_index']))
+        num_columns = len(self.columns)
+        active = list(self.columns)
+        finished = set()
+        for i, (oid, tag, data) in enumerate(msg['varbinds']):
+            column = i % num_columns
+            if column in finished:
+                continue
+            root, last = active[column]
+            if tag == SNMP_ENDOFMIBVIEW or oid[:len(root)] != root or oid <= last:
+                finished.add(column)
+                continue
+            value, snmp_type = ber_decode_value(tag, data)
+            name, oid_index = self.split_oid(root, oid)
+            self.result.append(SnmpVariable(name, oid_index, value, snmp_type))
+            active[column] = (root, oid)
+        if not msg['varbinds']:
+            finished = set(range(num_columns))
+        self.columns = [col for i, col in enumerate(active) if i not in finished]
+        self.next_request()
+
+
+class SnmpEngine(object):
+
+    def __init__(self, timeout=1.0, retries=3, max_repetitions=25, bind=('0.0.0.0', 0)):
+        self.timeout = timeout
+        self.retries = retries
+        self.max_repetitions = max_repetitions
+        self.repetitions = {}  # host -> max_repetitions, where it differs
+        self.sockets = {}  # address family -> socket, IPv6 is opened on first use
+        self.open_socket(socket.AF_INET, bind)
+        self.pending = {}  # request-id -> operation
+        self.operations = []
+        self.addresses = {}
+        self.next_request_id = random.randint(1, 0x3fffffff)
+        self.stats = {}  # host -> counters, like lib.cnh_nm.snmp_stats
+
+    def close(self):
+        for sock in self.sockets.itervalues():
+            sock.close()
+
+    def open_socket(self, family, bind=None):
+        if family not in self.sockets:
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            sock.setblocking(0)
+            if bind is None:
+                bind = ('::', 0) if family == socket.AF_INET6 else ('0.0.0.0', 0)
+            sock.bind(bind)
+            self.sockets[family] = sock
+        return self.sockets[family]
+
+    # Address family and socket address of a host, preferring IPv4 like net-snmp does
+    # for names with both. Raises socket.error when it can't be resolved.
+    def resolve(self, host):
+        if host not in self.addresses:
+            hostname, port = split_hostport(host)
+            addresses = socket.getaddrinfo(hostname, port, socket.AF_UNSPEC, socket.SOCK_DGRAM)
+            addresses.sort(key=lambda address: address[0] != socket.AF_INET)
+            family, socktype, proto, canonname, address = addresses[0]
+            self.open_socket(family)
+            self.addresses[host] = (family, address)
+        return self.addresses[host]
+
+    def allocate_request_id(self, operation):
+        self.next_request_id = (self.next_request_id % 0x7fffffff) + 1
+        self.pending[self.next_request_id] = operation
+        return self.next_request_id
+
+    def release_request_id(self, request_id):
+        self.pending.pop(request_id, None)
+
+    def count(self, host, counter, value=1):
+        counts = self.stats.setdefault(host, {})
+        counts[counter] = counts.get(counter, 0) + value
+
+    def transmit(self, operation):
+        try:
+            self.sockets[operation.family].sendto(operation.message, operation.address)
+        except socket.error:
+            pass  # Handled like any other lost packet, by the timeout
+
+    def queue(self, cls, host, community, oids, names, timeout, retries):
+        if isinstance(oids, basestring):
+            oids = [oids]
+        if timeout is None:
+            timeout = self.timeout
+        if retries is None:
+            retries = self.retries
+        operation = cls(self, host, community, list(oids), names, timeout, retries)
+        self.operations.append(operation)
+        try:
+            operation.family, operation.address = self.resolve(host)
+        except socket.error as err:
+            operation.fail(err.strerror or err)
+        return operation
+
+    # Queue a get of one or more OIDs, result is a list of variables in requested order
+    def get(self, host, community, oids, names=None, timeout=None, retries=None):
+        return self.queue(SnmpGet, host, community, oids, names, timeout, retries)
+
+    # Queue a bulkwalk of one or more subtrees, result is a list of variables
+    def bulkwalk(self, host, community, oids, names=None, timeout=None, retries=None):
+        return self.queue(SnmpBulkWalk, host, community, oids, names, timeout, retries)
+
+    def receive(self, sock):
+        while True:
+            try:
+                data, address = sock.recvfrom(65535)
+            except socket.error:
+                return
+            try:
+                msg = snmp_decode_message(data)
+            except (SnmpEngineError, IndexError, ValueError):
+                continue  # Garbage, ignore
+            operation = self.pending.get(msg['request_id'])
+            if operation is None or operation.address[:2] != address[:2] or msg['pdu_type'] != PDU_RESPONSE:
+                continue  # Late reply to a retried or finished request
+            self.release_request_id(msg['request_id'])
+            self.count(operation.host, 'bytes', len(data))
+            self.count(operation.host, 'varbinds', len(msg['varbinds']))
+            operation.response(msg)
+
+    # Send all queued operations and drive them until they are done, or the deadline
+    # is reached
+    def run(self, deadline=None):
+        for operation in self.operations:
+            if operation.expires is None and not operation.done:
+                operation.begin()
+        while True:
+            self.operations = [op for op in self.operations if not op.done]
+            if not self.operations:
+                return True
+            now = time()
+            if deadline is not None and now >= deadline:
+                return False
+            for operation in self.operations:
+                if operation.expires <= now:
+                    operation.expired()
+            expires = [op.expires for op in self.operations if not op.done]
+            if not expires:
+                continue
+            wait = max(0, min(expires) - now)
+            if deadline is not None:
+                wait = min(wait, max(0, deadline - now))
+            readable, _, _ = select.select(self.sockets.values(), [], [], wait)
+            for sock in readable:
+                self.receive(sock)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+#
+# @descr    Recording of SNMP responses into fixture files, and replaying them
+#           in place of easysnmp sessions
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# lib.cnh_nm uses these when CNH_NM_RECORD or CNH_NM_REPLAY point at a fixture
+# file, so checks can be run offline:
+#   CNH_NM_RECORD=bgp.json ./check_bgp.py -C public -H router1 --all
+#   CNH_NM_REPLAY=bgp.json CNH_NM_REPLAY_LATENCY=0.005 ./check_bgp.py -C x -H router1 --all
+#
+# A fixture is a JSON file of {"hosts": {<host>[/<context>]: {"get": {<oid>: var},
+# "walk": {<oids>: [var, ...]}}}} where var is [oid, oid_index, value, snmp_type].
+# OIDs are keyed as the check asked for them, before any translation, and the
+# variables are recorded as named for the check.
+# Recording into an existing fixture adds to it. A fixture of a single host is
+# served whatever host the check is given.
+#
+# Checks polling many hosts at once through lib.snmp_engine are recorded and
+# replayed the same way, by RecordingEngine and ReplayEngine.
+#
+
+import fcntl
+import json
+import os
+from time import sleep, time
+from lib.snmp_engine import SnmpBulkWalk, SnmpVariable
+
+
+class SnmpFixture(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.hosts = {}
+        self.changed = False
+        try:
+            with open(path, 'r') as f:
+                self.hosts = json.load(f)['hosts']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    @staticmethod
+    def section(host, context=""):
+        if context:
+            return "{}/{}".format(host, context)
+        return host
+
+    @staticmethod
+    def walk_key(oids):
+        return ' '.join(oids)
+
+    def lookup(self, host, context=""):
+        section = self.section(host, context)
+        if section not in self.hosts:
+            recorded_hosts = set(name.split('/', 1)[0] for name in self.hosts)
+            if len(recorded_hosts) == 1:
+                section = self.section(recorded_hosts.pop(), context)
+        return self.hosts.get(section, {'get': {}, 'walk': {}})
+
+    def get(self, host, context, oid):
+        var = self.lookup(host, context)['get'].get(oid)
+        if var is None:
+            return self.missing(oid)
+        return SnmpVariable(*var)
+
+    # An OID that wasn't recorded, named as easysnmp names it: column and index of
+    # a symbolic OID, a numeric one is named by lib.cnh_nm.snmp_name_vars
+    @staticmethod
+    def missing(oid):
+        if '::' in oid:
+            column, sep, oid_index = oid.split('::', 1)[1].partition('.')
+            return SnmpVariable(column, oid_index, u'NOSUCHINSTANCE', 'NOSUCHINSTANCE')
+        return SnmpVariable(oid, '', u'NOSUCHINSTANCE', 'NOSUCHINSTANCE')
+
+    def walk(self, host, context, oids):
+        walks = self.lookup(host, context)['walk']
+        key = self.walk_key(oids)
+        if key in walks:
+            rows = walks[key]
+        else:  # Recorded as separate walks
+            rows = []
+            for oid in oids:
+                rows += walks.get(oid, [])
+        return [SnmpVariable(*var) for var in rows]
+
+    def record_get(self, host, context, oids, result):
+        gets = self.hosts.setdefault(self.section(host, context), {'get': {}, 'walk': {}})['get']
+        for oid, var in zip(oids, result):
+            gets[oid] = [var.oid, var.oid_index, var.value, var.snmp_type]
+        self.changed = True
+
+    def record_walk(self, host, context, oids, result):
+        walks = self.hosts.setdefault(self.section(host, context), {'get': {}, 'walk': {}})['walk']
+        walks[self.walk_key(oids)] = [[var.oid, var.oid_index, var.value, var.snmp_type] for var in result]
+        self.changed = True
+
+    # Write the fixture, merged with whatever other processes recorded in the meantime
+    def save(self):
+        if not self.changed:
+            return
+        with open(self.path + '.lock', 'a') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                hosts = SnmpFixture(self.path).hosts
+                for section, data in self.hosts.iteritems():
+                    merged = hosts.setdefault(section, {'get': {}, 'walk': {}})
+                    merged['get'].update(data['get'])
+                    merged['walk'].update(data['walk'])
+                tmppath = self.path + '.tmp'
+                with open(tmppath, 'w') as f:
+                    json.dump({'hosts': hosts}, f, indent=1, sort_keys=True)
+                os.rename(tmppath, self.path)
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+        self.changed = False
+
+
+# Serves recorded responses like an easysnmp Session, sleeping latency seconds per PDU
+class ReplaySession(object):
+
+    def __init__(self, fixture, hostname, context="", latency=0.0, retries=0):
+        self.fixture = fixture
+        self.hostname = hostname
+        self.context = context
+        self.latency = latency
+        self.retries = retries
+
+    def get(self, oids):
+        if self.latency:
+            sleep(self.latency)
+        if isinstance(oids, basestring):
+            return self.fixture.get(self.hostname, self.context, oids)
+        return [self.fixture.get(self.hostname, self.context, oid) for oid in oids]
+
+    def bulkwalk(self, oids, max_repetitions=10):
+        if isinstance(oids, basestring):
+            oids = [oids]
+        result = self.fixture.walk(self.hostname, self.context, oids)
+        if self.latency:
+            sleep(self.latency * (len(result) // max_repetitions + len(oids)))
+        return result
+
+    # The same walk a PDU at a time, as lib.cnh_nm walks when a deadline is set
+    def bulkwalk_pdus(self, oids, max_repetitions=10):
+        result = self.fixture.walk(self.hostname, self.context, oids)
+        pdus = len(result) // max_repetitions + len(oids)
+        for pdu in xrange(pdus):
+            if self.latency:
+                sleep(self.latency)
+            if pdu < pdus - 1:
+                yield result[pdu * max_repetitions:(pdu + 1) * max_repetitions]
+            else:
+                yield result[pdu * max_repetitions:]
+
+
+# Records the responses of an easysnmp Session into a fixture. The OIDs are sent
+# through translate, and the variables returned through name_vars before they
+# are recorded.
+class RecordingSession(object):
+
+    def __init__(self, session, fixture, context="", translate=None, name_vars=None):
+        self.session = session
+        self.fixture = fixture
+        self.context = context
+        self.translate = translate or (lambda oid: oid)
+        self.name_vars = name_vars or (lambda result: result)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def get(self, oids):
+        if isinstance(oids, basestring):
+            return self.get([oids])[0]
+        result = self.name_vars(self.session.get([self.translate(oid) for oid in oids]))
+        self.fixture.record_get(self.session.hostname, self.context, oids, result)
+        return result
+
+    def bulkwalk(self, oids, max_repetitions=10):
+        if isinstance(oids, basestring):
+            oids = [oids]
+        result = self.name_vars(self.session.bulkwalk([self.translate(oid) for oid in oids], max_repetitions=max_repetitions))
+        self.fixture.record_walk(self.session.hostname, self.context, oids, result)
+        return result
+
+
+# A get or bulkwalk queued on a ReplayEngine, done once the engine has run
+class ReplayOperation(object):
+
+    def __init__(self, host, oids, walk):
+        self.host = host
+        self.requested = oids
+        self.walk = walk
+        self.result = None
+        self.error = None
+        self.done = False
+
+
+# Serves recorded responses like a lib.snmp_engine.SnmpEngine. The requests are
+# served concurrently, so the latency is slept once for the longest of them.
+class ReplayEngine(object):
+
+    def __init__(self, fixture, latency=0.0, max_repetitions=25):
+        self.fixture = fixture
+        self.latency = latency
+        self.max_repetitions = max_repetitions
+        self.repetitions = {}
+        self.operations = []
+        self.stats = {}
+
+    def close(self):
+        pass
+
+    def count(self, host, counter, value=1):
+        counts = self.stats.setdefault(host, {})
+        counts[counter] = counts.get(counter, 0) + value
+
+    def queue(self, host, oids, walk):
+        if isinstance(oids, basestring):
+            oids = [oids]
+        operation = ReplayOperation(host, list(oids), walk)
+        self.operations.append(operation)
+        return operation
+
+    def get(self, host, community, oids, names=None, timeout=None, retries=None):
+        return self.queue(host, oids, False)
+
+    def bulkwalk(self, host, community, oids, names=None, timeout=None, retries=None):
+        return self.queue(host, oids, True)
+
+    def run(self, deadline=None):
+        longest = 0
+        for operation in self.operations:
+            if operation.walk:
+                operation.result = self.fixture.walk(operation.host, "", operation.requested)
+                max_repetitions = self.repetitions.get(operation.host, self.max_repetitions)
+                pdus = len(operation.result) // (max_repetitions * len(operation.requested)) + 1  # All columns per PDU
+                self.count(operation.host, 'bulk_pdus', pdus)
+            else:
+                operation.result = [self.fixture.get(operation.host, "", oid) for oid in operation.requested]
+                pdus = 1
+                self.count(operation.host, 'get_pdus')
+            self.count(operation.host, 'varbinds', len(operation.result))
+            longest = max(longest, pdus)
+        wait = self.latency * longest
+        if deadline is not None and time() + wait > deadline:
+            sleep(max(0, deadline - time()))
+            return False
+        sleep(wait)
+        for operation in self.operations:
+            operation.done = True
+        self.operations = []
+        return True
+
+
+# Records the responses of a lib.snmp_engine.SnmpEngine into a fixture
+class RecordingEngine(object):
+
+    def __init__(self, engine, fixture):
+        self.engine = engine
+        self.fixture = fixture
+        self.queued = []
+
+    def __getattr__(self, name):
+        return getattr(self.engine, name)
+
+    def get(self, host, community, oids, names=None, timeout=None, retries=None):
+        operation = self.engine.get(host, community, oids, names, timeout, retries)
+        self.queued.append(operation)
+        return operation
+
+    def bulkwalk(self, host, community, oids, names=None, timeout=None, retries=None):
+        operation = self.engine.bulkwalk(host, community, oids, names, timeout, retries)
+        self.queued.append(operation)
+        return operation
+
+    def run(self, deadline=None):
+        completed = self.engine.run(deadline)
+        for operation in self.queued:
+            if not operation.done or operation.error:
+                continue
+            if isinstance(operation, SnmpBulkWalk):
+                self.fixture.record_walk(operation.host, "", operation.requested, operation.result)
+            else:
+                self.fixture.record_get(operation.host, "", operation.requested, operation.result)
+        self.queued = []
+        return completed
@@ -8,8 +8,8 @@
 import sys
 import argparse
 from lib.cnh_nm import STATE_OK, STATE_CRIT, STATE_WARN
-from lib.cnh_nm import my_snmp_get, my_snmp_walk, snmpresult_to_dict, my_snmp_get_int
-from lib.cnh_nm import trigger_not_ok, check_if_ok
+from lib.cnh_nm import my_snmp_walk, snmpresult_to_table, my_snmp_get_many
+from lib.cnh_nm import trigger_not_ok, check_if_ok, snmp_perfdata
 from struct import unpack
 
 
@@ -34,14 +34,14 @@ oid_state_standby = 'ENTITY-STATE-MIB::entStateStandby.{}'
 # And skipping checking for standby units as those will
 # most likely show up as disabled
 def check_entity_state(index, entity_name):
-    global args, status, statusstr, oid_state_oper
+    global state_data, status, statusstr, oid_state_oper
     global oid_state_usage, oid_state_alarm, oid_state_standby
 
-    standby_status = my_snmp_get_int(args, oid_state_standby.format(index))
+    standby_status = int(str(state_data[oid_state_standby.format(index)].value))
     if standby_status in [2, 3]:  # Entity is standby unit
         return
 
-    oper_status = my_snmp_get_int(args, oid_state_oper.format(index))
+    oper_status = int(str(state_data[oid_state_oper.format(index)].value))
     if oper_status == 2:  # disabled
         status, statusstr = trigger_not_ok(
             status,
@@ -49,7 +49,7 @@ def check_entity_state(index, entity_name):
             STATE_CRIT,
             'Entity {} is in a disabled state'.format(entity_name))
 
-    usage_status = my_snmp_get_int(args, oid_state_usage.format(index))
+    usage_status = int(str(state_data[oid_state_usage.format(index)].value))
     if usage_status == 4:  # busy
         status, statusstr = trigger_not_ok(
             status,
@@ -57,7 +57,7 @@ def check_entity_state(index, entity_name):
             STATE_CRIT,
             'Entity {} is fully utilized, no capacity left'.format(entity_name))
 
-    alarm_status = my_snmp_get(args, oid_state_alarm.format(index)).value.encode('latin1')
+    alarm_status = state_data[oid_state_alarm.format(index)].value.encode('latin1')
     alarm_bit = unpack("B", alarm_status)[0]
     if alarm_bit == 0:  # unknown, but also ok
         return
@@ -103,8 +103,8 @@ def check_entity_state(index, entity_name):
 # Not checking temps, fan speeds etc as only values are available
 # There are no thresholds exposed over SNMP
 def check_sensor_oper_status(index, sensor_name):
-    global args, status, statusstr, oid_sensor_operstatus
-    oper_status = my_snmp_get(args, oid_sensor_operstatus.format(index))
+    global state_data, status, statusstr, oid_sensor_operstatus
+    oper_status = state_data[oid_sensor_operstatus.format(index)]
     if oper_status.value == u'1':  # Ok
         return
     elif oper_status.value == u'2':  # Unavailable
@@ -122,15 +122,15 @@ def check_sensor_oper_status(index, sensor_name):
 
 
 # Get all environmental modules and put in a nicely ordered dict
-rawdata = my_snmp_walk(args, 'ENTITY-MIB::entPhysicalTable')
-data = snmpresult_to_dict(rawdata)
+data = snmpresult_to_table(my_snmp_walk(args, 'ENTITY-MIB::entPhysicalTable'))
 
 
-# Now we loop over the data and perform poweradmin/poweroper/sensorstatus checks
+# Now we loop over the data and pick out the entities to check
 status = STATE_OK
 statusstr = ''
 serial_number = ''
 model_name = ''
+entity_checks = []  # (index, name, check sensor status)
 for index, entity in data.iteritems():
     descr = entity['entPhysicalDescr'].value
     physical_class = int(str(entity['entPhysicalClass'].value))
@@ -150,16 +150,32 @@ for index, entity in data.iteritems():
     elif physical_class == 5:  # Container - (Port modules), no sensors here either
         continue
     elif physical_class == 6:  # Power Supply
-        check_entity_state(index, hr_name)
+        entity_checks.append((index, hr_name, False))
     elif physical_class == 8:  # Sensor (includes fans in Mellanox world)
-        check_entity_state(index, hr_name)
-        check_sensor_oper_status(index, hr_name)
+        entity_checks.append((index, hr_name, True))
     elif physical_class == 12:  # CPU
-        check_entity_state(index, hr_name)
+        entity_checks.append((index, hr_name, False))
+
+
+# Fetch the states of all entities at once, then perform the state/sensorstatus checks
+state_oids = []
+for index, hr_name, check_sensor in entity_checks:
+    state_oids.append(oid_state_standby.format(index))
+    state_oids.append(oid_state_oper.format(index))
+    state_oids.append(oid_state_usage.format(index))
+    state_oids.append(oid_state_alarm.format(index))
+    if check_sensor:
+        state_oids.append(oid_sensor_operstatus.format(index))
+state_data = my_snmp_get_many(args, state_oids)
+
+for index, hr_name, check_sensor in entity_checks:
+    check_entity_state(index, hr_name)
+    if check_sensor:
+        check_sensor_oper_status(index, hr_name)
 
 
 # All done, check status and exit
 check_if_ok(status, statusstr)
 
-print "OK: Health ok on {} switch with serial {}".format(model_name, serial_number)
+print "OK: Health ok on {} switch with serial {}".format(model_name, serial_number) + snmp_perfdata()
 sys.exit(STATE_OK)
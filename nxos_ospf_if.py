@@ -9,7 +9,8 @@ import sys
 import argparse
 from ipaddress import ip_address, ip_network
 from lib.cnh_nm import STATE_OK, STATE_CRIT
-from lib.cnh_nm import snmpresult_to_dict, my_snmp_walk_v3, snmp_translate_oid2string, my_snmp_get_v3
+from lib.cnh_nm import snmpresult_to_dict, snmpresult_to_table, my_snmp_walk_v3, snmp_translate_oid2string, my_snmp_get_v3
+from lib.cnh_nm import snmp_perfdata, profile_span
 
 
 # OSPF states:
@@ -45,6 +46,8 @@ parser.add_argument('-H', metavar='<host>', required=True,
                     help='Host to check')
 parser.add_argument('-I', metavar='<interface>', required=True,
                     help='Interface to check')
+parser.add_argument('-T', metavar='<seconds>', type=int, default=None,
+                    help='Share walk results with other checks of this host for this many seconds')
 args = parser.parse_args()
 
 
@@ -57,7 +60,7 @@ nei_oids = [
 
 
 # Iterating all SNMPv3 contexts that have a configured VRF mapping
-rawdata = my_snmp_walk_v3(args, 'CISCO-CONTEXT-MAPPING-MIB::cContextMappingVrfName')
+rawdata = my_snmp_walk_v3(args, 'CISCO-CONTEXT-MAPPING-MIB::cContextMappingVrfName', cache_ttl=args.T)
 data = snmpresult_to_dict(rawdata)
 for index, mapping in data.iteritems():
     if not mapping['cContextMappingVrfName'].value:
@@ -66,17 +69,16 @@ for index, mapping in data.iteritems():
     snmp_vrf = mapping['cContextMappingVrfName'].value
 
     # Get routing table of the current context
-    raw_ipforward = my_snmp_walk_v3(args, 'IP-FORWARD-MIB::inetCidrRouteIfIndex.1.4', snmp_context)
-    snmp_ipforward = snmpresult_to_dict(raw_ipforward)
+    snmp_ipforward = snmpresult_to_table(my_snmp_walk_v3(args, 'IP-FORWARD-MIB::inetCidrRouteIfIndex.1.4', snmp_context, cache_ttl=args.T))
     routingtable = []
-    for ipf_index, ipf_data in snmp_ipforward.iteritems():
+    for ipf_index, ipf_ifindex in zip(snmp_ipforward.row_indexes(), snmp_ipforward.column('inetCidrRouteIfIndex')):
         ipf_index_parts = ipf_index.split(".")
         ipf_ip = ".".join(ipf_index_parts[2:6])
         ipf_cidr = ipf_index_parts[6:7].pop()
-        routingtable.append({'ip': ipf_ip, 'cidr': ipf_cidr, 'ifindex': ipf_data['inetCidrRouteIfIndex'].value})
+        routingtable.append({'ip': ipf_ip, 'cidr': ipf_cidr, 'ifindex': ipf_ifindex})
 
     # Iterating the neighbors of the current context
-    raw_neighbors = my_snmp_walk_v3(args, nei_oids, snmp_context)
+    raw_neighbors = my_snmp_walk_v3(args, nei_oids, snmp_context, cache_ttl=args.T)
     neighbors = snmpresult_to_dict(raw_neighbors)
     for nei_index, nei_data in neighbors.iteritems():
         nei_ip = nei_data['ospfNbrIpAddr'].value
@@ -85,23 +87,24 @@ for index, mapping in data.iteritems():
 
         nei_ifindex = None
         last_route_size = None
-        for route in routingtable:
-            if ip_address(nei_ip) in ip_network(u"{}/{}".format(route['ip'], route['cidr'])):
-                if not last_route_size:
-                    last_route_size = route['cidr']
-                    nei_ifindex = route['ifindex']
-                elif int(last_route_size) < int(route['cidr']):
-                    last_route_size = route['cidr']
-                    nei_ifindex = route['ifindex']
+        with profile_span('route lookup', nei_ip):
+            for route in routingtable:
+                if ip_address(nei_ip) in ip_network(u"{}/{}".format(route['ip'], route['cidr'])):
+                    if not last_route_size:
+                        last_route_size = route['cidr']
+                        nei_ifindex = route['ifindex']
+                    elif int(last_route_size) < int(route['cidr']):
+                        last_route_size = route['cidr']
+                        nei_ifindex = route['ifindex']
         nei_ifname = my_snmp_get_v3(args, 'IF-MIB::ifDescr.{}'.format(nei_ifindex), snmp_context).value
         if args.I.lower() == nei_ifname.lower():
             if nei_state in ospf_ok_states:
-                print "OK: Found neighbor ({}) on {} in state full/two-way.".format(nei_rtrid, args.I)
+                print "OK: Found neighbor ({}) on {} in state full/two-way.".format(nei_rtrid, args.I) + snmp_perfdata()
                 sys.exit(STATE_OK)
             else:
-                print "CRITICAL: Neighbor ({}) on {} in state {}!".format(nei_rtrid, args.I, ospf_crit_statemapper[nei_state])
+                print "CRITICAL: Neighbor ({}) on {} in state {}!".format(nei_rtrid, args.I, ospf_crit_statemapper[nei_state]) + snmp_perfdata()
                 sys.exit(STATE_CRIT)
 
 
-print "CRITICAL: No neighbor found on interface {}!".format(args.I)
+print "CRITICAL: No neighbor found on interface {}!".format(args.I) + snmp_perfdata()
 sys.exit(STATE_CRIT)
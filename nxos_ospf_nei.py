@@ -8,7 +8,7 @@
 import sys
 import argparse
 from lib.cnh_nm import STATE_OK, STATE_CRIT
-from lib.cnh_nm import snmpresult_to_dict, my_snmp_walk_v3, snmp_translate_oid2string
+from lib.cnh_nm import snmpresult_to_dict, my_snmp_walk_v3, snmp_translate_oid2string, snmp_perfdata
 
 
 # OSPF states:
@@ -44,6 +44,8 @@ parser.add_argument('-H', metavar='<host>', required=True,
                     help='Host to check')
 parser.add_argument('-p', metavar='<peer>', required=True,
                     help='Neighbor to check (peer IP)')
+parser.add_argument('-T', metavar='<seconds>', type=int, default=None,
+                    help='Share walk results with other checks of this host for this many seconds')
 args = parser.parse_args()
 
 
@@ -56,7 +58,7 @@ nei_oids = [
 
 
 # Iterating all SNMPv3 contexts that have a configured VRF mapping
-rawdata = my_snmp_walk_v3(args, 'CISCO-CONTEXT-MAPPING-MIB::cContextMappingVrfName')
+rawdata = my_snmp_walk_v3(args, 'CISCO-CONTEXT-MAPPING-MIB::cContextMappingVrfName', cache_ttl=args.T)
 data = snmpresult_to_dict(rawdata)
 for index, mapping in data.iteritems():
     if not mapping['cContextMappingVrfName'].value:
@@ -65,7 +67,7 @@ for index, mapping in data.iteritems():
     snmp_vrf = mapping['cContextMappingVrfName'].value
 
     # Iterating the neighbors of the current context
-    raw_neighbors = my_snmp_walk_v3(args, nei_oids, snmp_context)
+    raw_neighbors = my_snmp_walk_v3(args, nei_oids, snmp_context, cache_ttl=args.T)
     neighbors = snmpresult_to_dict(raw_neighbors)
     for nei_index, nei_data in neighbors.iteritems():
         nei_ip = nei_data['ospfNbrIpAddr'].value
@@ -74,12 +76,12 @@ for index, mapping in data.iteritems():
 
         if nei_ip == args.p:
             if nei_state in ospf_ok_states:
-                print "OK: Neighbor {} RtrID {} in state full/two-way.".format(args.p, nei_rtrid)
+                print "OK: Neighbor {} RtrID {} in state full/two-way.".format(args.p, nei_rtrid) + snmp_perfdata()
                 sys.exit(STATE_OK)
             else:
-                print "CRITICAL: Neighbor {} RtrID {} in state {}!".format(args.p, nei_rtrid, ospf_crit_statemapper[nei_state])
+                print "CRITICAL: Neighbor {} RtrID {} in state {}!".format(args.p, nei_rtrid, ospf_crit_statemapper[nei_state]) + snmp_perfdata()
                 sys.exit(STATE_CRIT)
 
 
-print "CRITICAL: Neighbor {} not found!".format(args.p)
+print "CRITICAL: Neighbor {} not found!".format(args.p) + snmp_perfdata()
 sys.exit(STATE_CRIT)
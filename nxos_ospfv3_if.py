@@ -9,6 +9,7 @@ import sys
 import argparse
 from lib.cnh_nm import STATE_OK, STATE_CRIT
 from lib.cnh_nm import snmpresult_to_dict, my_snmp_walk_v3, snmp_translate_oid2string, my_snmp_get_v3, snmp_oid_decode_ip
+from lib.cnh_nm import snmp_perfdata
 
 
 ospf_ok_states = ['full', 'twoway']
@@ -72,12 +73,12 @@ for index, mapping in data.iteritems():
         nei_ifname = my_snmp_get_v3(args, 'IF-MIB::ifDescr.{}'.format(nei_ifindex), snmp_context).value
         if args.I.lower() == nei_ifname.lower():
             if nei_state in ospf_ok_states:
-                print "OK: Found neighbor ({}) on {} in state full/two-way.".format(nei_ip, args.I)
+                print "OK: Found neighbor ({}) on {} in state full/two-way.".format(nei_ip, args.I) + snmp_perfdata()
                 sys.exit(STATE_OK)
             else:
-                print "CRITICAL: Neighbor ({}) on {} in state {}!".format(nei_ip, args.I, nei_state)
+                print "CRITICAL: Neighbor ({}) on {} in state {}!".format(nei_ip, args.I, nei_state) + snmp_perfdata()
                 sys.exit(STATE_CRIT)
 
 
-print "CRITICAL: No neighbor found on interface {}!".format(args.I)
+print "CRITICAL: No neighbor found on interface {}!".format(args.I) + snmp_perfdata()
 sys.exit(STATE_CRIT)
@@ -2,6 +2,7 @@
 import os
 import sys
 import imp
+import subprocess
 from tempfile import mkstemp
 import tarfile
 from shutil import copyfile, rmtree
@@ -54,5 +55,17 @@ with FTPHost(cisco_miburl.netloc, 'anonymous', 'anonymous') as host:
         sys.exit(1)
 
 
+print "Compiling OID table..."
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from lib.oid_compiler import compile_oid_table  # noqa
+try:
+    num_oids, num_columns = compile_oid_table()
+    print "Compiled {} OIDs and {} column names into lib/oids.py".format(num_oids, num_columns)
+except (OSError, IOError, subprocess.CalledProcessError) as e:
+    print "Failed to compile the OID table ({}), skipping lib/oids.py.".format(e)
+    print "The checks work without it, but have net-snmp translate OIDs at runtime."
+    print "Run python lib/oid_compiler.py once snmptranslate and the MIBs are installed."
+
+
 print "Done."
 sys.exit(0)
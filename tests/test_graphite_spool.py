@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+# @descr    Tests of the disk spool of the graphite sender
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+from tempfile import mkdtemp
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.graphite import GraphiteSpool  # noqa
+
+
+# Pid of a process that has exited
+def dead_pid():
+    process = subprocess.Popen(['true'])
+    process.wait()
+    return process.pid
+
+
+class GraphiteSpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'spool', 'graphite_2003.spool')
+        self.spool = GraphiteSpool(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def replay(self, spool):
+        metrics = []
+        for path in spool.claim():
+            metrics += list(spool.read(path))
+            spool.release(path)
+        return metrics
+
+    def test_claim_and_replay(self):
+        self.assertFalse(self.spool.pending())
+        self.spool.append([('a.b', 1, 1000), ('a.c', 0.5, 1000)])
+        self.assertTrue(self.spool.pending())
+        claims = self.spool.claim()
+        self.assertEqual(len(claims), 1)
+        self.assertTrue(claims[0].startswith("{}.{}.".format(self.path, os.getpid())))
+        self.assertFalse(os.path.exists(self.path))
+
+        # Spooled while the claim is replayed, goes to the next claim
+        self.spool.append([('a.d', 2, 1001)])
+        self.assertEqual(list(self.spool.read(claims[0])), [('a.b', 1, 1000), ('a.c', 0.5, 1000)])
+        self.spool.release(claims[0])
+        self.assertEqual(self.replay(self.spool), [('a.d', 2, 1001)])
+        self.assertFalse(self.spool.pending())
+
+    def test_take_over_dead_claim(self):
+        dead = GraphiteSpool(self.path)
+        dead.append([('a.b', 1, 1000)])
+        path = dead.claim()[0]
+        orphan = "{}.{}.1.claim".format(self.path, dead_pid())
+        os.rename(path, orphan)
+
+        self.assertEqual(self.replay(self.spool), [('a.b', 1, 1000)])
+        self.assertFalse(os.path.exists(orphan))
+        self.assertEqual(self.spool.claim_files(), [])
+
+    def test_live_claim_left_alone(self):
+        other = GraphiteSpool(self.path)
+        other.append([('a.b', 1, 1000)])
+        path = other.claim()[0]
+        live = "{}.{}.1.claim".format(self.path, os.getppid())
+        os.rename(path, live)
+
+        self.assertEqual(self.spool.claim(), [])
+        self.assertTrue(os.path.exists(live))
+
+    # A claim of another process of ours is replayed by that one
+    def test_own_pid_claim_left_alone(self):
+        other = GraphiteSpool(self.path)
+        other.append([('a.b', 1, 1000)])
+        other.claim()
+        self.assertEqual(self.spool.claim(), [])
+
+    def test_corrupt_lines_dropped(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write("a.b 1 1000\na.c 1\na.d x 1000\na.e 2.5 1000\na.f 3 10")
+        self.assertEqual(self.replay(self.spool), [('a.b', 1, 1000), ('a.e', 2.5, 1000), ('a.f', 3, 10)])
+        self.assertEqual(self.spool.dropped, 2)
+
+    def test_full_spool(self):
+        spool = GraphiteSpool(self.path, max_size=20)
+        spool.append([('a.b', 1, 1000), ('a.c', 2, 1000)])
+        spool.append([('a.d', 3, 1000), ('a.e', 4, 1000)])
+        self.assertEqual(spool.dropped, 2)
+        self.assertEqual(self.replay(spool), [('a.b', 1, 1000), ('a.c', 2, 1000)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# @descr    Tests of the per-device concurrency limiter and polling rate budget
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+
+import os
+import shutil
+import sys
+import unittest
+from tempfile import mkdtemp
+from time import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import cnh_nm  # noqa
+
+
+class LimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.saved = dict((name, getattr(cnh_nm, name)) for name in (
+            'snmp_limits_dir', 'snmp_limits_file', 'snmp_limits', 'snmp_limiter_timeout', 'snmp_deadline'))
+        cnh_nm.snmp_limits_dir = os.path.join(self.tmpdir, 'limits')
+        cnh_nm.snmp_limits_file = os.path.join(self.tmpdir, 'limits.ini')
+        cnh_nm.snmp_limits = {}
+        cnh_nm.snmp_deadline = None
+        with open(cnh_nm.snmp_limits_file, 'w') as f:
+            f.write("[DEFAULT]\nconcurrency = 4\n\n[router1]\nconcurrency = 1\nrate = 20\nburst = 2\n")
+
+    def tearDown(self):
+        for name, value in self.saved.iteritems():
+            setattr(cnh_nm, name, value)
+        shutil.rmtree(self.tmpdir)
+
+    def test_host_limits(self):
+        self.assertEqual(cnh_nm.snmp_host_limits('router1'), (1, 20.0, 2.0))
+        self.assertEqual(cnh_nm.snmp_host_limits('router2'), (4, 0.0, 1.0))
+
+    def test_unparseable_limits(self):
+        with open(cnh_nm.snmp_limits_file, 'w') as f:
+            f.write("concurrency = 1\n")
+        self.assertEqual(cnh_nm.snmp_host_limits('router1'), (0, 0.0, 1.0))
+
+    def test_token_bucket(self):
+        self.assertEqual(cnh_nm.snmp_limiter_take_tokens('router1', 20.0, 2.0, 1), 0.0)
+        self.assertEqual(cnh_nm.snmp_limiter_take_tokens('router1', 20.0, 2.0, 1), 0.0)
+        # The bucket is empty, taking 3 more PDUs leaves a debt of 3 / 20 seconds, less
+        # whatever it refilled in the meantime
+        wait = cnh_nm.snmp_limiter_take_tokens('router1', 20.0, 2.0, 3)
+        self.assertTrue(0.1 < wait <= 0.15, wait)
+        self.assertTrue(wait < cnh_nm.snmp_limiter_take_tokens('router1', 20.0, 2.0, 1) <= wait + 0.05)
+
+    def test_token_bucket_refills(self):
+        with open(cnh_nm.snmp_limits_path('router1', 'bucket'), 'w') as f:
+            f.write("-1.0 {}\n".format(time() - 10))
+        self.assertEqual(cnh_nm.snmp_limiter_take_tokens('router1', 20.0, 2.0, 2), 0.0)
+
+    # A bulkwalk charged afterwards is waited for by the next request
+    def test_rate_wait(self):
+        cnh_nm.snmp_limiter_charge('router1', 3)
+        start = time()
+        with cnh_nm.snmp_limiter('router1'):
+            pass
+        self.assertGreaterEqual(time() - start, 0.05)
+
+    def test_slot_timeout(self):
+        cnh_nm.snmp_limiter_timeout = 0.2
+        slot = cnh_nm.snmp_limiter_acquire_slot('router1', 1)
+        start = time()
+        with self.assertRaises(cnh_nm.SnmpLimiterBusy):
+            with cnh_nm.snmp_limiter('router1'):
+                pass
+        self.assertAlmostEqual(time() - start, 0.2, delta=0.1)
+        slot.close()
+        with cnh_nm.snmp_limiter('router1'):
+            pass
+
+    def test_slot_timeout_bounded_by_deadline(self):
+        cnh_nm.snmp_deadline = time() + 0.4
+        slot = cnh_nm.snmp_limiter_acquire_slot('router1', 1)
+        start = time()
+        self.assertRaises(cnh_nm.SnmpLimiterBusy, cnh_nm.snmp_limiter_acquire_slot, 'router1', 1)
+        self.assertLess(time() - start, 0.4)
+        slot.close()
+
+    def test_free_slot(self):
+        slots = [cnh_nm.snmp_limiter_acquire_slot('router2', 2) for i in xrange(2)]
+        self.assertNotEqual(slots[0].name, slots[1].name)
+        slots[0].close()
+        slot = cnh_nm.snmp_limiter_acquire_slot('router2', 2)
+        self.assertEqual(slot.name, slots[0].name)
+        slot.close()
+        slots[1].close()
+
+
+if __name__ == '__main__':
+    unittest.main()
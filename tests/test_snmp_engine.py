@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+# @descr    Tests of the BER codec and the SNMP engine against the in-process agent
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+# Run from the root of the repository:
+#   python -m unittest discover tests
+#
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.snmp_agent import SnmpAgent  # noqa
+from lib.snmp_engine import PDU_GETBULK, PDU_RESPONSE, SnmpEngine, ber_decode_tlv, ber_decode_value, ber_value  # noqa
+from lib.snmp_engine import oid_to_tuple, snmp_decode_message, snmp_encode_message  # noqa
+
+
+if_descr = '.1.3.6.1.2.1.2.2.1.2'
+if_oper_status = '.1.3.6.1.2.1.2.2.1.8'
+sys_name = '.1.3.6.1.2.1.1.5.0'
+
+
+# An ifTable of <rows> interfaces and the sysName
+def if_tree(rows):
+    tree = {sys_name: ('OCTETSTR', 'router1')}
+    for index in xrange(1, rows + 1):
+        tree["{}.{}".format(if_descr, index)] = ('OCTETSTR', "Ethernet{}".format(index))
+        tree["{}.{}".format(if_oper_status, index)] = ('INTEGER', 1 if index % 2 else 2)
+    return tree
+
+
+class BerCodecTest(unittest.TestCase):
+
+    def test_value_round_trip(self):
+        values = [
+            ('INTEGER', 0, u'0'),
+            ('INTEGER', -1, u'-1'),
+            ('INTEGER', 128, u'128'),
+            ('INTEGER', -2147483648, u'-2147483648'),
+            ('COUNTER', 4294967295, u'4294967295'),
+            ('COUNTER64', 18446744073709551615, u'18446744073709551615'),
+            ('GAUGE', 1000000000, u'1000000000'),
+            ('TICKS', 12345, u'12345'),
+            ('OCTETSTR', 'Gi0/1 \xff', u'Gi0/1 \xff'),
+            ('IPADDR', '192.0.2.1', u'192.0.2.1'),
+            ('OBJECTID', '.1.3.6.1.4.1.9.1.1208', u'.1.3.6.1.4.1.9.1.1208'),
+        ]
+        for snmp_type, value, expected in values:
+            tag, data, end = ber_decode_tlv(ber_value(snmp_type, value))
+            self.assertEqual(ber_decode_value(tag, data), (expected, snmp_type))
+
+    def test_message_round_trip(self):
+        varbinds = [((1, 3, 6, 1, 2, 1, 1, 5, 0), ber_value('OCTETSTR', 'x' * 300)),
+                    ((1, 3, 6, 1, 4, 1, 200000, 1), ber_value('GAUGE', 7))]
+        data = snmp_encode_message('public', PDU_RESPONSE, 0x3fffffff, varbinds)
+        msg = snmp_decode_message(str(data))
+        self.assertEqual(msg['community'], 'public')
+        self.assertEqual(msg['pdu_type'], PDU_RESPONSE)
+        self.assertEqual(msg['request_id'], 0x3fffffff)
+        self.assertEqual([oid for oid, tag, value in msg['varbinds']], [oid for oid, value in varbinds])
+        self.assertEqual([ber_decode_value(tag, value) for oid, tag, value in msg['varbinds']],
+                         [(u'x' * 300, 'OCTETSTR'), (u'7', 'GAUGE')])
+
+    def test_getbulk_parameters(self):
+        data = snmp_encode_message('public', PDU_GETBULK, 1, [(oid_to_tuple(if_descr), None)], 0, 25)
+        msg = snmp_decode_message(str(data))
+        self.assertEqual((msg['error_status'], msg['error_index']), (0, 25))
+
+
+class SnmpEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.agent = SnmpAgent(if_tree(60))
+        self.agent.start()
+        self.host = "127.0.0.1:{}".format(self.agent.port)
+        self.engine = SnmpEngine(timeout=0.5, retries=1, max_repetitions=10)
+
+    def tearDown(self):
+        self.engine.close()
+        self.agent.stop()
+
+    def test_get(self):
+        get = self.engine.get(self.host, 'public', [sys_name, if_descr + '.3'],
+                              names={'.1.3.6.1.2.1.1.5': 'sysName', if_descr: 'ifDescr'})
+        self.engine.run()
+        self.assertIsNone(get.error)
+        self.assertEqual([(var.oid, var.oid_index, var.value) for var in get.result],
+                         [('sysName', '0', 'router1'), ('ifDescr', '3', 'Ethernet3')])
+
+    def test_bulkwalk(self):
+        walk = self.engine.bulkwalk(self.host, 'public', [if_descr, if_oper_status],
+                                    names={if_descr: 'ifDescr', if_oper_status: 'ifOperStatus'})
+        self.engine.run()
+        self.assertIsNone(walk.error)
+        descr = [(var.oid_index, var.value) for var in walk.result if var.oid == 'ifDescr']
+        status = [(var.oid_index, var.value) for var in walk.result if var.oid == 'ifOperStatus']
+        self.assertEqual(descr, [(str(index), "Ethernet{}".format(index)) for index in xrange(1, 61)])
+        self.assertEqual(status, [(str(index), u'1' if index % 2 else u'2') for index in xrange(1, 61)])
+        # 60 rows at 10 repetitions, plus the GETBULK that runs off the end of the columns
+        self.assertEqual(self.agent.requests, 7)
+
+    def test_bulkwalk_end_of_mib(self):
+        walk = self.engine.bulkwalk(self.host, 'public', [if_oper_status])
+        self.engine.run()
+        self.assertIsNone(walk.error)
+        self.assertEqual(len(walk.result), 60)
+        self.assertEqual(walk.result[0].oid, if_oper_status)
+
+    def test_timeout(self):
+        get = self.engine.get(self.host, 'wrong', [sys_name])
+        self.engine.run()
+        self.assertIsNone(get.result)
+        self.assertTrue(get.timed_out)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+# @descr    Tests of the columnar SnmpTable against the dicts of snmpresult_to_dict
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.cnh_nm import snmpresult_to_dict, snmpresult_to_table  # noqa
+from lib.snmp_engine import SnmpVariable  # noqa
+
+
+# A walk of ipNetToPhysicalTable-like columns, the last column only has some rows
+def walk_result():
+    result = []
+    for index in ('1.1.4.192.0.2.1', '1.1.4.192.0.2.2', '2.1.4.192.0.2.3'):
+        result.append(SnmpVariable('ipNetToPhysicalPhysAddress', index, u'\x00\x11\x22\x33\x44\x55', 'OCTETSTR'))
+    for index, value in (('1.1.4.192.0.2.1', u'3'), ('1.1.4.192.0.2.2', u'4'), ('2.1.4.192.0.2.3', u'3')):
+        result.append(SnmpVariable('ipNetToPhysicalType', index, value, 'INTEGER'))
+    result.append(SnmpVariable('ipNetToPhysicalState', '2.1.4.192.0.2.3', u'1', 'INTEGER'))
+    return result
+
+
+class SnmpTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = snmpresult_to_table(walk_result())
+
+    def test_rows(self):
+        self.assertEqual(len(self.table), 3)
+        self.assertEqual(self.table.row_indexes(), ['1.1.4.192.0.2.1', '1.1.4.192.0.2.2', '2.1.4.192.0.2.3'])
+        self.assertIn('2.1.4.192.0.2.3', self.table)
+        self.assertNotIn('2.1.4.192.0.2.4', self.table)
+        self.assertEqual(sorted(self.table.columns()),
+                         ['ipNetToPhysicalPhysAddress', 'ipNetToPhysicalState', 'ipNetToPhysicalType'])
+
+    def test_column(self):
+        self.assertEqual(self.table.column('ipNetToPhysicalType'), [u'3', u'4', u'3'])
+        self.assertEqual(list(self.table.column('ipNetToPhysicalType', int)), [3, 4, 3])
+        self.assertEqual(self.table.column('ipNetToPhysicalType', str), ['3', '4', '3'])
+        self.assertEqual(self.table.column('ipNetToPhysicalState', int), [None, None, 1])
+        self.assertEqual(self.table.column('ipNetToPhysicalMissing'), [None, None, None])
+
+    def test_get(self):
+        self.assertEqual(self.table.get('1.1.4.192.0.2.2', 'ipNetToPhysicalType'), u'4')
+        self.assertEqual(self.table.get('1.1.4.192.0.2.2', 'ipNetToPhysicalType', int), 4)
+        self.assertEqual(self.table.get('1.1.4.192.0.2.2', 'ipNetToPhysicalType', float), 4.0)
+        self.assertEqual(self.table.get('1.1.4.192.0.2.1', 'ipNetToPhysicalPhysAddress', len), 6)
+        self.assertIsNone(self.table.get('1.1.4.192.0.2.1', 'ipNetToPhysicalState', int))
+        self.assertIsNone(self.table.get('2.1.4.192.0.2.4', 'ipNetToPhysicalType'))
+        self.assertIsNone(self.table.get('1.1.4.192.0.2.1', 'ipNetToPhysicalMissing'))
+
+    # Rows are read the same way as those of snmpresult_to_dict
+    def test_rows_like_dict(self):
+        rows = snmpresult_to_dict(walk_result())
+        self.assertEqual(sorted(self.table.keys()), sorted(rows.keys()))
+        for index, row in self.table.iteritems():
+            self.assertEqual(sorted(row.keys()), sorted(rows[index].keys()))
+            for column in row:
+                self.assertEqual(row[column].value, rows[index][column].value)
+                self.assertEqual(row[column].snmp_type, rows[index][column].snmp_type)
+        self.assertIsNone(self.table['1.1.4.192.0.2.1'].get('ipNetToPhysicalState'))
+        self.assertRaises(KeyError, lambda: self.table['1.1.4.192.0.2.1']['ipNetToPhysicalState'])
+        self.assertRaises(KeyError, lambda: self.table['2.1.4.192.0.2.4'])
+
+    # An integer column turns into a list of values once a value isn't an integer
+    def test_mixed_column(self):
+        self.table.add('ipNetToPhysicalType', '1.1.4.192.0.2.2', u'NOSUCHINSTANCE', 'NOSUCHINSTANCE')
+        self.assertEqual(self.table.column('ipNetToPhysicalType'), [u'3', u'NOSUCHINSTANCE', u'3'])
+        self.assertEqual(self.table.get('1.1.4.192.0.2.1', 'ipNetToPhysicalType', int), 3)
+        self.assertRaises(ValueError, self.table.get, '1.1.4.192.0.2.2', 'ipNetToPhysicalType', int)
+        self.assertRaises(ValueError, self.table.column, 'ipNetToPhysicalType', int)
+        self.assertEqual(self.table['1.1.4.192.0.2.2']['ipNetToPhysicalType'].snmp_type, 'NOSUCHINSTANCE')
+        self.assertEqual(self.table['1.1.4.192.0.2.1']['ipNetToPhysicalType'].snmp_type, 'INTEGER')
+
+    def test_counter64(self):
+        table = snmpresult_to_table([SnmpVariable('ifHCInOctets', '1', u'18446744073709551615', 'COUNTER64'),
+                                     SnmpVariable('ifHCInOctets', '2', u'1', 'COUNTER64')])
+        self.assertEqual(table.column('ifHCInOctets', long), [18446744073709551615L, 1L])
+        self.assertEqual(table.get('1', 'ifHCInOctets', long), 18446744073709551615L)
+
+
+if __name__ == '__main__':
+    unittest.main()
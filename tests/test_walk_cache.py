@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+# @descr    Tests of the walk cache shared between check processes
+#
+# @author   Johan Hedberg <jh@citynetwork.se>
+#
+
+import fcntl
+import os
+import shutil
+import sys
+import unittest
+from tempfile import mkdtemp
+from time import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import cnh_nm  # noqa
+from lib.snmp_engine import SnmpVariable  # noqa
+from lib.snmp_replay import ReplaySession, SnmpFixture  # noqa
+
+
+# Replays the fixture, counting the walks that reach the device
+class CountingSession(ReplaySession):
+
+    def __init__(self, fixture, hostname):
+        super(CountingSession, self).__init__(fixture, hostname)
+        self.walks = 0
+
+    def bulkwalk(self, oids, max_repetitions=10):
+        self.walks += 1
+        return super(CountingSession, self).bulkwalk(oids, max_repetitions)
+
+
+class WalkCacheTest(unittest.TestCase):
+    oids = ['IF-MIB::ifDescr', 'IF-MIB::ifAlias']
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.saved = dict((name, getattr(cnh_nm, name)) for name in (
+            'walk_cache_dir', 'snmp_bulk_profiles_dir', 'snmp_limits_dir', 'snmp_limits_file',
+            'snmp_timeout', 'snmp_retries', 'snmp_deadline'))
+        cnh_nm.walk_cache_dir = os.path.join(self.tmpdir, 'cache')
+        cnh_nm.snmp_bulk_profiles_dir = os.path.join(self.tmpdir, 'profiles')
+        cnh_nm.snmp_limits_dir = os.path.join(self.tmpdir, 'limits')
+        cnh_nm.snmp_limits_file = os.path.join(self.tmpdir, 'limits.ini')
+        cnh_nm.snmp_deadline = None
+        fixture = SnmpFixture(os.path.join(self.tmpdir, 'fixture.json'))
+        fixture.record_walk('router1', '', ['IF-MIB::ifDescr'],
+                            [SnmpVariable('ifDescr', str(index), "Ethernet{}".format(index), 'OCTETSTR') for index in xrange(1, 4)])
+        fixture.record_walk('router1', '', ['IF-MIB::ifAlias'],
+                            [SnmpVariable('ifAlias', str(index), "uplink{}".format(index), 'OCTETSTR') for index in xrange(1, 4)])
+        self.session = CountingSession(fixture, 'router1')
+        self.key = ('router1', 2, 'credentials', '', sorted(self.oids), False)
+
+    def tearDown(self):
+        for name, value in self.saved.iteritems():
+            setattr(cnh_nm, name, value)
+        shutil.rmtree(self.tmpdir)
+
+    def cache_path(self):
+        return os.path.join(cnh_nm.walk_cache_dir, cnh_nm.sha1(repr(self.key)).hexdigest())
+
+    def walk(self, cache_ttl=60):
+        return [(var.oid, var.oid_index, var.value) for var in cnh_nm.snmp_walk_cached(self.session, self.key, self.oids, cache_ttl)]
+
+    def test_served_from_cache(self):
+        first = self.walk()
+        self.assertEqual(first[0], ('ifDescr', '1', 'Ethernet1'))
+        self.assertEqual(first[-1], ('ifAlias', '3', 'uplink3'))
+        self.assertEqual(self.walk(), first)
+        self.assertEqual(self.session.walks, 2)  # One per OID, filling the cache
+
+    def test_expired(self):
+        self.walk()
+        old = time() - 120
+        os.utime(self.cache_path(), (old, old))
+        self.walk()
+        self.assertEqual(self.session.walks, 4)
+
+    def test_disabled(self):
+        self.walk(cache_ttl=0)
+        self.walk(cache_ttl=0)
+        self.assertFalse(os.path.exists(self.cache_path()))
+
+    def test_atomic_write(self):
+        self.walk()
+        path = self.cache_path()
+        with open(path, 'r') as reader:
+            cnh_nm.walk_cache_write(path, {'IF-MIB::ifDescr': [], 'IF-MIB::ifAlias': []})
+            self.assertIn('Ethernet1', reader.read())  # Still the entry as it was opened
+        self.assertEqual(cnh_nm.walk_cache_read(path, 60, self.oids), [])
+        self.assertEqual(sorted(os.listdir(cnh_nm.walk_cache_dir)), sorted([os.path.basename(path), os.path.basename(path) + '.lock']))
+
+    def test_unwritable_cache(self):
+        path = os.path.join(self.tmpdir, 'missing', 'entry')
+        cnh_nm.walk_cache_write(path, {'IF-MIB::ifDescr': []})
+        self.assertFalse(os.path.exists(os.path.dirname(path)))
+
+    def test_older_format(self):
+        self.walk()
+        self.assertIsNone(cnh_nm.walk_cache_read(self.cache_path(), 60, ['IF-MIB::ifName']))
+
+    # Another process filling the entry holds the lock past the time of a request,
+    # the walk is then done uncached
+    def test_bounded_lock_wait(self):
+        cnh_nm.snmp_timeout = 0.1
+        cnh_nm.snmp_retries = 1
+        os.makedirs(cnh_nm.walk_cache_dir)
+        with open(self.cache_path() + '.lock', 'a') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            start = time()
+            result = self.walk()
+            elapsed = time() - start
+        self.assertEqual(len(result), 6)
+        self.assertGreaterEqual(elapsed, 0.2)
+        self.assertLess(elapsed, 1.0)
+        self.assertFalse(os.path.exists(self.cache_path()))
+
+    def test_lock_wait_bounded_by_deadline(self):
+        cnh_nm.snmp_timeout = 5.0
+        cnh_nm.snmp_retries = 3
+        cnh_nm.snmp_deadline = time() + 0.5
+        os.makedirs(cnh_nm.walk_cache_dir)
+        with open(self.cache_path() + '.lock', 'a') as lockfile, open(self.cache_path() + '.lock', 'a') as waiting:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            start = time()
+            self.assertFalse(cnh_nm.walk_cache_lock(waiting))
+            elapsed = time() - start
+        self.assertLess(elapsed, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()